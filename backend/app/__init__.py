@@ -15,6 +15,35 @@ app.config['AUDIO_FOLDER'] = os.path.join(os.path.dirname(os.path.dirname(os.pat
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['AUDIO_FOLDER'], exist_ok=True)
 
+# 后台音频生成任务配置
+app.config['AUDIO_JOB_WORKERS'] = int(os.getenv('AUDIO_JOB_WORKERS', '2'))  # 同时生成的任务数
+app.config['AUDIO_JOB_MAX_PENDING'] = int(os.getenv('AUDIO_JOB_MAX_PENDING', '16'))  # 最多排队任务数
+app.config['TTS_CHUNK_CONCURRENCY'] = int(os.getenv('TTS_CHUNK_CONCURRENCY', '4'))  # 单章节分段并发API调用数
+app.config['TTS_CHAPTER_CONCURRENCY'] = int(os.getenv('TTS_CHAPTER_CONCURRENCY', '2'))  # 整本生成时并发章节数
+# 进程内TTS限流（TTS_MAX_CONCURRENCY、TTS_RATE_PER_SECOND 等）直接读取环境变量，章节级与分段级共享
+
+# 文档解析进程池配置（上传后在后台提取文本与分割章节）
+app.config['INGEST_WORKERS'] = int(os.getenv('INGEST_WORKERS', '2'))  # 解析进程数
+app.config['INGEST_MAX_PENDING'] = int(os.getenv('INGEST_MAX_PENDING', '32'))  # 最多排队解析任务数
+app.config['PDF_WORKERS'] = int(os.getenv('PDF_WORKERS', '4'))  # 单个PDF按页并行提取的进程数（1为串行）
+
+# 任务进度存储配置：memory（默认，进程内）或 sqlite（重启后保留，可跨进程读取）
+app.config['PROGRESS_STORE'] = os.getenv('PROGRESS_STORE', 'memory')
+app.config['PROGRESS_DB_PATH'] = os.getenv('PROGRESS_DB_PATH') or os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'progress.db')
+app.config['PROGRESS_TTL_SECONDS'] = int(os.getenv('PROGRESS_TTL_SECONDS', '3600'))  # 已结束任务的保留时间
+app.config['SSE_HEARTBEAT_SECONDS'] = float(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))  # 进度推送无新事件时的心跳间隔
+
+# 音频合并模式：file 生成完整文件，virtual 只写入合并清单（下载时按字节范围读取章节文件）
+app.config['MERGE_MODE'] = os.getenv('MERGE_MODE', 'file')
+
+# 文档目录（文档历史与音频文件列表的SQLite索引）
+app.config['CATALOG_DB_PATH'] = os.getenv('CATALOG_DB_PATH') or os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'catalog.db')
+
+# TTS结果缓存配置
+app.config['TTS_CACHE_ENABLED'] = os.getenv('TTS_CACHE_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+app.config['TTS_CACHE_FOLDER'] = os.getenv('TTS_CACHE_FOLDER') or os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'cache', 'tts')
+app.config['TTS_CACHE_MAX_BYTES'] = int(os.getenv('TTS_CACHE_MAX_MB', '2048')) * 1024 * 1024
+
 # 注册路由蓝图
 from app.routes import register_blueprints
 register_blueprints(app)
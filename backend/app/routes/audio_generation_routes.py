@@ -5,7 +5,9 @@
 """
 
 from flask import Blueprint, request, jsonify
-from app.services.audio_service import AudioService
+from app.services.audio_service import AudioService, DocumentNotFoundError
+from app.services.job_runner import JobQueueFullError
+from app.services.ingestion import DocumentIngestingError
 
 audio_generation_bp = Blueprint('audio_generation', __name__)
 
@@ -28,15 +30,21 @@ def generate_audio():
         file_id = data.get('file_id')
         chapter_index = data.get('chapter_index', -1)  # -1表示生成全部
         voice_settings = data.get('voice_settings', {})
+        mode = data.get('mode', 'all')  # 'missing_or_stale' 表示只生成缺失或已变化的章节
         
         service = get_audio_service()
-        audio_files = service.generate_audio_simple(file_id, chapter_index, voice_settings)
+        audio_files = service.generate_audio_simple(file_id, chapter_index, voice_settings, mode)
         
         return jsonify({
             'file_id': file_id,
-            'audio_files': audio_files
+            'audio_files': audio_files,
+            'skipped_count': sum(1 for audio_file in audio_files if audio_file.get('skipped'))
         })
     
+    except DocumentIngestingError as e:
+        return jsonify({'error': str(e)}), 409
+    except DocumentNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -48,15 +56,24 @@ def generate_audio_with_progress():
         file_id = data.get('file_id')
         chapter_index = data.get('chapter_index', -1)  # -1表示生成全部
         voice_settings = data.get('voice_settings', {})
+        mode = data.get('mode', 'all')  # 'missing_or_stale' 表示只生成缺失或已变化的章节
         
         service = get_audio_service()
-        task_id = service.generate_audio_with_progress(file_id, chapter_index, voice_settings)
+        task_id = service.generate_audio_with_progress(file_id, chapter_index, voice_settings, mode)
         
+        # 任务已提交到后台执行，通过 /progress/<task_id> 查询进度
         return jsonify({
             'task_id': task_id,
-            'file_id': file_id
-        })
+            'file_id': file_id,
+            'status': 'queued'
+        }), 202
     
+    except DocumentIngestingError as e:
+        return jsonify({'error': str(e)}), 409
+    except DocumentNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except JobQueueFullError as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -5,9 +5,11 @@
 """
 
 import os
-import json
 from flask import Blueprint, request, jsonify, send_from_directory
 from app.services.audio_service import AudioService
+from app.services.document_catalog import get_document_catalog, parse_query_args, query_documents
+from app.services.job_runner import JobQueueFullError
+from app.services.virtual_audio import VirtualMergeStaleError, send_virtual_audio
 
 audio_management_bp = Blueprint('audio_management', __name__)
 
@@ -24,89 +26,33 @@ def get_audio_service():
 
 @audio_management_bp.route('/audio-files')
 def get_all_audio_files():
-    """获取所有音频文件列表"""
+    """获取所有音频文件列表（只包含已有音频的文档，支持 page、page_size、sort、order、q 参数，总数见 X-Total-Count）"""
     try:
         from app import app
-        upload_folder = app.config['UPLOAD_FOLDER']
-        audio_folder = app.config['AUDIO_FOLDER']
+        try:
+            query = parse_query_args(request.args, default_sort='created_at')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        # 只返回有音频文件的文档
+        query['has_audio'] = True
         
-        audio_files = []
+        rows, total = query_documents(get_document_catalog(app), query)
+        audio_files = [
+            {
+                'file_id': row['file_id'],
+                'original_name': row['original_name'],
+                'status': 'completed',
+                'chapter_count': row['chapter_count'],
+                'audio_count': row['audio_count'],
+                'total_size': row['audio_bytes'],
+                'created_at': row['upload_time']
+            }
+            for row in rows
+        ]
         
-        if os.path.exists(upload_folder):
-            # 扫描所有文档文件夹
-            for file_id in os.listdir(upload_folder):
-                folder_path = os.path.join(upload_folder, file_id)
-                if not os.path.isdir(folder_path):
-                    continue
-                    
-                meta_file = os.path.join(folder_path, f"{file_id}.meta")
-                if not os.path.exists(meta_file):
-                    continue
-                    
-                # 读取原始文件名
-                try:
-                    with open(meta_file, 'r', encoding='utf-8') as f:
-                        original_filename = f.read().strip()
-                except:
-                    original_filename = "未知文件"
-                
-                # 获取文件大小和上传时间
-                original_file_path = None
-                file_size = 0
-                upload_time = 0
-                for file in os.listdir(folder_path):
-                    if file.startswith(file_id) and '.' in file and not file.endswith('.meta') and not file.endswith('_chapters.json'):
-                        original_file_path = os.path.join(folder_path, file)
-                        break
-                
-                if original_file_path and os.path.exists(original_file_path):
-                    file_size = os.path.getsize(original_file_path)
-                    upload_time = os.path.getmtime(original_file_path)
-                
-                # 获取章节信息
-                chapters_file = os.path.join(folder_path, f"{file_id}_chapters.json")
-                chapter_count = 0
-                if os.path.exists(chapters_file):
-                    try:
-                        with open(chapters_file, 'r', encoding='utf-8') as f:
-                            chapters_data = json.load(f)
-                            chapter_count = len(chapters_data['chapters'])
-                    except:
-                        pass
-                
-                # 获取音频文件信息
-                audio_count = 0
-                total_size = 0
-                status = 'pending'
-                audio_subdir = os.path.join(audio_folder, file_id)
-                
-                if os.path.isdir(audio_subdir):
-                    for audio_file in os.listdir(audio_subdir):
-                        if audio_file.endswith('.wav'):
-                            audio_count += 1
-                            audio_file_path = os.path.join(audio_subdir, audio_file)
-                            if os.path.exists(audio_file_path):
-                                total_size += os.path.getsize(audio_file_path)
-                    
-                    if audio_count > 0:
-                        status = 'completed'
-                
-                # 只返回有音频文件的文档
-                if audio_count > 0:
-                    audio_files.append({
-                        'file_id': file_id,
-                        'original_name': original_filename,
-                        'status': status,
-                        'chapter_count': chapter_count,
-                        'audio_count': audio_count,
-                        'total_size': total_size,
-                        'created_at': upload_time
-                    })
-        
-        # 按创建时间倒序排列
-        audio_files.sort(key=lambda x: x['created_at'], reverse=True)
-        
-        return jsonify(audio_files)
+        response = jsonify(audio_files)
+        response.headers['X-Total-Count'] = str(total)
+        return response
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -168,9 +114,19 @@ def check_audio_status(file_id):
 
 @audio_management_bp.route('/download/<file_id>/<filename>')
 def download_audio(file_id, filename):
-    """下载音频文件"""
+    """下载音频文件（虚拟合并音频支持 Range 请求）"""
     service = get_audio_service()
     audio_folder = service.get_audio_folder_for_file(file_id)
+    
+    try:
+        virtual_wav = service.get_virtual_merge(file_id, filename)
+        if virtual_wav:
+            return send_virtual_audio(virtual_wav, request.range, filename)
+    except VirtualMergeStaleError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
     return send_from_directory(audio_folder, filename)
 
 @audio_management_bp.route('/merge-audio/<file_id>', methods=['GET', 'POST'])
@@ -182,12 +138,14 @@ def merge_audio_files(file_id):
         # 支持POST请求传递选中章节参数
         selected_chapters = None
         selected_audio_versions = None
+        mode = request.args.get('mode')  # 'virtual' 表示只写入合并清单
         if request.method == 'POST':
             data = request.json or {}
             selected_chapters = data.get('selected_chapters')
             selected_audio_versions = data.get('selected_audio_versions')
+            mode = data.get('mode', mode)
         
-        result = service.merge_audio_files(file_id, selected_chapters, selected_audio_versions)
+        result = service.merge_audio_files(file_id, selected_chapters, selected_audio_versions, mode)
         return jsonify(result)
         
     except Exception as e:
@@ -207,9 +165,35 @@ def download_complete_audio(file_id):
             # 使用实际存在的最新合并文件名返回
             import os
             merged_filename = os.path.basename(merged_path)
+            virtual_wav = service.get_virtual_merge(file_id, merged_filename)
+            if virtual_wav:
+                return send_virtual_audio(virtual_wav, request.range, merged_filename, as_attachment=True)
             return send_from_directory(audio_folder, merged_filename, as_attachment=True)
         else:
             return jsonify({'error': '未找到合并文件，请先使用“合并选中章节”生成'}), 404
         
+    except VirtualMergeStaleError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@audio_management_bp.route('/audio-maintenance/merge-segments', methods=['POST'])
+def merge_segmented_audio():
+    """合并旧版本遗留的分段音频文件（后台执行，通过 /progress/<task_id> 查询进度）"""
+    try:
+        data = request.json or {}
+        file_id = data.get('file_id')  # 为空表示处理所有文档
+        
+        service = get_audio_service()
+        task_id = service.reconcile_segmented_audio(file_id)
+        
+        return jsonify({
+            'task_id': task_id,
+            'file_id': file_id,
+            'status': 'queued'
+        }), 202
+    
+    except JobQueueFullError as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -3,8 +3,12 @@
 音频生成相关路由
 """
 
-from flask import Blueprint, request, jsonify, send_from_directory
-from app.services.audio_service import AudioService
+import json
+from flask import Blueprint, Response, current_app, request, jsonify, send_from_directory
+from app.services.audio_service import AudioService, DocumentNotFoundError
+from app.services.virtual_audio import VirtualMergeStaleError, send_virtual_audio
+from app.services.job_runner import JobQueueFullError
+from app.services.ingestion import DocumentIngestingError
 
 audio_bp = Blueprint('audio', __name__)
 
@@ -27,15 +31,21 @@ def generate_audio():
         file_id = data.get('file_id')
         chapter_index = data.get('chapter_index', -1)  # -1表示生成全部
         voice_settings = data.get('voice_settings', {})
+        mode = data.get('mode', 'all')  # 'missing_or_stale' 表示只生成缺失或已变化的章节
         
         service = get_audio_service()
-        audio_files = service.generate_audio_simple(file_id, chapter_index, voice_settings)
+        audio_files = service.generate_audio_simple(file_id, chapter_index, voice_settings, mode)
         
         return jsonify({
             'file_id': file_id,
-            'audio_files': audio_files
+            'audio_files': audio_files,
+            'skipped_count': sum(1 for audio_file in audio_files if audio_file.get('skipped'))
         })
     
+    except DocumentIngestingError as e:
+        return jsonify({'error': str(e)}), 409
+    except DocumentNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -47,15 +57,24 @@ def generate_audio_with_progress():
         file_id = data.get('file_id')
         chapter_index = data.get('chapter_index', -1)  # -1表示生成全部
         voice_settings = data.get('voice_settings', {})
+        mode = data.get('mode', 'all')  # 'missing_or_stale' 表示只生成缺失或已变化的章节
         
         service = get_audio_service()
-        task_id = service.generate_audio_with_progress(file_id, chapter_index, voice_settings)
+        task_id = service.generate_audio_with_progress(file_id, chapter_index, voice_settings, mode)
         
+        # 任务已提交到后台执行，通过 /progress/<task_id> 查询进度
         return jsonify({
             'task_id': task_id,
-            'file_id': file_id
-        })
+            'file_id': file_id,
+            'status': 'queued'
+        }), 202
     
+    except DocumentIngestingError as e:
+        return jsonify({'error': str(e)}), 409
+    except DocumentNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except JobQueueFullError as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -70,11 +89,52 @@ def get_progress(task_id):
     else:
         return jsonify({'error': '任务不存在'}), 404
 
+@audio_bp.route('/progress-stream/<task_id>')
+def stream_progress(task_id):
+    """以 Server-Sent Events 推送进度（支持 Last-Event-ID 断线续传）
+    
+    事件类型：snapshot（当前状态快照）、progress、chunk（分段完成）、
+    chapter（章节完成）、completed、failed
+    """
+    service = get_audio_service()
+    if service.get_progress(task_id) is None:
+        return jsonify({'error': '任务不存在'}), 404
+    
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id', 0))
+    except ValueError:
+        last_event_id = 0
+    heartbeat_seconds = current_app.config.get('SSE_HEARTBEAT_SECONDS', 15)
+    
+    def generate():
+        yield 'retry: 3000\n\n'
+        for event in service.iter_progress_events(task_id, last_event_id, heartbeat_seconds):
+            if event is None:
+                yield ': heartbeat\n\n'
+                continue
+            data = json.dumps(event['data'], ensure_ascii=False)
+            yield f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @audio_bp.route('/download/<file_id>/<filename>')
 def download_audio(file_id, filename):
-    """下载音频文件"""
+    """下载音频文件（虚拟合并音频支持 Range 请求）"""
     service = get_audio_service()
     audio_folder = service.get_audio_folder_for_file(file_id)
+    
+    try:
+        virtual_wav = service.get_virtual_merge(file_id, filename)
+        if virtual_wav:
+            return send_virtual_audio(virtual_wav, request.range, filename)
+    except VirtualMergeStaleError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
     return send_from_directory(audio_folder, filename)
 
 @audio_bp.route('/audio-files/<file_id>')
@@ -107,11 +167,13 @@ def merge_audio_files(file_id):
         
         # 支持POST请求传递选中章节参数
         selected_chapters = None
+        mode = request.args.get('mode')  # 'virtual' 表示只写入合并清单
         if request.method == 'POST':
             data = request.json or {}
             selected_chapters = data.get('selected_chapters')
+            mode = data.get('mode', mode)
         
-        result = service.merge_audio_files(file_id, selected_chapters)
+        result = service.merge_audio_files(file_id, selected_chapters, mode=mode)
         return jsonify(result)
         
     except Exception as e:
@@ -131,9 +193,62 @@ def download_complete_audio(file_id):
             # 使用实际存在的最新合并文件名返回
             import os
             merged_filename = os.path.basename(merged_path)
+            virtual_wav = service.get_virtual_merge(file_id, merged_filename)
+            if virtual_wav:
+                return send_virtual_audio(virtual_wav, request.range, merged_filename, as_attachment=True)
             return send_from_directory(audio_folder, merged_filename, as_attachment=True)
         else:
             return jsonify({'error': '未找到合并文件，请先使用“合并选中章节”生成'}), 404
         
+    except VirtualMergeStaleError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@audio_bp.route('/tts-cache', methods=['GET'])
+def get_tts_cache_stats():
+    """获取TTS缓存统计信息（命中/未命中次数、占用空间等）"""
+    try:
+        service = get_audio_service()
+        return jsonify(service.get_tts_cache_stats())
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@audio_bp.route('/tts-cache', methods=['DELETE'])
+def purge_tts_cache():
+    """清空TTS缓存"""
+    try:
+        service = get_audio_service()
+        return jsonify(service.purge_tts_cache())
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@audio_bp.route('/tts-cache/warm', methods=['POST'])
+def warm_tts_cache():
+    """预热TTS缓存（后台执行，通过 /progress/<task_id> 查询进度）"""
+    try:
+        data = request.json or {}
+        file_id = data.get('file_id')
+        chapter_index = data.get('chapter_index', -1)  # -1表示全部章节
+        voice_settings = data.get('voice_settings', {})
+        
+        if not file_id:
+            return jsonify({'error': '缺少文件ID'}), 400
+        
+        service = get_audio_service()
+        task_id = service.warm_tts_cache(file_id, chapter_index, voice_settings)
+        
+        return jsonify({
+            'task_id': task_id,
+            'file_id': file_id,
+            'status': 'queued'
+        }), 202
+    
+    except DocumentIngestingError as e:
+        return jsonify({'error': str(e)}), 409
+    except JobQueueFullError as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -4,218 +4,170 @@
 """
 
 import os
-import json
 from flask import Blueprint, request, jsonify
 
-from app.services.file_processor import FileProcessor
+from app.services.audio_service import AudioService
+from app.services.chapter_store import get_chapter_store
+from app.services.document_catalog import get_document_catalog, parse_query_args, query_documents
+from app.services.ingestion import DocumentIngestingError, get_ingestion_pipeline
 from app.utils.file_utils import delete_file_and_related_audio
 
 # 创建蓝图
 document_bp = Blueprint('document', __name__)
 
-# 初始化文件处理器
-file_processor = FileProcessor()
+# 全局音频服务实例
+audio_service = None
+
+def get_audio_service():
+    """获取音频服务实例"""
+    global audio_service
+    if audio_service is None:
+        from app import app
+        audio_service = AudioService(app)
+    return audio_service
 
 @document_bp.route('/document-history')
 def get_document_history():
-    """获取文档历史记录"""
+    """获取文档历史记录（查询文档目录，支持 page、page_size、sort、order、q、has_audio 参数）"""
     try:
-        documents = []
         from app import app
-        upload_folder = app.config['UPLOAD_FOLDER']
-        audio_folder = app.config['AUDIO_FOLDER']
+        try:
+            query = parse_query_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        if os.path.exists(upload_folder):
-            # 先扫描新结构：uploads/{file_id}/
-            for file_id in os.listdir(upload_folder):
-                folder_path = os.path.join(upload_folder, file_id)
-                if not os.path.isdir(folder_path):
-                    continue
-                meta_file = os.path.join(folder_path, f"{file_id}.meta")
-                if not os.path.exists(meta_file):
-                    continue
-                # 读取原始文件名
-                try:
-                    with open(meta_file, 'r', encoding='utf-8') as f:
-                        original_filename = f.read().strip()
-                except:
-                    original_filename = "未知文件"
-                # 原始文件与时间
-                original_file_path = None
-                for file in os.listdir(folder_path):
-                    if file.startswith(file_id) and '.' in file and not file.endswith('.meta') and not file.endswith('_chapters.json'):
-                        original_file_path = os.path.join(folder_path, file)
-                        break
-                file_size = 0
-                upload_time = 0
-                if original_file_path and os.path.exists(original_file_path):
-                    file_size = os.path.getsize(original_file_path)
-                    upload_time = os.path.getmtime(original_file_path)
-                # 章节统计
-                chapters_file = os.path.join(folder_path, f"{file_id}_chapters.json")
-                chapter_count = 0
-                if os.path.exists(chapters_file):
-                    try:
-                        with open(chapters_file, 'r', encoding='utf-8') as f:
-                            chapters_data = json.load(f)
-                            chapter_count = len(chapters_data['chapters'])
-                    except:
-                        pass
-                # 音频数量（新结构：audio/{file_id}/）
-                audio_count = 0
-                has_audio = False
-                audio_subdir = os.path.join(audio_folder, file_id)
-                if os.path.isdir(audio_subdir):
-                    for audio_file in os.listdir(audio_subdir):
-                        if audio_file.endswith('.wav'):
-                            audio_count += 1
-                            has_audio = True
-                documents.append({
-                    'file_id': file_id,
-                    'original_name': original_filename,
-                    'upload_time': upload_time,
-                    'file_size': file_size,
-                    'chapter_count': chapter_count,
-                    'audio_count': audio_count,
-                    'has_audio': has_audio
-                })
-
-            # 再扫描旧结构：.meta 在 uploads 根目录
-            for filename in os.listdir(upload_folder):
-                if filename.endswith('.meta'):
-                    file_id = filename.replace('.meta', '')
-                    # 若已在新结构中处理，跳过
-                    if os.path.isdir(os.path.join(upload_folder, file_id)):
-                        continue
-                    meta_file = os.path.join(upload_folder, filename)
-                    try:
-                        with open(meta_file, 'r', encoding='utf-8') as f:
-                            original_filename = f.read().strip()
-                    except:
-                        original_filename = "未知文件"
-                    original_file_path = None
-                    for file in os.listdir(upload_folder):
-                        if file.startswith(file_id) and '.' in file and not file.endswith('.meta') and not file.endswith('_chapters.json'):
-                            original_file_path = os.path.join(upload_folder, file)
-                            break
-                    file_size = 0
-                    upload_time = 0
-                    if original_file_path and os.path.exists(original_file_path):
-                        file_size = os.path.getsize(original_file_path)
-                        upload_time = os.path.getmtime(original_file_path)
-                    chapters_file = os.path.join(upload_folder, f"{file_id}_chapters.json")
-                    chapter_count = 0
-                    if os.path.exists(chapters_file):
-                        try:
-                            with open(chapters_file, 'r', encoding='utf-8') as f:
-                                chapters_data = json.load(f)
-                                chapter_count = len(chapters_data['chapters'])
-                        except:
-                            pass
-                    audio_count = 0
-                    has_audio = False
-                    audio_subdir = os.path.join(audio_folder, file_id)
-                    if os.path.isdir(audio_subdir):
-                        for audio_file in os.listdir(audio_subdir):
-                            if audio_file.endswith('.wav'):
-                                audio_count += 1
-                                has_audio = True
-                    else:
-                        for audio_file in os.listdir(audio_folder):
-                            if audio_file.startswith(file_id) and audio_file.endswith('.wav'):
-                                audio_count += 1
-                                has_audio = True
-                    documents.append({
-                        'file_id': file_id,
-                        'original_name': original_filename,
-                        'upload_time': upload_time,
-                        'file_size': file_size,
-                        'chapter_count': chapter_count,
-                        'audio_count': audio_count,
-                        'has_audio': has_audio
-                    })
+        rows, total = query_documents(get_document_catalog(app), query)
+        documents = [
+            {
+                'file_id': row['file_id'],
+                'original_name': row['original_name'],
+                'upload_time': row['upload_time'],
+                'file_size': row['file_size'],
+                'chapter_count': row['chapter_count'],
+                'audio_count': row['audio_count'],
+                'has_audio': row['audio_count'] > 0
+            }
+            for row in rows
+        ]
         
-        return jsonify({'documents': documents})
+        response = {'documents': documents, 'total': total}
+        if query['page'] is not None:
+            response['page'] = query['page']
+            response['page_size'] = query['page_size']
+        return jsonify(response)
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@document_bp.route('/document-history/rebuild', methods=['POST'])
+def rebuild_document_history():
+    """重新扫描上传与音频目录，重建文档目录（手动增删文件后使用）"""
+    try:
+        from app import app
+        count = get_document_catalog(app).rebuild()
+        return jsonify({'message': f'文档目录已重建，共 {count} 个文档', 'total': count})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @document_bp.route('/document-chapters/<file_id>')
 def get_document_chapters(file_id):
-    """获取文档的章节信息"""
+    """获取文档的章节信息（view=summary 时只返回章节摘要与音频状态，不含正文）"""
     try:
         from app import app
-        chapters_file_new = os.path.join(app.config['UPLOAD_FOLDER'], file_id, f"{file_id}_chapters.json")
-        chapters_file = chapters_file_new if os.path.exists(chapters_file_new) else os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}_chapters.json")
-        
-        if not os.path.exists(chapters_file):
+        get_ingestion_pipeline(app).ensure_ingested(file_id)
+        store = get_chapter_store(app)
+        info = store.get_info(file_id)
+        if info is None:
             return jsonify({'error': '章节数据不存在'}), 404
         
-        with open(chapters_file, 'r', encoding='utf-8') as f:
-            chapters_data = json.load(f)
+        if request.args.get('view') == 'summary':
+            info['chapters'] = get_audio_service().file_manager.add_audio_status(file_id, store.get_summaries(file_id))
+        else:
+            info['chapters'] = store.get_chapters(file_id)
+        return jsonify(info)
+    
+    except DocumentIngestingError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@document_bp.route('/document-chapters/<file_id>/<int:chapter_index>')
+def get_chapter_content(file_id, chapter_index):
+    """获取单个章节的正文，支持 offset、length 参数按字符分段读取"""
+    try:
+        from app import app
+        try:
+            offset = max(0, int(request.args.get('offset', 0)))
+            length = request.args.get('length')
+            length = max(0, int(length)) if length is not None else None
+        except ValueError:
+            return jsonify({'error': 'offset 与 length 必须为整数'}), 400
         
-        return jsonify(chapters_data)
+        get_ingestion_pipeline(app).ensure_ingested(file_id)
+        chapter = get_chapter_store(app).get_chapter(file_id, chapter_index)
+        if chapter is None:
+            return jsonify({'error': '章节不存在'}), 404
+        
+        content = chapter['content']
+        end = len(content) if length is None else min(len(content), offset + length)
+        part = content[offset:end]
+        return jsonify({
+            'file_id': file_id,
+            'chapter_index': chapter_index,
+            'title': chapter['title'],
+            'char_count': len(content),
+            'offset': offset,
+            'length': len(part),
+            'content': part,
+            'has_more': offset + len(part) < len(content)
+        })
     
+    except DocumentIngestingError as e:
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @document_bp.route('/load-document/<file_id>')
 def load_document(file_id):
-    """加载指定的文档"""
+    """加载指定的文档（读取上传时保存的章节数据，源文件变化时才重新解析）
+    
+    view=summary 时章节只包含序号、标题、字符数与音频状态；文档仍在解析时返回 409
+    """
     try:
         from app import app
         upload_folder = app.config['UPLOAD_FOLDER']
-        audio_folder = app.config['AUDIO_FOLDER']
+        service = get_audio_service()
+        get_ingestion_pipeline(app).ensure_ingested(file_id)
         
         # 查找对应的文件
-        file_path = None
-        original_filename = None
-        
-        # 新结构优先
-        new_dir = os.path.join(upload_folder, file_id)
-        if os.path.isdir(new_dir):
-            for filename in os.listdir(new_dir):
-                if filename.startswith(file_id) and '.' in filename and not filename.endswith('.meta') and not filename.endswith('_chapters.json'):
-                    file_path = os.path.join(new_dir, filename)
-                    original_filename = filename
-                    break
-        if not file_path:
-            for filename in os.listdir(upload_folder):
-                if filename.startswith(file_id) and '.' in filename and not filename.endswith('.meta'):
-                    file_path = os.path.join(upload_folder, filename)
-                    original_filename = filename
-                    break
-        
+        file_path = service.file_manager.get_file_path(file_id)
         if not file_path:
             return jsonify({'error': '文档不存在'}), 404
+        original_filename = os.path.basename(file_path)
         
-        # 解析文件内容
-        file_extension = file_path.rsplit('.', 1)[1].lower()
-        text_content = file_processor.extract_text(file_path, file_extension)
-        chapters = file_processor.split_chapters(text_content)
+        # view=summary 时只返回章节摘要，正文通过 /document-chapters/<file_id>/<chapter_index> 按需读取
+        if request.args.get('view') == 'summary':
+            chapters = service.file_manager.add_audio_status(
+                file_id, get_chapter_store(app).load_summaries(file_id, file_path)
+            )
+        else:
+            chapters = service.file_manager.load_chapters(file_id, file_path)
         
-        # 查找相关的音频文件
-        audio_files = []
-        if os.path.exists(audio_folder):
-            for audio_file in os.listdir(audio_folder):
-                if audio_file.startswith(file_id) and audio_file.endswith('.wav'):
-                    # 从文件名中提取章节信息
-                    if '_chapter_' in audio_file:
-                        try:
-                            chapter_part = audio_file.split('_chapter_')[1]
-                            chapter_index = int(chapter_part.split('.')[0]) - 1
-                            if chapter_index < len(chapters):
-                                audio_files.append({
-                                    'chapter_index': chapter_index,
-                                    'chapter_title': chapters[chapter_index]['title'],
-                                    'audio_file': audio_file
-                                })
-                        except (ValueError, IndexError):
-                            pass
+        # 查找相关的音频文件（每章最新的一个版本）
+        audio_files = [
+            {
+                'chapter_index': audio_file['chapter_index'],
+                'chapter_title': chapters[audio_file['chapter_index']]['title'],
+                'audio_file': audio_file['filename']
+            }
+            for audio_file in service.get_existing_audio_files(file_id)
+            if 0 <= audio_file['chapter_index'] < len(chapters)
+        ]
         
         # 尝试读取原始文件名
         display_name = original_filename
-        metadata_file_new = os.path.join(new_dir, f"{file_id}.meta")
+        metadata_file_new = os.path.join(upload_folder, file_id, f"{file_id}.meta")
         metadata_file = metadata_file_new if os.path.exists(metadata_file_new) else os.path.join(upload_folder, f"{file_id}.meta")
         if os.path.exists(metadata_file):
             try:
@@ -233,6 +185,8 @@ def load_document(file_id):
             'audio_files': audio_files
         })
     
+    except DocumentIngestingError as e:
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -253,6 +207,7 @@ def delete_file():
             app.config['UPLOAD_FOLDER'], 
             app.config['AUDIO_FOLDER']
         )
+        get_document_catalog(app).remove_document(file_id)
         
         if result['success']:
             return jsonify({
@@ -5,11 +5,12 @@
 
 import os
 import uuid
-import json
+import shutil
 from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
 
-from app.services.file_processor import FileProcessor
+from app.services.ingestion import get_ingestion_pipeline
+from app.services.job_runner import JobQueueFullError
 
 # 创建蓝图
 upload_bp = Blueprint('upload', __name__)
@@ -20,12 +21,9 @@ ALLOWED_EXTENSIONS = {'txt', 'pdf', 'epub', 'docx'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# 初始化文件处理器
-file_processor = FileProcessor()
-
 @upload_bp.route('/upload', methods=['POST'])
 def upload_file():
-    """上传文件接口"""
+    """上传文件接口（保存文件后提交后台解析，通过 /upload-status/<file_id> 查询解析结果）"""
     try:
         if 'file' not in request.files:
             return jsonify({'error': '没有文件被上传'}), 400
@@ -71,34 +69,33 @@ def upload_file():
         except Exception:
             pass  # 元数据保存失败不影响主要功能
         
-        # 解析文件内容
-        text_content = file_processor.extract_text(file_path, file_extension)
-        chapters = file_processor.split_chapters(text_content)
-        
-        # 保存章节数据到JSON文件
-        # 保存章节数据到子文件夹
-        chapters_file = os.path.join(file_upload_folder, f"{file_id}_chapters.json")
+        # 文本提取与章节分割在解析进程池中执行，接口立即返回
         try:
-            with open(chapters_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'file_id': file_id,
-                    'original_filename': original_filename,
-                    'file_extension': file_extension,
-                    'total_text_length': len(text_content),
-                    'chapters': chapters
-                }, f, ensure_ascii=False, indent=2)
-        except Exception:
-            pass  # 章节数据保存失败不影响主要功能
+            task_id = get_ingestion_pipeline(app).submit(file_id, file_path, original_filename, file_extension)
+        except JobQueueFullError as e:
+            shutil.rmtree(file_upload_folder, ignore_errors=True)
+            return jsonify({'error': str(e)}), 503
         
         return jsonify({
             'file_id': file_id,
             'filename': original_filename,
-            'chapters': chapters,
-            'total_chapters': len(chapters),
-            'text_extraction_success': True,
-            'total_text_length': len(text_content),
-            'message': f'文档上传成功！成功提取 {len(text_content)} 字符文本，分为 {len(chapters)} 个章节。'
-        })
+            'task_id': task_id,
+            'status': 'processing',
+            'message': '文件已上传，正在解析文档...'
+        }), 202
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@upload_bp.route('/upload-status/<file_id>')
+def get_upload_status(file_id):
+    """查询文档解析状态（status 为 completed 后可通过 /load-document 读取章节）"""
+    try:
+        from app import app
+        status = get_ingestion_pipeline(app).get_status(file_id)
+        if status is None:
+            return jsonify({'error': '文档不存在'}), 404
+        return jsonify(status)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+章节标题匹配基准测试
+对比逐行依次尝试六个未编译正则（旧实现）与预编译合并正则（match_chapter_heading）的耗时，
+并校验两者识别出的标题完全一致
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+from collections import Counter
+from pathlib import Path
+
+# 添加backend目录到Python路径，以便导入服务端的章节分割实现
+backend_path = Path(__file__).parent.parent.parent
+if str(backend_path) not in sys.path:
+    sys.path.insert(0, str(backend_path))
+
+from app.services.file_processor import match_chapter_heading
+
+# 旧实现：每行依次调用 re.match 尝试六个模式
+LEGACY_CHAPTER_PATTERNS = [
+    r'^第[一二三四五六七八九十\d]+章\s*[^\n]*',
+    r'^Chapter\s*\d+\s*[^\n]*',
+    r'^第[一二三四五六七八九十\d]+节\s*[^\n]*',
+    r'^Section\s*\d+\s*[^\n]*',
+    r'^\d+\.\s*[^\n]*',
+    r'^[一二三四五六七八九十\d]+、\s*[^\n]*'
+]
+
+def legacy_is_heading(line: str) -> bool:
+    """旧实现的标题判断"""
+    for pattern in LEGACY_CHAPTER_PATTERNS:
+        if re.match(pattern, line):
+            return True
+    return False
+
+def generate_novel_lines(chapter_count: int, lines_per_chapter: int, seed: int = 42) -> list:
+    """生成模拟网络小说的文本行（正文行占绝大多数，夹杂各种样式的标题与编号段落）"""
+    rng = random.Random(seed)
+    body_lines = [
+        '他抬起头，看向远处的山峰，心中涌起一股难以言喻的情绪。',
+        '“你真的决定了吗？”她轻声问道。',
+        '夜色渐深，城中的灯火一盏接一盏地熄灭。',
+        'The wind howled through the empty streets of the old town.',
+        '第二天一早，众人便收拾行装出发了。',
+        '2023年的那个冬天格外寒冷。',
+        '一切都要从三年前说起。'
+    ]
+    headings = ['第{n}章 风起云涌', 'Chapter {n} The Journey', '第{n}节 初入江湖', 'Section {n}', '{n}. 回忆', '{n}、序幕']
+    
+    lines = []
+    for n in range(1, chapter_count + 1):
+        lines.append(rng.choice(headings).format(n=n))
+        lines.extend(rng.choice(body_lines) for _ in range(lines_per_chapter))
+    return lines
+
+def read_lines(file_path: str) -> list:
+    """读取文本文件的所有非空行（去除首尾空白，与章节分割时一致）"""
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def time_matcher(lines: list, matcher, repeat: int) -> float:
+    """返回多次运行中最快一次的耗时（秒）"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            matcher(line)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run_benchmark(lines: list, repeat: int = 3):
+    """运行基准测试并打印结果"""
+    print(f"文本行数: {len(lines)}")
+    
+    # 校验两种实现的识别结果一致，并统计各标题样式的数量
+    styles = Counter()
+    for line in lines:
+        style = match_chapter_heading(line)
+        if (style is not None) != legacy_is_heading(line):
+            raise Exception(f"两种实现的识别结果不一致: {line}")
+        if style:
+            styles[style] += 1
+    print(f"识别出的标题: {sum(styles.values())}")
+    for style, count in styles.most_common():
+        print(f"  {style}: {count}")
+    
+    legacy_time = time_matcher(lines, legacy_is_heading, repeat)
+    compiled_time = time_matcher(lines, match_chapter_heading, repeat)
+    print()
+    print(f"旧实现（六个未编译正则）: {legacy_time:.3f} 秒")
+    print(f"预编译合并正则:           {compiled_time:.3f} 秒")
+    print(f"加速比: {legacy_time / compiled_time:.1f}x")
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='章节标题匹配基准测试')
+    parser.add_argument('text_file', nargs='?', help='用于测试的TXT文件（UTF-8），不指定时生成模拟小说')
+    parser.add_argument('--chapters', type=int, default=5000, help='模拟小说的章节数')
+    parser.add_argument('--lines-per-chapter', type=int, default=100, help='模拟小说每章的正文行数')
+    parser.add_argument('--repeat', type=int, default=3, help='重复次数（取最快一次）')
+    args = parser.parse_args()
+    
+    print("章节标题匹配基准测试")
+    print("=" * 50)
+    
+    if args.text_file:
+        if not os.path.exists(args.text_file):
+            print(f"错误: 文件不存在: {args.text_file}")
+            return
+        lines = read_lines(args.text_file)
+    else:
+        lines = generate_novel_lines(args.chapters, args.lines_per_chapter)
+    
+    run_benchmark(lines, args.repeat)
+
+if __name__ == "__main__":
+    main()
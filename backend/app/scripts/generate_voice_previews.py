@@ -5,10 +5,17 @@
 """
 
 import os
+import sys
 import requests
 import dashscope
 from pathlib import Path
-import time
+
+# 添加backend目录到Python路径，以便复用服务端的TTS限流器
+backend_path = Path(__file__).parent.parent.parent
+if str(backend_path) not in sys.path:
+    sys.path.insert(0, str(backend_path))
+
+from app.services.rate_limiter import get_tts_limiter
 
 def generate_voice_previews():
     """批量生成所有角色的预览音频"""
@@ -54,12 +61,14 @@ def generate_voice_previews():
         print(f"[{i}/{len(voices)}] 正在生成 {voice_name} ({voice_desc}) 的预览音频...")
         
         try:
-            # 调用QWEN-TTS API
-            response = dashscope.audio.qwen_tts.SpeechSynthesizer.call(
-                model="qwen-tts-latest",  # 使用最新版本支持所有音色
-                api_key=api_key,
-                text=preview_text,
-                voice=voice_name,
+            # 调用QWEN-TTS API（通过共享限流器，被限流时自动退避重试）
+            response = get_tts_limiter().call(
+                lambda: dashscope.audio.qwen_tts.SpeechSynthesizer.call(
+                    model="qwen-tts-latest",  # 使用最新版本支持所有音色
+                    api_key=api_key,
+                    text=preview_text,
+                    voice=voice_name,
+                )
             )
             
             if response.status_code == 200:
@@ -87,11 +96,6 @@ def generate_voice_previews():
         except Exception as e:
             print(f"❌ 生成 {voice_name} 音频失败：{str(e)}")
             failed_count += 1
-        
-        # 添加延迟避免API限制
-        if i < len(voices):
-            print("⏳ 等待2秒...")
-            time.sleep(2)
     
     print("-" * 50)
     print(f"🎉 批量生成完成！")
@@ -2,162 +2,164 @@
 """
 分段音频文件合并脚本
 用于处理已经生成的分段音频文件，将它们合并成完整的章节文件
+服务端的分段整理任务（/api/audio-maintenance/merge-segments）复用本脚本中的函数
 """
 
 import os
-import wave
 import sys
+import argparse
 from pathlib import Path
+from typing import Dict, List, Tuple
 
-def merge_segmented_files(audio_folder: str):
-    """合并指定文件夹中的分段音频文件"""
-    try:
-        print(f"正在处理文件夹: {audio_folder}")
-        
-        if not os.path.exists(audio_folder):
-            print(f"错误: 文件夹不存在: {audio_folder}")
-            return
-        
-        # 查找所有分段文件
-        segmented_groups = {}
-        
-        for filename in os.listdir(audio_folder):
-            if filename.endswith('.wav') and '_part_' in filename:
-                # 解析分段文件名，例如：chapter_57__Serena__20250902_120136.wav_part_1.wav
-                base_name = filename.replace('.wav', '')  # 移除.wav后缀
-                if '_part_' in base_name:
-                    # 分割基础名称和部分编号
-                    parts = base_name.split('_part_')
-                    if len(parts) == 2:
-                        base_chapter_name = parts[0]  # chapter_57__Serena__20250902_120136
-                        part_num = int(parts[1])      # 1, 2, 3, 4...
-                        
-                        if base_chapter_name not in segmented_groups:
-                            segmented_groups[base_chapter_name] = {}
-                        
-                        segmented_groups[base_chapter_name][part_num] = filename
-        
-        if not segmented_groups:
-            print("没有找到分段文件")
-            return
-        
-        print(f"找到 {len(segmented_groups)} 个分段组:")
-        for base_name, parts in segmented_groups.items():
-            print(f"  {base_name}: {len(parts)} 个部分")
+# 添加backend目录到Python路径，以便复用服务端的WAV合并与音频索引
+backend_path = Path(__file__).parent.parent.parent
+if str(backend_path) not in sys.path:
+    sys.path.insert(0, str(backend_path))
+
+from app.utils.wav_utils import concatenate_wav_files
+
+def find_segment_groups(audio_folder: str) -> Dict[str, List[Tuple[int, str]]]:
+    """查找分段文件并按章节分组（章节基础名 -> 按编号排序的 (编号, 文件名) 列表）"""
+    segmented_groups = {}
+    
+    for filename in os.listdir(audio_folder):
+        if filename.endswith('.wav') and '_part_' in filename:
+            # 解析分段文件名，例如：chapter_57__Serena__20250902_120136.wav_part_1.wav
+            base_name = filename.replace('.wav', '')  # 移除.wav后缀
+            if '_part_' in base_name:
+                # 分割基础名称和部分编号
+                parts = base_name.split('_part_')
+                if len(parts) == 2:
+                    try:
+                        part_num = int(parts[1])  # 1, 2, 3, 4...
+                    except ValueError:
+                        continue
+                    base_chapter_name = parts[0]  # chapter_57__Serena__20250902_120136
+                    segmented_groups.setdefault(base_chapter_name, {})[part_num] = filename
+    
+    return {base_name: sorted(parts.items()) for base_name, parts in segmented_groups.items()}
+
+def merge_segmented_files(audio_folder: str, verbose: bool = True) -> Dict:
+    """合并指定文件夹中的分段音频文件，返回处理结果
+    
+    Returns:
+        {'merged': 新合并的章节文件名列表, 'skipped': 已存在合并文件的章节数,
+         'incomplete': 缺少分段的章节数, 'failed': 合并失败的章节数}
+    """
+    summary = {'merged': [], 'skipped': 0, 'incomplete': 0, 'failed': 0}
+    
+    def log(message: str):
+        if verbose:
+            print(message)
+    
+    log(f"正在处理文件夹: {audio_folder}")
+    if not os.path.exists(audio_folder):
+        log(f"错误: 文件夹不存在: {audio_folder}")
+        return summary
+    
+    segmented_groups = find_segment_groups(audio_folder)
+    if not segmented_groups:
+        log("没有找到分段文件")
+        return summary
+    
+    log(f"找到 {len(segmented_groups)} 个分段组:")
+    for base_name, sorted_parts in segmented_groups.items():
+        log(f"  {base_name}: {len(sorted_parts)} 个部分")
+    
+    # 处理每个分段组
+    for base_name, sorted_parts in segmented_groups.items():
+        if len(sorted_parts) < 2:  # 至少需要2个部分才需要合并
+            continue
         
-        # 处理每个分段组
-        success_count = 0
-        for base_name, parts in segmented_groups.items():
-            if len(parts) > 1:  # 至少需要2个部分才需要合并
-                # 按部分编号排序
-                sorted_parts = sorted(parts.items())
-                
-                # 检查是否所有部分都存在
-                expected_parts = list(range(1, len(parts) + 1))
-                actual_parts = [p[0] for p in sorted_parts]
-                
-                if actual_parts == expected_parts:
-                    # 所有部分都存在，可以合并
-                    if merge_chapter_segments(audio_folder, base_name, sorted_parts):
-                        success_count += 1
-                else:
-                    print(f"警告: {base_name} 缺少部分，期望 {expected_parts}，实际 {actual_parts}")
+        # 检查是否所有部分都存在
+        expected_parts = list(range(1, len(sorted_parts) + 1))
+        actual_parts = [p[0] for p in sorted_parts]
+        if actual_parts != expected_parts:
+            log(f"警告: {base_name} 缺少部分，期望 {expected_parts}，实际 {actual_parts}")
+            summary['incomplete'] += 1
+            continue
         
-        print(f"\n合并完成！成功合并 {success_count} 个章节")
+        if os.path.exists(os.path.join(audio_folder, f"{base_name}.wav")):
+            log(f"跳过 {base_name}: 合并文件已存在")
+            summary['skipped'] += 1
+            continue
         
-    except Exception as e:
-        print(f"处理分段文件时出错: {str(e)}")
+        if merge_chapter_segments(audio_folder, base_name, sorted_parts, verbose):
+            summary['merged'].append(f"{base_name}.wav")
+        else:
+            summary['failed'] += 1
+    
+    log(f"\n合并完成！成功合并 {len(summary['merged'])} 个章节")
+    return summary
 
-def merge_chapter_segments(audio_folder: str, base_name: str, sorted_parts: list):
-    """合并单个章节的分段文件"""
+def merge_chapter_segments(audio_folder: str, base_name: str, sorted_parts: list, verbose: bool = True) -> bool:
+    """合并单个章节的分段文件（流式复制PCM数据，失败时不会留下不完整的文件）"""
+    merged_filename = f"{base_name}.wav"
+    merged_filepath = os.path.join(audio_folder, merged_filename)
+    
     try:
-        # 生成合并后的文件名
-        merged_filename = f"{base_name}.wav"
-        merged_filepath = os.path.join(audio_folder, merged_filename)
+        if verbose:
+            print(f"正在合并分段文件: {base_name}")
         
-        # 如果合并文件已存在，跳过
-        if os.path.exists(merged_filepath):
-            print(f"跳过 {base_name}: 合并文件已存在")
-            return True
+        merged_info = concatenate_wav_files(
+            [os.path.join(audio_folder, part_filename) for _, part_filename in sorted_parts],
+            merged_filepath
+        )
         
-        print(f"正在合并分段文件: {base_name}")
-        
-        # 使用wave模块合并WAV文件
-        with wave.open(merged_filepath, 'wb') as output_wav:
-            # 读取第一个分段文件获取参数
-            first_part_path = os.path.join(audio_folder, sorted_parts[0][1])
-            with wave.open(first_part_path, 'rb') as first_wav:
-                channels = first_wav.getnchannels()
-                sample_width = first_wav.getsampwidth()
-                frame_rate = first_wav.getframerate()
-                comp_type = first_wav.getcomptype()
-                comp_name = first_wav.getcompname()
-            
-            # 设置输出文件参数
-            output_wav.setnchannels(channels)
-            output_wav.setsampwidth(sample_width)
-            output_wav.setframerate(frame_rate)
-            output_wav.setcomptype(comp_type, comp_name)
-            
-            # 依次读取并写入每个分段
-            total_frames = 0
-            for part_num, part_filename in sorted_parts:
-                part_filepath = os.path.join(audio_folder, part_filename)
-                with wave.open(part_filepath, 'rb') as input_wav:
-                    # 验证音频参数是否一致
-                    if (input_wav.getnchannels() != channels or 
-                        input_wav.getsampwidth() != sample_width or 
-                        input_wav.getframerate() != frame_rate or 
-                        input_wav.getcomptype() != comp_type):
-                        print(f"警告: 分段文件 {part_filename} 的音频参数不一致，跳过合并")
-                        return False
-                    
-                    # 读取音频数据并写入输出文件
-                    frames = input_wav.getnframes()
-                    audio_data = input_wav.readframes(frames)
-                    output_wav.writeframes(audio_data)
-                    total_frames += frames
-                    
-                    print(f"  已添加部分 {part_num}: {frames} 帧")
-            
-            # 验证输出文件
-            with wave.open(merged_filepath, 'rb') as check_wav:
-                actual_frames = check_wav.getnframes()
-                if actual_frames != total_frames:
-                    print(f"警告: 合并后帧数不匹配，期望 {total_frames}，实际 {actual_frames}")
-                else:
-                    print(f"  合并成功: {actual_frames} 帧")
-        
-        print(f"成功合并分段文件为: {merged_filename}")
+        if verbose:
+            print(f"成功合并分段文件为: {merged_filename}（{len(sorted_parts)} 个部分，{merged_info['duration']:.1f} 秒）")
         return True
-        
+    
     except Exception as e:
         print(f"合并分段文件失败 {base_name}: {str(e)}")
-        # 如果合并失败，删除可能创建的不完整文件
-        if os.path.exists(merged_filepath):
-            try:
-                os.remove(merged_filepath)
-            except:
-                pass
         return False
 
+def merge_all_documents(audio_root: str, verbose: bool = True) -> Dict[str, Dict]:
+    """处理音频根目录下所有文档的分段文件（文档ID -> 处理结果）"""
+    results = {}
+    if not os.path.isdir(audio_root):
+        return results
+    
+    for file_id in sorted(os.listdir(audio_root)):
+        audio_folder = os.path.join(audio_root, file_id)
+        if os.path.isdir(audio_folder) and file_id != 'previews':
+            results[file_id] = merge_segmented_files(audio_folder, verbose)
+    return results
+
 def main():
     """主函数"""
-    if len(sys.argv) < 2:
-        print("用法: python merge_segmented_audio.py <音频文件夹路径>")
-        print("示例: python merge_segmented_files.py ../../audio/7a59aaff-5bb4-4c43-98af-c3614baf4b5e")
-        return
-    
-    audio_folder = sys.argv[1]
+    parser = argparse.ArgumentParser(description='分段音频文件合并工具')
+    parser.add_argument('audio_folder', nargs='?', help='文档的音频文件夹路径')
+    parser.add_argument('--all', action='store_true', help='处理音频根目录下的所有文档')
+    args = parser.parse_args()
     
-    if not os.path.exists(audio_folder):
-        print(f"错误: 文件夹不存在: {audio_folder}")
+    if not args.audio_folder and not args.all:
+        parser.print_help()
+        print("\n示例: python merge_segmented_audio.py ../../audio/7a59aaff-5bb4-4c43-98af-c3614baf4b5e")
+        print("      python merge_segmented_audio.py --all")
         return
     
     print("分段音频文件合并工具")
     print("=" * 50)
     
-    merge_segmented_files(audio_folder)
+    from app import app
+    from app.services.audio_index import AudioIndex
+    
+    if args.all:
+        audio_root = app.config['AUDIO_FOLDER']
+        results = merge_all_documents(audio_root)
+        folders = [os.path.join(audio_root, file_id) for file_id, summary in results.items() if summary['merged']]
+    else:
+        if not os.path.exists(args.audio_folder):
+            print(f"错误: 文件夹不存在: {args.audio_folder}")
+            return
+        summary = merge_segmented_files(args.audio_folder)
+        folders = [args.audio_folder] if summary['merged'] else []
+    
+    # 新合并的章节文件需要加入音频索引
+    for audio_folder in folders:
+        audio_folder = os.path.abspath(audio_folder)
+        AudioIndex(audio_folder, os.path.basename(audio_folder)).rebuild()
     
     print("\n处理完成！")
 
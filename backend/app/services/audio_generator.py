@@ -5,8 +5,11 @@
 """
 
 import os
-from typing import List, Dict
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Callable, Optional
 from app.services.text_to_speech_simple import SimpleTextToSpeechService
+from app.services.tts_cache import get_tts_cache
 
 class AudioGenerator:
     """音频生成器"""
@@ -17,45 +20,46 @@ class AudioGenerator:
     def get_tts_service(self) -> SimpleTextToSpeechService:
         """获取TTS服务实例"""
         try:
-            return SimpleTextToSpeechService()
+            return SimpleTextToSpeechService(
+                chunk_concurrency=self.app.config.get('TTS_CHUNK_CONCURRENCY'),
+                cache=get_tts_cache(self.app)
+            )
         except Exception as e:
             raise Exception(f"TTS服务初始化失败: {str(e)}")
     
-    def generate_audio_simple(self, file_id: str, chapter_index: int, voice_settings: Dict, 
-                            chapters: List[Dict], audio_folder: str) -> List[Dict]:
-        """生成音频（简单版本，无进度跟踪）"""
+    def _build_audio_filename(self, chapter_index: int, voice_settings: Dict) -> str:
+        """生成不覆盖的文件名：包含语音角色与时间戳"""
+        voice = str(voice_settings.get('voice', 'Ethan')).strip().replace(' ', '_')
+        timestamp = __import__('datetime').datetime.now().strftime('%Y%m%d_%H%M%S')
+        return f"chapter_{chapter_index+1}__{voice}__{timestamp}.wav"
+    
+    def generate_audio_simple(self, file_id: str, chapter_index: int, voice_settings: Dict,
+                            chapters: List[Dict], audio_folder: str,
+                            skip_chapters: Optional[Dict[int, Dict]] = None,
+                            chapter_callback: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """生成音频（简单版本，无进度跟踪）
+        
+        Args:
+            skip_chapters: 无需重新生成的章节（章节索引 -> 现有音频文件信息）
+            chapter_callback: 每个章节生成完成后的回调，参数为该章节的结果
+        """
         tts_service = self.get_tts_service()
+        skip_chapters = skip_chapters or {}
         
         if chapter_index == -1:
-            audio_files = []
-            for i, chapter in enumerate(chapters):
-                # 生成不覆盖的文件名：包含语音角色与时间戳
-                voice = str(voice_settings.get('voice', 'Ethan')).strip().replace(' ', '_')
-                timestamp = __import__('datetime').datetime.now().strftime('%Y%m%d_%H%M%S')
-                audio_filename = f"chapter_{i+1}__{voice}__{timestamp}.wav"
-                audio_filepath = os.path.join(audio_folder, audio_filename)
-                
-                tts_service.generate_and_save_audio(
-                    chapter['content'], 
-                    audio_filepath,
-                    voice_settings
-                )
-                
-                audio_files.append({
-                    'chapter_index': i,
-                    'chapter_title': chapter['title'],
-                    'audio_file': audio_filename
-                })
-            
-            return audio_files
+            return self._generate_chapters_parallel(
+                tts_service, chapters, voice_settings, audio_folder,
+                skip_chapters=skip_chapters, chapter_callback=chapter_callback
+            )
         else:
             if chapter_index >= len(chapters):
                 raise Exception('章节索引超出范围')
             
             chapter = chapters[chapter_index]
-            voice = str(voice_settings.get('voice', 'Ethan')).strip().replace(' ', '_')
-            timestamp = __import__('datetime').datetime.now().strftime('%Y%m%d_%H%M%S')
-            audio_filename = f"chapter_{chapter_index+1}__{voice}__{timestamp}.wav"
+            if chapter_index in skip_chapters:
+                return [self._build_skipped_result(chapter_index, chapter, skip_chapters[chapter_index])]
+            
+            audio_filename = self._build_audio_filename(chapter_index, voice_settings)
             audio_filepath = os.path.join(audio_folder, audio_filename)
             
             tts_service.generate_and_save_audio(
@@ -64,59 +68,46 @@ class AudioGenerator:
                 voice_settings
             )
             
-            return [{
+            result = {
                 'chapter_index': chapter_index,
                 'chapter_title': chapter['title'],
                 'audio_file': audio_filename
-            }]
+            }
+            if chapter_callback:
+                chapter_callback(result)
+            return [result]
     
     def generate_audio_with_progress(self, file_id: str, chapter_index: int, voice_settings: Dict,
-                                   chapters: List[Dict], audio_folder: str, 
-                                   progress_callback) -> List[Dict]:
-        """生成音频（带进度跟踪）"""
+                                   chapters: List[Dict], audio_folder: str,
+                                   progress_callback,
+                                   skip_chapters: Optional[Dict[int, Dict]] = None,
+                                   chapter_callback: Optional[Callable[[Dict], None]] = None,
+                                   chunk_callback: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """生成音频（带进度跟踪）
+        
+        Args:
+            chunk_callback: 每段音频生成完成后的回调，参数包含章节索引、分段索引、总段数、分段音频文件与缓存键
+        """
         tts_service = self.get_tts_service()
+        skip_chapters = skip_chapters or {}
         audio_files = []
         
         if chapter_index == -1:
-            total_chapters = len(chapters)
-            
-            for i, chapter in enumerate(chapters):
-                try:
-                    chapter_progress = (i / total_chapters) * 100
-                    progress_callback(int(chapter_progress), f"正在生成第 {i+1}/{total_chapters} 章节...")
-                    
-                    voice = str(voice_settings.get('voice', 'Ethan')).strip().replace(' ', '_')
-                    timestamp = __import__('datetime').datetime.now().strftime('%Y%m%d_%H%M%S')
-                    audio_filename = f"chapter_{i+1}__{voice}__{timestamp}.wav"
-                    audio_filepath = os.path.join(audio_folder, audio_filename)
-                    
-                    def chapter_progress_callback(sub_progress, sub_message):
-                        overall_progress = int((i / total_chapters) * 100 + (sub_progress / total_chapters))
-                        progress_callback(overall_progress, f"第 {i+1} 章节: {sub_message}")
-                    
-                    tts_service.generate_and_save_audio(
-                        chapter['content'], 
-                        audio_filepath,
-                        voice_settings,
-                        chapter_progress_callback
-                    )
-                    
-                    audio_files.append({
-                        'chapter_index': i,
-                        'chapter_title': chapter['title'],
-                        'audio_file': audio_filename
-                    })
-                    
-                except Exception as e:
-                    raise Exception(f'第 {i+1} 章节音频生成失败: {str(e)}')
+            audio_files = self._generate_chapters_parallel(
+                tts_service, chapters, voice_settings, audio_folder, progress_callback,
+                skip_chapters=skip_chapters, chapter_callback=chapter_callback,
+                chunk_callback=chunk_callback
+            )
         else:
             if chapter_index >= len(chapters):
                 raise Exception('章节索引超出范围')
             
             chapter = chapters[chapter_index]
-            voice = str(voice_settings.get('voice', 'Ethan')).strip().replace(' ', '_')
-            timestamp = __import__('datetime').datetime.now().strftime('%Y%m%d_%H%M%S')
-            audio_filename = f"chapter_{chapter_index+1}__{voice}__{timestamp}.wav"
+            if chapter_index in skip_chapters:
+                progress_callback(100, '章节内容与语音设置未变化，已跳过')
+                return [self._build_skipped_result(chapter_index, chapter, skip_chapters[chapter_index])]
+            
+            audio_filename = self._build_audio_filename(chapter_index, voice_settings)
             audio_filepath = os.path.join(audio_folder, audio_filename)
             
             try:
@@ -124,15 +115,163 @@ class AudioGenerator:
                     chapter['content'],
                     audio_filepath,
                     voice_settings,
-                    progress_callback
+                    progress_callback,
+                    self._make_chunk_callback(chapter_index, chunk_callback)
                 )
                 audio_files = [{
                     'chapter_index': chapter_index,
                     'chapter_title': chapter['title'],
                     'audio_file': audio_filename
                 }]
-                
+            
             except Exception as e:
                 raise Exception(f'音频生成失败: {str(e)}')
+            
+            if chapter_callback:
+                chapter_callback(audio_files[0])
         
         return audio_files
+    
+    def _make_chunk_callback(self, chapter_index: int,
+                             chunk_callback: Optional[Callable[[Dict], None]]) -> Optional[Callable[[int, int, str, str], None]]:
+        """将TTS服务的分段回调包装为带章节信息的回调（附带该分段的音频文件与缓存键）"""
+        if not chunk_callback:
+            return None
+        
+        def tts_chunk_callback(chunk_index: int, total_chunks: int, chunk_file: str, cache_key: str):
+            chunk_callback({
+                'chapter_index': chapter_index,
+                'chunk_index': chunk_index,
+                'total_chunks': total_chunks,
+                'chunk_file': chunk_file,
+                'cache_key': cache_key
+            })
+        return tts_chunk_callback
+    
+    def _build_skipped_result(self, chapter_index: int, chapter: Dict, existing: Dict) -> Dict:
+        """构造跳过章节的结果（沿用现有音频文件）"""
+        return {
+            'chapter_index': chapter_index,
+            'chapter_title': chapter['title'],
+            'audio_file': existing['filename'],
+            'skipped': True
+        }
+    
+    def warm_cache(self, chapter_index: int, voice_settings: Dict, chapters: List[Dict],
+                   progress_callback: Optional[Callable[[int, str], None]] = None) -> Dict:
+        """为指定章节（-1表示全部）预热TTS缓存"""
+        tts_service = self.get_tts_service()
+        
+        if chapter_index == -1:
+            targets = list(enumerate(chapters))
+        else:
+            if chapter_index >= len(chapters):
+                raise Exception('章节索引超出范围')
+            targets = [(chapter_index, chapters[chapter_index])]
+        
+        summary = {'total_chunks': 0, 'already_cached': 0, 'synthesized': 0}
+        for n, (i, chapter) in enumerate(targets):
+            if progress_callback:
+                progress_callback(int(n / len(targets) * 100), f"正在预热第 {i+1} 章节缓存...")
+            
+            result = tts_service.warm_cache(chapter['content'], voice_settings)
+            for key in summary:
+                summary[key] += result[key]
+        
+        return summary
+    
+    def _generate_chapters_parallel(self, tts_service: SimpleTextToSpeechService, chapters: List[Dict],
+                                    voice_settings: Dict, audio_folder: str,
+                                    progress_callback: Optional[Callable[[int, str], None]] = None,
+                                    skip_chapters: Optional[Dict[int, Dict]] = None,
+                                    chapter_callback: Optional[Callable[[Dict], None]] = None,
+                                    chunk_callback: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """多个章节并发生成音频，结果按章节顺序返回
+        
+        章节级并发由 TTS_CHAPTER_CONCURRENCY 控制；实际在途的API调用数
+        由分段级与章节级共享的全局限流器约束。skip_chapters 中的章节不重新生成。
+        """
+        skip_chapters = skip_chapters or {}
+        results: List[Optional[Dict]] = [None] * len(chapters)
+        for i, existing in skip_chapters.items():
+            if i < len(chapters):
+                results[i] = self._build_skipped_result(i, chapters[i], existing)
+        
+        targets = [i for i in range(len(chapters)) if results[i] is None]
+        total_chapters = len(targets)
+        if total_chapters == 0:
+            if progress_callback:
+                progress_callback(100, '所有章节内容与语音设置均未变化，已全部跳过')
+            return results
+        
+        max_workers = min(max(1, int(self.app.config.get('TTS_CHAPTER_CONCURRENCY', 2))), total_chapters)
+        
+        # 各章节的子进度（0-100），总进度为各章节进度的平均值
+        chapter_progress = {i: 0 for i in targets}
+        progress_lock = threading.Lock()
+        completed_count = [0]
+        
+        def report(i: int, sub_progress: int, sub_message: str):
+            if not progress_callback:
+                return
+            with progress_lock:
+                chapter_progress[i] = max(chapter_progress[i], min(int(sub_progress), 100))
+                overall_progress = int(sum(chapter_progress.values()) / total_chapters)
+                done = completed_count[0]
+                progress_callback(
+                    overall_progress,
+                    f"已完成 {done}/{total_chapters} 章节，第 {i+1} 章节: {sub_message}"
+                )
+        
+        def generate_chapter(i: int) -> Dict:
+            chapter = chapters[i]
+            audio_filename = self._build_audio_filename(i, voice_settings)
+            audio_filepath = os.path.join(audio_folder, audio_filename)
+            
+            def chapter_progress_callback(sub_progress, sub_message):
+                report(i, sub_progress, sub_message)
+            
+            tts_service.generate_and_save_audio(
+                chapter['content'],
+                audio_filepath,
+                voice_settings,
+                chapter_progress_callback if progress_callback else None,
+                self._make_chunk_callback(i, chunk_callback)
+            )
+            
+            result = {
+                'chapter_index': i,
+                'chapter_title': chapter['title'],
+                'audio_file': audio_filename
+            }
+            if chapter_callback:
+                chapter_callback(result)
+            return result
+        
+        if progress_callback:
+            skipped_message = f"，跳过 {len(skip_chapters)} 个未变化章节" if skip_chapters else ''
+            progress_callback(0, f"正在生成 {total_chapters} 个章节（并发 {max_workers}）{skipped_message}...")
+        
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tts-chapter') as executor:
+            futures = {
+                executor.submit(generate_chapter, i): i
+                for i in targets
+            }
+            try:
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        results[i] = future.result()
+                    except Exception as e:
+                        raise Exception(f'第 {i+1} 章节音频生成失败: {str(e)}')
+                    
+                    with progress_lock:
+                        completed_count[0] += 1
+                    report(i, 100, '音频生成完成！')
+            except Exception:
+                # 任一章节失败则取消尚未开始的章节
+                for pending in futures:
+                    pending.cancel()
+                raise
+        
+        return results
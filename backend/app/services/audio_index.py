@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+文档音频索引
+每个文档的音频文件夹下维护一份 audio_index.json，记录章节音频与合并音频的元数据，
+生成、合并、删除时更新；列表类接口直接查询索引，无需扫描目录和解析文件名
+"""
+
+import os
+import json
+import uuid
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from app.utils.wav_utils import read_wav_info
+from app.services.virtual_audio import VIRTUAL_MERGE_SUFFIX, VirtualWav, parse_virtual_name
+
+AUDIO_INDEX_FILENAME = 'audio_index.json'
+
+# 索引条目类型
+KIND_CHAPTER = 'chapter'
+KIND_MERGED = 'merged'
+
+# 已加载的索引：索引文件路径 -> (文件状态, 条目)，文件状态变化时重新读取
+_index_cache: Dict[str, tuple] = {}
+_index_lock = threading.Lock()
+
+def parse_audio_filename(file_id: str, filename: str) -> Optional[Dict]:
+    """解析音频文件名，无法识别时返回 None
+    
+    章节音频：chapter_{n}.wav 或 chapter_{n}__{voice}__{YYYYMMDD_HHMMSS}.wav
+    合并音频：{file_id}_complete__{ts}.wav、{file_id}_chapters_{范围}__{ts}.wav 等，
+    虚拟合并为对应文件名加 .vmerge 后缀
+    """
+    filename, virtual = parse_virtual_name(filename)
+    if not filename.endswith('.wav'):
+        return None
+    base = filename[:-4]
+    parts = base.split('__')
+    
+    if filename.startswith('chapter_') and not virtual:
+        # 跳过旧版本遗留的分段文件
+        if '_part_' in filename:
+            return None
+        try:
+            chapter_index = int(parts[0].replace('chapter_', '')) - 1
+        except ValueError:
+            return None
+        return {
+            'filename': filename,
+            'kind': KIND_CHAPTER,
+            'chapter_index': chapter_index,
+            'voice': parts[1] if len(parts) >= 2 else 'Unknown',
+            'timestamp': parts[2] if len(parts) >= 3 else None
+        }
+    
+    if filename.startswith(f"{file_id}_"):
+        name = parts[0][len(file_id) + 1:]
+        if name == 'complete':
+            chapter_range = "完整"
+        elif name.startswith('chapters_'):
+            chapter_range = f"章节{name[len('chapters_'):]}"
+        elif name.startswith('chapter_'):
+            chapter_range = f"章节{name[len('chapter_'):]}"
+        else:
+            return None
+        return {
+            'filename': filename,
+            'kind': KIND_MERGED,
+            'chapter_range': chapter_range,
+            'timestamp': parts[-1] if len(parts) >= 2 else None,
+            'virtual': virtual
+        }
+    
+    return None
+
+def format_display_time(entry: Dict) -> str:
+    """格式化条目的显示时间（优先使用文件名中的时间戳，否则使用修改时间）"""
+    timestamp_str = entry.get('timestamp')
+    if timestamp_str:
+        try:
+            return datetime.strptime(timestamp_str, '%Y%m%d_%H%M%S').strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            return timestamp_str
+    if entry.get('mtime'):
+        return datetime.fromtimestamp(entry['mtime']).strftime('%Y-%m-%d %H:%M:%S')
+    return '未知时间'
+
+def entry_rank(entry: Dict) -> str:
+    """条目的新旧排序键：有时间戳时使用时间戳，否则使用修改时间（前缀 'mtime:' 区分）"""
+    return entry.get('timestamp') or f"mtime:{entry.get('mtime', 0)}"
+
+class AudioIndex:
+    """单个文档的音频索引"""
+    
+    def __init__(self, audio_folder: str, file_id: str):
+        self.audio_folder = audio_folder
+        self.file_id = file_id
+        self.index_path = os.path.join(audio_folder, AUDIO_INDEX_FILENAME)
+    
+    def get_entries(self) -> Dict[str, Dict]:
+        """获取全部条目（文件名 -> 条目），索引不存在时扫描目录重建"""
+        with _index_lock:
+            return {filename: dict(entry) for filename, entry in self._load_locked().items()}
+    
+    def list_chapter_audio(self) -> List[Dict]:
+        return [entry for entry in self.get_entries().values() if entry['kind'] == KIND_CHAPTER]
+    
+    def list_merged_audio(self) -> List[Dict]:
+        return [entry for entry in self.get_entries().values() if entry['kind'] == KIND_MERGED]
+    
+    def get_audio_stats(self) -> Tuple[int, int]:
+        """音频文件数量与总大小（虚拟合并不占用音频数据，不计入）"""
+        audio_files = [entry for entry in self.get_entries().values() if not entry.get('virtual')]
+        return len(audio_files), sum(entry.get('size') or 0 for entry in audio_files)
+    
+    def record_audio(self, filename: str, **fields) -> Optional[Dict]:
+        """新增或更新文件条目（读取文件状态与WAV文件头），返回条目"""
+        with _index_lock:
+            entries = self._load_locked()
+            entry = self._build_entry(filename)
+            if entry is None:
+                return None
+            previous = entries.get(entry['filename'], {})
+            if previous.get('settings_hash') and 'settings_hash' not in fields:
+                entry['settings_hash'] = previous['settings_hash']
+            entry.update(fields)
+            entries[entry['filename']] = entry
+            self._save_locked(entries)
+            return dict(entry)
+    
+    def remove(self, filename: str):
+        """移除文件条目"""
+        with _index_lock:
+            entries = self._load_locked()
+            if entries.pop(filename, None) is not None:
+                self._save_locked(entries)
+    
+    def rebuild(self) -> Dict[str, Dict]:
+        """扫描目录重建索引（保留已有的指纹记录）"""
+        with _index_lock:
+            existing = self._read_locked() or {}
+            entries = self._scan_locked(existing)
+            self._save_locked(entries)
+            return {filename: dict(entry) for filename, entry in entries.items()}
+    
+    def _build_entry(self, filename: str) -> Optional[Dict]:
+        """解析文件名并读取文件元数据"""
+        entry = parse_audio_filename(self.file_id, filename)
+        if entry is None:
+            return None
+        
+        path = os.path.join(self.audio_folder, filename)
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        entry['mtime'] = stat.st_mtime
+        entry['size'] = stat.st_size
+        entry['duration'] = None
+        try:
+            if entry.get('virtual'):
+                virtual_wav = VirtualWav(path)
+                entry['size'] = virtual_wav.size
+                entry['duration'] = virtual_wav.manifest.get('duration')
+            else:
+                entry['duration'] = round(read_wav_info(path).duration, 3)
+        except Exception as e:
+            print(f"读取音频信息失败 {filename}: {str(e)}")
+        return entry
+    
+    def _load_locked(self) -> Dict[str, Dict]:
+        """读取索引（需持有锁），文件未变化时直接使用缓存"""
+        entries = self._read_locked()
+        if entries is None:
+            entries = self._scan_locked({})
+            self._save_locked(entries)
+        return entries
+    
+    def _read_locked(self) -> Optional[Dict[str, Dict]]:
+        try:
+            stat = os.stat(self.index_path)
+        except OSError:
+            _index_cache.pop(self.index_path, None)
+            return None
+        
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        cached = _index_cache.get(self.index_path)
+        if cached and cached[0] == stat_key:
+            return cached[1]
+        
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f).get('files', {})
+        except Exception as e:
+            print(f"读取音频索引失败，将重建: {str(e)}")
+            return None
+        _index_cache[self.index_path] = (stat_key, entries)
+        return entries
+    
+    def _scan_locked(self, existing: Dict[str, Dict]) -> Dict[str, Dict]:
+        """扫描目录生成索引条目（保留已有的指纹记录）"""
+        settings_hashes = {
+            filename: entry['settings_hash']
+            for filename, entry in existing.items() if entry.get('settings_hash')
+        }
+        entries = {}
+        if os.path.isdir(self.audio_folder):
+            for name in os.listdir(self.audio_folder):
+                entry = self._build_entry(name)
+                if entry is None:
+                    continue
+                if entry['filename'] in settings_hashes:
+                    entry['settings_hash'] = settings_hashes[entry['filename']]
+                entries[entry['filename']] = entry
+        return entries
+    
+    def _save_locked(self, entries: Dict[str, Dict]):
+        """原子地写回索引（需持有锁）"""
+        if not os.path.isdir(self.audio_folder):
+            return
+        temp_path = f"{self.index_path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'files': entries}, f, ensure_ascii=False)
+        os.replace(temp_path, self.index_path)
+        
+        stat = os.stat(self.index_path)
+        _index_cache[self.index_path] = ((stat.st_mtime_ns, stat.st_size), entries)
+
+def get_entry_path(audio_folder: str, entry: Dict) -> str:
+    """条目对应的磁盘路径（虚拟合并为其清单路径）"""
+    if entry.get('virtual'):
+        return os.path.join(audio_folder, f"{entry['filename']}{VIRTUAL_MERGE_SUFFIX}")
+    return os.path.join(audio_folder, entry['filename'])
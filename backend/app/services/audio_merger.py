@@ -5,9 +5,16 @@
 """
 
 import os
-import wave
 from datetime import datetime
 from typing import Dict, Optional
+from app.utils.wav_utils import concatenate_wav_files
+from app.services.virtual_audio import VIRTUAL_MERGE_SUFFIX, write_virtual_merge
+from app.services.audio_index import AudioIndex, entry_rank
+
+# 合并模式
+MERGE_MODE_FILE = 'file'        # 生成完整的合并音频文件
+MERGE_MODE_VIRTUAL = 'virtual'  # 只写入合并清单，下载时按字节范围读取章节文件
+MERGE_MODES = (MERGE_MODE_FILE, MERGE_MODE_VIRTUAL)
 
 class AudioMerger:
     """音频合并器"""
@@ -15,7 +22,8 @@ class AudioMerger:
     def __init__(self, app):
         self.app = app
     
-    def merge_audio_files(self, file_id: str, existing_audio_files: list, selected_chapters: list = None, selected_audio_versions: list = None) -> Dict:
+    def merge_audio_files(self, file_id: str, existing_audio_files: list, selected_chapters: list = None, selected_audio_versions: list = None,
+                          mode: str = None) -> Dict:
         """合并指定文档的音频文件
         
         Args:
@@ -23,8 +31,13 @@ class AudioMerger:
             existing_audio_files: 现有音频文件列表
             selected_chapters: 选中的章节索引列表，用于生成文件名
             selected_audio_versions: 选中的音频版本列表，包含具体的文件名
+            mode: 合并模式（file/virtual），默认读取 MERGE_MODE 配置
         """
         try:
+            mode = mode or self.app.config.get('MERGE_MODE', MERGE_MODE_FILE)
+            if mode not in MERGE_MODES:
+                raise Exception(f'不支持的合并模式: {mode}')
+            
             # 如果提供了选中的音频版本，使用它们；否则使用现有的音频文件
             if selected_audio_versions and len(selected_audio_versions) > 0:
                 # 使用选中的音频版本
@@ -82,8 +95,14 @@ class AudioMerger:
             merged_filename = f"{file_id}_{chapter_range}__{timestamp}.wav"
             merged_filepath = os.path.join(audio_folder, merged_filename)
             
-            # 使用wave模块合并音频文件
-            return self._merge_with_wave(existing_audio_files, merged_filepath, merged_filename)
+            if mode == MERGE_MODE_VIRTUAL:
+                result = self._merge_virtual(existing_audio_files, merged_filepath, merged_filename)
+                AudioIndex(audio_folder, file_id).record_audio(f"{merged_filename}{VIRTUAL_MERGE_SUFFIX}")
+            else:
+                # 流式合并WAV文件
+                result = self._merge_with_wave(existing_audio_files, merged_filepath, merged_filename)
+                AudioIndex(audio_folder, file_id).record_audio(merged_filename)
+            return result
             
         except Exception as e:
             raise Exception(str(e))
@@ -99,97 +118,67 @@ class AudioMerger:
         return True
     
     def _merge_with_wave(self, existing_audio_files: list, merged_filepath: str, merged_filename: str) -> Dict:
-        """使用wave模块合并WAV文件（Python标准库，无需额外依赖）"""
+        """流式合并WAV文件
+        
+        只读取各文件头校验参数，PCM数据按块（优先内核态）复制，内存占用与音频长度无关。
+        """
         try:
             if not existing_audio_files:
                 raise Exception('没有音频文件可合并')
             
-            # 读取第一个音频文件获取参数
-            with wave.open(existing_audio_files[0]['filepath'], 'rb') as first_wav:
-                channels = first_wav.getnchannels()
-                sample_width = first_wav.getsampwidth()
-                frame_rate = first_wav.getframerate()
-                comp_type = first_wav.getcomptype()
-                comp_name = first_wav.getcompname()
-
-            # 仅支持未压缩 PCM WAV
-            if comp_type != 'NONE':
-                raise Exception(f"仅支持未压缩 PCM WAV（comptype=NONE），检测到 comptype={comp_type}")
+            merged_info = concatenate_wav_files(
+                [audio_file['filepath'] for audio_file in existing_audio_files],
+                merged_filepath
+            )
             
-            # 创建输出文件
-            with wave.open(merged_filepath, 'wb') as output_wav:
-                output_wav.setnchannels(channels)
-                output_wav.setsampwidth(sample_width)
-                output_wav.setframerate(frame_rate)
-                # 与首段音频保持一致（未压缩情况下为 NONE/not compressed）
-                output_wav.setcomptype(comp_type, comp_name)
-                
-                # 依次读取并写入音频数据
-                for audio_file in existing_audio_files:
-                    with wave.open(audio_file['filepath'], 'rb') as input_wav:
-                        # 验证音频参数是否一致（严格校验）
-                        in_channels = input_wav.getnchannels()
-                        in_sampwidth = input_wav.getsampwidth()
-                        in_framerate = input_wav.getframerate()
-                        in_comptype = input_wav.getcomptype()
-
-                        if (in_channels != channels or 
-                            in_sampwidth != sample_width or 
-                            in_framerate != frame_rate or 
-                            in_comptype != comp_type):
-                            raise Exception(
-                                (
-                                    f"音频参数不一致: {audio_file['filepath']} "
-                                    f"(channels={in_channels}, sampwidth={in_sampwidth}, framerate={in_framerate}, comptype={in_comptype}) "
-                                    f"vs 预期 (channels={channels}, sampwidth={sample_width}, framerate={frame_rate}, comptype={comp_type}). "
-                                    "请先转码为相同格式后再合并。"
-                                )
-                            )
-                        
-                        # 读取音频数据并写入输出文件
-                        audio_data = input_wav.readframes(input_wav.getnframes())
-                        output_wav.writeframes(audio_data)
+            return {
+                'success': True,
+                'merged_file': merged_filename,
+                'total_chapters': len(existing_audio_files),
+                'duration': merged_info['duration'],
+                'method': 'wave_stream'
+            }
+            
+        except Exception as e:
+            raise Exception(f"WAV合并失败: {str(e)}")
+    
+    def _merge_virtual(self, existing_audio_files: list, merged_filepath: str, merged_filename: str) -> Dict:
+        """虚拟合并：只写入章节数据偏移清单，不复制音频数据"""
+        try:
+            manifest = write_virtual_merge(
+                [audio_file['filepath'] for audio_file in existing_audio_files],
+                f"{merged_filepath}{VIRTUAL_MERGE_SUFFIX}"
+            )
             
             return {
                 'success': True,
                 'merged_file': merged_filename,
                 'total_chapters': len(existing_audio_files),
-                'method': 'wave_module'
+                'duration': manifest['duration'],
+                'method': 'virtual'
             }
             
         except Exception as e:
-            raise Exception(f"wave模块合并失败: {str(e)}")
+            raise Exception(f"虚拟合并失败: {str(e)}")
     
     def get_merged_audio_path(self, file_id: str) -> Optional[str]:
-        """获取最新的合并音频文件路径（按时间戳或修改时间选择最新）"""
+        """获取最新的合并音频文件路径（按时间戳或修改时间选择最新）
+        
+        虚拟合并返回其对应的合并音频文件名路径（磁盘上只有清单）。
+        """
         base_audio_folder = self.app.config['AUDIO_FOLDER']
         audio_folder = os.path.join(base_audio_folder, file_id)
         if not os.path.exists(audio_folder):
             return None
-
-        candidates = []
+        
         try:
-            for filename in os.listdir(audio_folder):
-                if filename.endswith('.wav') and filename.startswith(f"{file_id}_"):
-                    # 检查是否是合并文件（不是单章节文件）
-                    if '_chapter_' in filename and '__' in filename:
-                        continue  # 跳过单章节文件
-                    
-                    # 合并文件格式：file_id_complete__timestamp.wav 或 file_id_chapters_x-y__timestamp.wav
-                    if '_complete__' in filename or '_chapters_' in filename or '_chapter_' in filename:
-                        filepath = os.path.join(audio_folder, filename)
-                        base = filename[:-4]
-                        parts = base.split('__')
-                        # 最后一个部分应该是时间戳
-                        timestamp_str = parts[-1] if len(parts) >= 2 else None
-                        rank = timestamp_str or f"mtime:{os.path.getmtime(filepath)}"
-                        candidates.append((rank, filepath))
+            merged_entries = AudioIndex(audio_folder, file_id).list_merged_audio()
         except Exception:
             return None
-
-        if not candidates:
+        
+        if not merged_entries:
             return None
-
+        
         # 选择 rank 最大者（时间戳或修改时间最新）
-        candidates.sort(key=lambda x: x[0])
-        return candidates[-1][1]
+        latest = max(merged_entries, key=entry_rank)
+        return os.path.join(audio_folder, latest['filename'])
@@ -4,11 +4,25 @@
 协调各个音频处理组件
 """
 
+import os
 from typing import List, Dict, Optional
 from app.services.audio_file_manager import AudioFileManager
 from app.services.audio_generator import AudioGenerator
-from app.services.progress_tracker import ProgressTracker
+from app.services.progress_tracker import get_progress_tracker, FINISHED_STATUSES
 from app.services.audio_merger import AudioMerger
+from app.services.job_runner import get_job_runner, JobQueueFullError
+from app.services.tts_cache import get_tts_cache
+from app.services.virtual_audio import VirtualWav, open_virtual_merge
+from app.services.ingestion import get_ingestion_pipeline
+
+# 音频生成模式
+GENERATION_MODE_ALL = 'all'                            # 重新生成全部章节
+GENERATION_MODE_MISSING_OR_STALE = 'missing_or_stale'  # 只生成缺失或已过期的章节
+GENERATION_MODES = (GENERATION_MODE_ALL, GENERATION_MODE_MISSING_OR_STALE)
+
+class DocumentNotFoundError(Exception):
+    """文档源文件不存在"""
+    pass
 
 class AudioService:
     """音频服务类 - 协调器"""
@@ -17,15 +31,18 @@ class AudioService:
         self.app = app
         self.file_manager = AudioFileManager(app)
         self.generator = AudioGenerator(app)
-        self.progress_tracker = ProgressTracker()
+        self.progress_tracker = get_progress_tracker(app)
         self.merger = AudioMerger(app)
     
-    def generate_audio_simple(self, file_id: str, chapter_index: int, voice_settings: Dict) -> List[Dict]:
-        """生成音频（简单版本，无进度跟踪）"""
+    def generate_audio_simple(self, file_id: str, chapter_index: int, voice_settings: Dict,
+                              mode: str = GENERATION_MODE_ALL) -> List[Dict]:
+        """生成音频（简单版本，无进度跟踪），文档仍在解析时抛出 DocumentIngestingError"""
+        get_ingestion_pipeline(self.app).ensure_ingested(file_id)
+        
         # 获取文件路径
         file_path = self.file_manager.get_file_path(file_id)
         if not file_path:
-            raise Exception('文件不存在')
+            raise DocumentNotFoundError('文件不存在')
         
         # 加载章节数据
         chapters = self.file_manager.load_chapters(file_id, file_path)
@@ -35,20 +52,47 @@ class AudioService:
         
         # 生成音频
         return self.generator.generate_audio_simple(
-            file_id, chapter_index, voice_settings, chapters, audio_folder
+            file_id, chapter_index, voice_settings, chapters, audio_folder,
+            skip_chapters=self._get_skip_chapters(file_id, chapters, voice_settings, mode),
+            chapter_callback=self._make_chapter_callback(file_id, chapters, voice_settings)
         )
     
-    def generate_audio_with_progress(self, file_id: str, chapter_index: int, voice_settings: Dict) -> str:
-        """生成音频（带进度跟踪）"""
+    def generate_audio_with_progress(self, file_id: str, chapter_index: int, voice_settings: Dict,
+                                     mode: str = GENERATION_MODE_ALL) -> str:
+        """生成音频（带进度跟踪），任务提交到后台执行后立即返回任务ID
+        
+        Args:
+            mode: 'all' 重新生成全部；'missing_or_stale' 只生成缺失或内容/设置已变化的章节
+        
+        文档仍在解析时抛出 DocumentIngestingError，文档不存在时抛出 DocumentNotFoundError（不创建任务）
+        """
+        if mode not in GENERATION_MODES:
+            raise Exception(f'不支持的生成模式: {mode}')
+        get_ingestion_pipeline(self.app).ensure_ingested(file_id)
+        
+        # 获取文件路径
+        file_path = self.file_manager.get_file_path(file_id)
+        if not file_path:
+            raise DocumentNotFoundError('文件不存在')
+        
         # 创建任务
         task_id = self.progress_tracker.create_task(file_id)
         
         try:
-            # 获取文件路径
-            file_path = self.file_manager.get_file_path(file_id)
-            if not file_path:
-                self.progress_tracker.set_error(task_id, '文件不存在')
-                return task_id
+            get_job_runner(self.app).submit(
+                self._run_generation_task, task_id, file_id, file_path, chapter_index, voice_settings, mode
+            )
+        except JobQueueFullError as e:
+            self.progress_tracker.set_error(task_id, str(e))
+            raise
+        
+        return task_id
+    
+    def _run_generation_task(self, task_id: str, file_id: str, file_path: str, chapter_index: int,
+                             voice_settings: Dict, mode: str = GENERATION_MODE_ALL):
+        """在后台线程中执行音频生成任务"""
+        try:
+            self.progress_tracker.set_running(task_id, '正在加载章节数据...')
             
             # 加载章节数据
             chapters = self.file_manager.load_chapters(file_id, file_path)
@@ -60,19 +104,179 @@ class AudioService:
             def progress_callback(progress, message):
                 self.progress_tracker.update_progress(task_id, progress, message)
             
+            skip_chapters = self._get_skip_chapters(file_id, chapters, voice_settings, mode)
+            record_fingerprint = self._make_chapter_callback(file_id, chapters, voice_settings)
+            
+            # 章节与分段完成时推送事件（供 SSE 订阅者使用）
+            def chapter_callback(result: Dict):
+                record_fingerprint(result)
+                self.progress_tracker.add_event(task_id, 'chapter', result)
+            
+            def chunk_callback(info: Dict):
+                self.progress_tracker.add_event(task_id, 'chunk', info)
+            
             # 生成音频
             audio_files = self.generator.generate_audio_with_progress(
-                file_id, chapter_index, voice_settings, chapters, audio_folder, progress_callback
+                file_id, chapter_index, voice_settings, chapters, audio_folder, progress_callback,
+                skip_chapters=skip_chapters,
+                chapter_callback=chapter_callback,
+                chunk_callback=chunk_callback
             )
             
             # 设置完成状态
-            self.progress_tracker.set_completed(task_id, audio_files)
-            
-            return task_id
+            skipped_count = sum(1 for audio_file in audio_files if audio_file.get('skipped'))
+            self.progress_tracker.update_task_info(task_id, {'skipped_count': skipped_count})
+            message = f'音频生成完成！（跳过 {skipped_count} 个未变化章节）' if skipped_count else '音频生成完成！'
+            self.progress_tracker.set_completed(task_id, audio_files, message)
             
         except Exception as e:
             self.progress_tracker.set_error(task_id, str(e))
+    
+    def _get_skip_chapters(self, file_id: str, chapters: List[Dict], voice_settings: Dict, mode: str) -> Dict[int, Dict]:
+        """根据生成模式确定可跳过的章节"""
+        if mode not in GENERATION_MODES:
+            raise Exception(f'不支持的生成模式: {mode}')
+        if mode == GENERATION_MODE_MISSING_OR_STALE:
+            return self.file_manager.get_up_to_date_chapters(file_id, chapters, voice_settings)
+        return {}
+    
+    def _make_chapter_callback(self, file_id: str, chapters: List[Dict], voice_settings: Dict):
+        """章节生成完成后记录其内容与语音设置指纹"""
+        def chapter_callback(result: Dict):
+            chapter = chapters[result['chapter_index']]
+            fingerprint = self.file_manager.compute_chapter_fingerprint(chapter, voice_settings)
+            self.file_manager.record_audio_fingerprint(file_id, result['audio_file'], fingerprint)
+        return chapter_callback
+    
+    def warm_tts_cache(self, file_id: str, chapter_index: int, voice_settings: Dict) -> str:
+        """在后台预热指定文档的TTS缓存，返回任务ID（文档仍在解析时抛出 DocumentIngestingError）"""
+        get_ingestion_pipeline(self.app).ensure_ingested(file_id)
+        task_id = self.progress_tracker.create_task(file_id)
+        
+        file_path = self.file_manager.get_file_path(file_id)
+        if not file_path:
+            self.progress_tracker.set_error(task_id, '文件不存在')
             return task_id
+        
+        def run():
+            try:
+                self.progress_tracker.set_running(task_id, '正在加载章节数据...')
+                chapters = self.file_manager.load_chapters(file_id, file_path)
+                
+                def progress_callback(progress, message):
+                    self.progress_tracker.update_progress(task_id, progress, message)
+                
+                summary = self.generator.warm_cache(chapter_index, voice_settings, chapters, progress_callback)
+                self.progress_tracker.set_completed(
+                    task_id, [],
+                    f"缓存预热完成：共 {summary['total_chunks']} 段，新合成 {summary['synthesized']} 段"
+                )
+            except Exception as e:
+                self.progress_tracker.set_error(task_id, str(e))
+        
+        try:
+            get_job_runner(self.app).submit(run)
+        except JobQueueFullError as e:
+            self.progress_tracker.set_error(task_id, str(e))
+            raise
+        
+        return task_id
+    
+    def reconcile_segmented_audio(self, file_id: Optional[str] = None) -> str:
+        """在后台合并旧版本遗留的分段音频文件（file_id 为空时处理所有文档），返回任务ID"""
+        task_id = self.progress_tracker.create_task(file_id or 'maintenance')
+        
+        def run():
+            try:
+                self.progress_tracker.set_running(task_id, '正在查找分段音频文件...')
+                if file_id:
+                    file_ids = [file_id]
+                else:
+                    audio_root = self.app.config['AUDIO_FOLDER']
+                    file_ids = sorted(
+                        name for name in os.listdir(audio_root)
+                        if os.path.isdir(os.path.join(audio_root, name)) and name != 'previews'
+                    )
+                
+                totals = {'merged': 0, 'skipped': 0, 'incomplete': 0, 'failed': 0}
+                merged_files = {}
+                for n, current_id in enumerate(file_ids):
+                    self.progress_tracker.update_progress(
+                        task_id, int(n / len(file_ids) * 100),
+                        f"正在整理第 {n+1}/{len(file_ids)} 个文档的分段音频..."
+                    )
+                    summary = self.file_manager.reconcile_segmented_files(current_id)
+                    totals['merged'] += len(summary['merged'])
+                    for key in ('skipped', 'incomplete', 'failed'):
+                        totals[key] += summary[key]
+                    if summary['merged']:
+                        merged_files[current_id] = summary['merged']
+                
+                self.progress_tracker.update_task_info(task_id, {'summary': totals, 'merged_files': merged_files})
+                self.progress_tracker.set_completed(
+                    task_id, [],
+                    f"分段整理完成：合并 {totals['merged']} 个章节，跳过 {totals['skipped']} 个，"
+                    f"缺少分段 {totals['incomplete']} 个，失败 {totals['failed']} 个"
+                )
+            except Exception as e:
+                self.progress_tracker.set_error(task_id, str(e))
+        
+        try:
+            get_job_runner(self.app).submit(run)
+        except JobQueueFullError as e:
+            self.progress_tracker.set_error(task_id, str(e))
+            raise
+        
+        return task_id
+    
+    def get_tts_cache_stats(self) -> Dict:
+        """获取TTS缓存统计信息"""
+        cache = get_tts_cache(self.app)
+        if cache is None:
+            return {'enabled': False}
+        return dict(cache.get_stats(), enabled=True)
+    
+    def purge_tts_cache(self) -> Dict:
+        """清空TTS缓存"""
+        cache = get_tts_cache(self.app)
+        if cache is None:
+            return {'enabled': False, 'removed_entries': 0, 'removed_bytes': 0}
+        return dict(cache.purge(), enabled=True)
+    
+    def iter_progress_events(self, task_id: str, last_event_id: int = 0, heartbeat_seconds: float = 15.0):
+        """逐个产出任务的进度事件，用于 SSE 推送
+        
+        首次连接、所需事件已被淘汰或任务已结束时先产出一条当前状态快照；
+        等待超过 heartbeat_seconds 仍无新事件时产出 None（调用方据此发送心跳）。
+        任务结束或不存在时停止。
+        """
+        progress = self.progress_tracker.get_progress(task_id)
+        if progress is None:
+            return
+        
+        events = self.progress_tracker.get_events(task_id, last_event_id)
+        finished = progress['status'] in FINISHED_STATUSES
+        missed = (events and events[0]['id'] > last_event_id + 1) or \
+            (not events and progress.get('last_event_id', 0) > last_event_id)
+        if last_event_id == 0 or missed or finished:
+            snapshot_type = {'completed': 'completed', 'error': 'failed'}.get(progress['status'], 'snapshot')
+            last_event_id = progress.get('last_event_id', 0)
+            yield {'id': last_event_id, 'type': snapshot_type, 'data': progress}
+            if finished:
+                return
+        
+        while True:
+            events = self.progress_tracker.wait_for_events(task_id, last_event_id, heartbeat_seconds)
+            if not events:
+                if self.progress_tracker.get_progress(task_id) is None:
+                    return
+                yield None
+                continue
+            for event in events:
+                last_event_id = event['id']
+                yield event
+                if event['type'] in ('completed', 'failed'):
+                    return
     
     def get_progress(self, task_id: str) -> Optional[Dict]:
         """获取进度信息"""
@@ -102,13 +306,15 @@ class AudioService:
         """为指定文件ID获取音频文件夹路径"""
         return self.file_manager.get_audio_folder_for_file(file_id)
     
-    def merge_audio_files(self, file_id: str, selected_chapters: List[int] = None, selected_audio_versions: List[Dict] = None) -> Dict:
+    def merge_audio_files(self, file_id: str, selected_chapters: List[int] = None, selected_audio_versions: List[Dict] = None,
+                          mode: str = None) -> Dict:
         """合并指定文档的音频文件
         
         Args:
             file_id: 文档ID
             selected_chapters: 选中的章节索引列表，None表示合并所有章节
             selected_audio_versions: 选中的音频版本列表，包含具体的文件名
+            mode: 合并模式，'virtual' 只写入合并清单而不复制音频数据
         """
         existing_audio_files = self.file_manager.get_existing_audio_files(file_id)
         
@@ -120,8 +326,14 @@ class AudioService:
                     filtered_audio_files.append(audio_file)
             existing_audio_files = filtered_audio_files
         
-        return self.merger.merge_audio_files(file_id, existing_audio_files, selected_chapters, selected_audio_versions)
+        result = self.merger.merge_audio_files(file_id, existing_audio_files, selected_chapters, selected_audio_versions, mode)
+        self.file_manager.refresh_catalog_audio_stats(file_id)
+        return result
     
     def get_merged_audio_path(self, file_id: str) -> Optional[str]:
-        """获取合并音频文件路径"""
+        """获取合并音频文件路径（虚拟合并返回其对应的合并音频文件名路径）"""
         return self.merger.get_merged_audio_path(file_id)
+    
+    def get_virtual_merge(self, file_id: str, filename: str) -> Optional[VirtualWav]:
+        """获取虚拟合并音频，filename 不是虚拟合并时返回 None"""
+        return open_virtual_merge(self.get_audio_folder_for_file(file_id), filename)
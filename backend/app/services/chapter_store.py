@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+章节数据存储
+章节正文按顺序写入数据文件 {file_id}_chapters.{版本}.txt（UTF-8），
+标题、字节偏移与长度写入紧凑的索引文件 {file_id}_chapters.idx；
+读取章节数、标题只需读取索引，读取单个章节通过 mmap 按偏移切片，与全书大小无关。
+索引同时记录源文件的大小、修改时间与SHA-256，打开文档时只有源文件发生变化才重新提取文本和分割章节。
+旧版本的 {file_id}_chapters.json 在首次读取时自动迁移
+"""
+
+import os
+import json
+import mmap
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+from app.services.file_processor import FileProcessor
+from app.services.text_encoding import FALLBACK_CONFIDENCE, detect_encoding, get_candidate_encodings
+
+# 计算源文件哈希时每次读取的块大小
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# 内存中最多缓存的章节索引数
+INDEX_CACHE_SIZE = 64
+
+INDEX_VERSION = 2
+INDEX_SUFFIX = '_chapters.idx'
+LEGACY_JSON_SUFFIX = '_chapters.json'
+
+def compute_source_fingerprint(source_path: str, with_hash: bool = True) -> Dict:
+    """源文件指纹：大小、修改时间（纳秒）与内容SHA-256"""
+    stat = os.stat(source_path)
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if with_hash:
+        digest = hashlib.sha256()
+        with open(source_path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        fingerprint['sha256'] = digest.hexdigest()
+    return fingerprint
+
+def read_original_filename(folder: str, file_id: str) -> Optional[str]:
+    """读取上传时保存在 {file_id}.meta 中的原始文件名，不存在时返回 None"""
+    try:
+        with open(os.path.join(folder, f"{file_id}.meta"), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except (OSError, ValueError):
+        return None
+
+def is_source_filename(file_id: str, filename: str) -> bool:
+    """是否为上传的源文件（{file_id}.{扩展名}，不含元数据与章节数据文件）"""
+    return filename.startswith(f"{file_id}.") and not filename.endswith('.meta')
+
+class ChapterWriter:
+    """流式写入章节：正文逐章追加到新的数据文件，提交时写入索引并替换旧版本"""
+    
+    def __init__(self, store: 'ChapterStore', folder: str, file_id: str, metadata: Dict):
+        self.store = store
+        self.folder = folder
+        self.file_id = file_id
+        self.metadata = metadata
+        self.blob_name = f"{file_id}_chapters.{uuid.uuid4().hex[:12]}.txt"
+        self.blob_path = os.path.join(folder, self.blob_name)
+        # 索引条目：[标题, 字节偏移, 字节长度, 字符数]
+        self.entries = []
+        self.offset = 0
+        self.char_count = 0
+        self._file = open(self.blob_path, 'wb')
+    
+    def add_chapter(self, title: str, content: str):
+        """追加一个章节"""
+        data = content.encode('utf-8')
+        self._file.write(data)
+        self.entries.append([title, self.offset, len(data), len(content)])
+        self.offset += len(data)
+        self.char_count += len(content)
+    
+    def commit(self, source_path: Optional[str] = None, source: Optional[Dict] = None) -> Dict:
+        """写入索引并原子替换旧版本，返回索引"""
+        self._file.close()
+        index = dict(self.metadata)
+        index.update({
+            'version': INDEX_VERSION,
+            'file_id': self.file_id,
+            'blob': self.blob_name,
+            'source': source or (compute_source_fingerprint(source_path) if source_path else None),
+            'chapters': self.entries
+        })
+        index.setdefault('total_text_length', self.char_count)
+        try:
+            self.store._replace_index(self.folder, self.file_id, index)
+        except Exception:
+            self.abort()
+            raise
+        return index
+    
+    def abort(self):
+        """放弃写入，删除数据文件"""
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.remove(self.blob_path)
+        except OSError:
+            pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        return False
+
+class ChapterStore:
+    """文档章节数据的读写"""
+    
+    def __init__(self, upload_folder: str, pdf_workers: int = 1):
+        """
+        Args:
+            pdf_workers: 重新解析PDF时按页并行提取的进程数
+        """
+        self.upload_folder = upload_folder
+        self.file_processor = FileProcessor(pdf_workers=pdf_workers)
+        # 索引文件路径 -> (文件状态, 索引)，文件变化时重新读取
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # 替换索引与清理旧数据文件需串行进行
+        self._write_lock = threading.Lock()
+        self._migrate_lock = threading.Lock()
+    
+    def get_document_folder(self, file_id: str) -> str:
+        """文档所在目录（新结构 uploads/{file_id}/，旧结构为 uploads 根目录）"""
+        folder = os.path.join(self.upload_folder, file_id)
+        return folder if os.path.isdir(folder) else self.upload_folder
+    
+    def open_writer(self, file_id: str, original_filename: str, file_extension: str,
+                    text_length: Optional[int] = None, folder: Optional[str] = None) -> ChapterWriter:
+        """创建流式章节写入器"""
+        metadata = {'original_filename': original_filename, 'file_extension': file_extension}
+        if text_length is not None:
+            metadata['total_text_length'] = text_length
+        return ChapterWriter(self, folder or self.get_document_folder(file_id), file_id, metadata)
+    
+    def extract(self, file_id: str, source_path: str, original_filename: str, file_extension: str,
+                folder: Optional[str] = None) -> Dict:
+        """从源文件提取文本、分割章节并保存，返回索引（TXT文件流式分割，不读入整个文件；EPUB按目录直接得到章节）"""
+        if file_extension == 'txt':
+            return self._extract_txt(file_id, source_path, original_filename, folder)
+        if file_extension == 'epub':
+            return self._extract_epub(file_id, source_path, original_filename, folder)
+        
+        try:
+            text_content = self.file_processor.extract_text(source_path, file_extension)
+        except Exception as e:
+            raise Exception(f'文本提取失败: {str(e)}')
+        
+        try:
+            chapters = self.file_processor.split_chapters(text_content)
+        except Exception as e:
+            raise Exception(f'章节分割失败: {str(e)}')
+        
+        with self.open_writer(file_id, original_filename, file_extension, len(text_content), folder) as writer:
+            for chapter in chapters:
+                writer.add_chapter(chapter['title'], chapter.get('content', ''))
+            return writer.commit(source_path)
+    
+    def _extract_txt(self, file_id: str, source_path: str, original_filename: str,
+                     folder: Optional[str] = None) -> Dict:
+        """逐章写入TXT文件的章节（按检测出的编码解码，解码失败时换下一个编码重新写入），索引中记录所用编码"""
+        detected = detect_encoding(source_path)
+        for encoding in get_candidate_encodings(detected['encoding']):
+            try:
+                with self.open_writer(file_id, original_filename, 'txt', folder=folder) as writer:
+                    writer.metadata['encoding'] = encoding
+                    writer.metadata['encoding_confidence'] = (
+                        detected['confidence'] if encoding == detected['encoding'] else FALLBACK_CONFIDENCE
+                    )
+                    for title, content in self.file_processor.iter_txt_chapters(source_path, encoding):
+                        writer.add_chapter(title, content)
+                    return writer.commit(source_path)
+            except UnicodeDecodeError:
+                continue
+            except Exception as e:
+                raise Exception(f'文本提取失败: {str(e)}')
+        raise Exception('文本提取失败: 无法识别文件编码')
+    
+    def _extract_epub(self, file_id: str, source_path: str, original_filename: str,
+                      folder: Optional[str] = None) -> Dict:
+        """按阅读顺序逐章写入EPUB的章节"""
+        try:
+            with self.open_writer(file_id, original_filename, 'epub', folder=folder) as writer:
+                for title, content in self.file_processor.iter_epub_chapters(source_path):
+                    writer.add_chapter(title, content)
+                return writer.commit(source_path)
+        except Exception as e:
+            raise Exception(f'文本提取失败: {str(e)}')
+    
+    def load(self, file_id: str, source_path: str) -> List[Dict]:
+        """读取完整章节数据，章节数据缺失、损坏或源文件已变化时重新提取并保存"""
+        return self._read_with_retry(lambda: self._load_index(file_id, source_path), self._read_all)
+    
+    def load_summaries(self, file_id: str, source_path: str) -> List[Dict]:
+        """读取章节摘要（同样校验源文件）"""
+        return self._summaries(self._load_index(file_id, source_path))
+    
+    def get_summaries(self, file_id: str) -> Optional[List[Dict]]:
+        """读取已保存的章节摘要，章节数据不存在时返回 None"""
+        index = self._read_index(file_id)
+        return self._summaries(index) if index is not None else None
+    
+    def get_chapters(self, file_id: str) -> Optional[List[Dict]]:
+        """读取已保存的完整章节列表，章节数据不存在时返回 None"""
+        return self._read_with_retry(lambda: self._read_index(file_id), self._read_all)
+    
+    def get_info(self, file_id: str) -> Optional[Dict]:
+        """读取已保存的文档信息（原始文件名、扩展名、文本总长度、章节数，TXT文件另有编码及其置信度）"""
+        index = self._read_index(file_id)
+        if index is None:
+            return None
+        return {
+            'file_id': file_id,
+            'original_filename': index.get('original_filename'),
+            'file_extension': index.get('file_extension'),
+            'total_text_length': index.get('total_text_length'),
+            'total_chapters': len(index['chapters']),
+            'encoding': index.get('encoding'),
+            'encoding_confidence': index.get('encoding_confidence')
+        }
+    
+    def get_chapter(self, file_id: str, chapter_index: int) -> Optional[Dict]:
+        """读取单个章节（标题与正文），章节不存在时返回 None"""
+        def read_chapter(index: Dict) -> Optional[Dict]:
+            if not 0 <= chapter_index < len(index['chapters']):
+                return None
+            title, offset, length, _ = index['chapters'][chapter_index]
+            return {'title': title, 'content': self._read_blob(index, offset, length)}
+        return self._read_with_retry(lambda: self._read_index(file_id), read_chapter)
+    
+    def _read_with_retry(self, load_index: Callable[[], Optional[Dict]], read: Callable[[Dict], Any]) -> Any:
+        """按索引读取章节数据；索引为 None 时返回 None。
+        
+        读取期间其他线程可能完成了重新提取并删除了旧数据文件，此时重新读取索引后重试一次。
+        """
+        index = load_index()
+        if index is None:
+            return None
+        try:
+            return read(index)
+        except FileNotFoundError:
+            index = load_index()
+            return read(index) if index is not None else None
+    
+    def _summaries(self, index: Dict) -> List[Dict]:
+        return [
+            {'index': i, 'title': title, 'char_count': char_count}
+            for i, (title, _, _, char_count) in enumerate(index['chapters'])
+        ]
+    
+    def _read_blob(self, index: Dict, offset: int, length: int) -> str:
+        """通过 mmap 读取数据文件中的一段正文"""
+        if length == 0:
+            return ''
+        with open(index['blob_path'], 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return mapped[offset:offset + length].decode('utf-8')
+    
+    def _read_all(self, index: Dict) -> List[Dict]:
+        """读取全部章节（整个数据文件只读取一次）"""
+        with open(index['blob_path'], 'rb') as f:
+            data = f.read()
+        return [
+            {'title': title, 'content': data[offset:offset + length].decode('utf-8')}
+            for title, offset, length, _ in index['chapters']
+        ]
+    
+    def _load_index(self, file_id: str, source_path: str) -> Dict:
+        """读取并校验索引，章节数据缺失、损坏或源文件已变化时重新提取"""
+        index = self._read_index(file_id)
+        if index is not None and self._is_fresh(index, source_path):
+            return index
+        
+        folder = os.path.dirname(source_path)
+        file_extension = source_path.rsplit('.', 1)[1].lower()
+        # 索引缺失时原始文件名取自上传时保存的元数据文件
+        original_filename = (
+            (index or {}).get('original_filename')
+            or read_original_filename(folder, file_id)
+            or os.path.basename(source_path)
+        )
+        index = self.extract(file_id, source_path, original_filename, file_extension, folder)
+        index['blob_path'] = os.path.join(folder, index['blob'])
+        return index
+    
+    def _is_fresh(self, index: Dict, source_path: str) -> bool:
+        """章节数据是否与源文件一致（先比较大小与修改时间，不一致时再比较内容哈希）"""
+        stored = index.get('source')
+        if not stored:
+            # 旧版本的章节数据由同一源文件生成，补记指纹后继续使用
+            self._backfill_source(index, compute_source_fingerprint(source_path))
+            return True
+        
+        current = compute_source_fingerprint(source_path, with_hash=False)
+        if current['size'] == stored.get('size') and current['mtime_ns'] == stored.get('mtime_ns'):
+            return True
+        if current['size'] != stored.get('size'):
+            return False
+        
+        # 只有修改时间变化（如复制、恢复备份）时按内容判断，并更新记录的修改时间
+        current = compute_source_fingerprint(source_path)
+        if current['sha256'] != stored.get('sha256'):
+            return False
+        self._backfill_source(index, current)
+        return True
+    
+    def _backfill_source(self, index: Dict, fingerprint: Dict):
+        try:
+            updated = {key: value for key, value in index.items() if key != 'blob_path'}
+            updated['source'] = fingerprint
+            with self._write_lock:
+                self._write_index(os.path.dirname(index['blob_path']), updated['file_id'], updated)
+        except Exception as e:
+            print(f"更新章节数据的源文件指纹失败: {str(e)}")
+    
+    def _read_index(self, file_id: str) -> Optional[Dict]:
+        """读取索引（文件未变化时使用缓存），旧版本JSON自动迁移；不存在或损坏时返回 None"""
+        folder = self.get_document_folder(file_id)
+        index_path = os.path.join(folder, f"{file_id}{INDEX_SUFFIX}")
+        try:
+            stat = os.stat(index_path)
+        except OSError:
+            return self._migrate_json(folder, file_id)
+        
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        with self._cache_lock:
+            cached = self._cache.get(index_path)
+            if cached and cached[0] == stat_key:
+                self._cache.move_to_end(index_path)
+                return cached[1]
+        
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            index['blob_path'] = os.path.join(folder, index['blob'])
+            if not os.path.exists(index['blob_path']):
+                raise Exception(f"章节数据文件不存在: {index['blob']}")
+        except Exception as e:
+            print(f"读取章节索引失败: {str(e)}")
+            return None
+        
+        with self._cache_lock:
+            self._cache[index_path] = (stat_key, index)
+            self._cache.move_to_end(index_path)
+            while len(self._cache) > INDEX_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return index
+    
+    def _migrate_json(self, folder: str, file_id: str) -> Optional[Dict]:
+        """将旧版本的 {file_id}_chapters.json 转换为数据文件加索引，成功后删除JSON"""
+        json_path = os.path.join(folder, f"{file_id}{LEGACY_JSON_SUFFIX}")
+        index_path = os.path.join(folder, f"{file_id}{INDEX_SUFFIX}")
+        if not os.path.exists(json_path):
+            # 其他线程可能刚完成迁移并删除了JSON
+            return self._read_index(file_id) if os.path.exists(index_path) else None
+        
+        with self._migrate_lock:
+            # 其他线程可能已完成迁移
+            if not os.path.exists(index_path):
+                self._convert_json(folder, file_id, json_path)
+        return self._read_index(file_id) if os.path.exists(index_path) else None
+    
+    def _convert_json(self, folder: str, file_id: str, json_path: str):
+        """按章节写入数据文件与索引（保留JSON中记录的源文件指纹）"""
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if not isinstance(data.get('chapters'), list):
+                raise Exception('缺少章节列表')
+            
+            with self.open_writer(file_id, data.get('original_filename'), data.get('file_extension'),
+                                  data.get('total_text_length'), folder) as writer:
+                for chapter in data['chapters']:
+                    writer.add_chapter(chapter['title'], chapter.get('content', ''))
+                writer.commit(source=data.get('source'))
+            os.remove(json_path)
+        except Exception as e:
+            print(f"迁移章节文件失败: {str(e)}")
+    
+    def _replace_index(self, folder: str, file_id: str, index: Dict):
+        """写入新索引并删除被替换的索引所引用的数据文件
+        
+        只删除旧索引引用的数据文件：同一文档并发提取时，其他写入器尚未提交的数据文件不受影响。
+        """
+        with self._write_lock:
+            old_blob = self._read_blob_name(folder, file_id)
+            self._write_index(folder, file_id, index)
+            if old_blob and old_blob != index['blob']:
+                try:
+                    os.remove(os.path.join(folder, old_blob))
+                except OSError:
+                    pass
+    
+    def _read_blob_name(self, folder: str, file_id: str) -> Optional[str]:
+        """直接从磁盘读取当前索引引用的数据文件名（不使用缓存），索引不存在或损坏时返回 None"""
+        index_path = os.path.join(folder, f"{file_id}{INDEX_SUFFIX}")
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('blob')
+        except (OSError, ValueError):
+            return None
+    
+    def _write_index(self, folder: str, file_id: str, index: Dict):
+        """原子写入索引（需持有写锁）"""
+        index_path = os.path.join(folder, f"{file_id}{INDEX_SUFFIX}")
+        temp_path = f"{index_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(temp_path, index_path)
+            with self._cache_lock:
+                self._cache.pop(index_path, None)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+# 进程内共享的章节存储
+_chapter_store: Optional[ChapterStore] = None
+_chapter_store_lock = threading.Lock()
+
+def get_chapter_store(app) -> ChapterStore:
+    """获取进程内共享的章节存储"""
+    global _chapter_store
+    if _chapter_store is None:
+        with _chapter_store_lock:
+            if _chapter_store is None:
+                _chapter_store = ChapterStore(app.config['UPLOAD_FOLDER'], app.config.get('PDF_WORKERS', 1))
+    return _chapter_store
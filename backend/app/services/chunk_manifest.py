@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+分段生成清单
+记录长文本章节中已完成的分段，失败重试或服务重启后只需合成缺失的分段
+同一工作目录同一时间只允许一个任务使用（进程内加锁），超过保留时间的工作目录在打开清单时清理
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from typing import Dict, Any, List, Optional
+from app.services.tts_cache import make_cache_key, normalize_settings
+
+# 分段工作目录所在的子文件夹（位于各文档的音频文件夹下）
+PARTIAL_FOLDER_NAME = '.partial'
+
+# 未完成的工作目录保留时间（超过后视为废弃并删除）
+PARTIAL_MAX_AGE_SECONDS = int(os.getenv('TTS_PARTIAL_MAX_AGE_HOURS', '168')) * 3600
+
+# 工作目录 -> [锁, 使用者数量]（没有使用者时移除）
+_work_dir_locks: Dict[str, list] = {}
+_work_dir_locks_guard = threading.Lock()
+
+def _acquire_work_dir(work_dir: str):
+    """独占工作目录，同一章节的其他任务需等待当前任务结束"""
+    with _work_dir_locks_guard:
+        entry = _work_dir_locks.setdefault(work_dir, [threading.Lock(), 0])
+        entry[1] += 1
+    entry[0].acquire()
+
+def _release_work_dir(work_dir: str):
+    with _work_dir_locks_guard:
+        entry = _work_dir_locks[work_dir]
+        entry[0].release()
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _work_dir_locks[work_dir]
+
+def cleanup_stale_work_dirs(partial_folder: str, max_age_seconds: int = PARTIAL_MAX_AGE_SECONDS) -> int:
+    """删除超过保留时间且未被使用的工作目录，返回删除的数量"""
+    if not os.path.isdir(partial_folder):
+        return 0
+    
+    removed = 0
+    cutoff = time.time() - max_age_seconds
+    for name in os.listdir(partial_folder):
+        work_dir = os.path.join(partial_folder, name)
+        with _work_dir_locks_guard:
+            if work_dir in _work_dir_locks:
+                continue
+            try:
+                if os.path.getmtime(work_dir) >= cutoff:
+                    continue
+            except OSError:
+                continue
+            shutil.rmtree(work_dir, ignore_errors=True)
+        removed += 1
+    
+    _remove_if_empty(partial_folder)
+    return removed
+
+def _remove_if_empty(folder: str):
+    try:
+        os.rmdir(folder)
+    except OSError:
+        pass
+
+def hash_chunk_text(text: str) -> str:
+    """计算分段文本的哈希"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class ChunkManifest:
+    """单个章节的分段生成清单（打开时独占工作目录，使用完毕后需调用 close 或使用 with 语句）"""
+    
+    MANIFEST_FILENAME = 'manifest.json'
+    
+    def __init__(self, work_dir: str, chunk_hashes: List[str], settings: Optional[Dict[str, Any]]):
+        self.work_dir = work_dir
+        self.chunk_hashes = chunk_hashes
+        self.settings = normalize_settings(settings)
+        self.manifest_path = os.path.join(work_dir, self.MANIFEST_FILENAME)
+        self.completed: Dict[int, Dict[str, Any]] = {}
+        self._open = True
+    
+    @classmethod
+    def open(cls, audio_folder: str, text: str, text_chunks: List[str],
+             settings: Optional[Dict[str, Any]]) -> 'ChunkManifest':
+        """打开（或新建）章节的分段清单，工作目录由文本与语音设置唯一确定"""
+        partial_folder = os.path.join(audio_folder, PARTIAL_FOLDER_NAME)
+        cleanup_stale_work_dirs(partial_folder)
+        
+        work_key = make_cache_key(text, settings)
+        work_dir = os.path.join(partial_folder, work_key)
+        _acquire_work_dir(work_dir)
+        try:
+            os.makedirs(work_dir, exist_ok=True)
+            # 更新修改时间，避免正在使用的目录被视为废弃
+            os.utime(work_dir)
+            manifest = cls(work_dir, [hash_chunk_text(chunk) for chunk in text_chunks], settings)
+            manifest._load()
+        except Exception:
+            _release_work_dir(work_dir)
+            raise
+        return manifest
+    
+    def __enter__(self) -> 'ChunkManifest':
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def close(self):
+        """释放工作目录"""
+        if self._open:
+            self._open = False
+            _release_work_dir(self.work_dir)
+    
+    def _load(self):
+        """读取已有清单，只保留文本哈希一致且文件完整的分段"""
+        if not os.path.exists(self.manifest_path):
+            return
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"读取分段清单失败: {str(e)}")
+            return
+        
+        for key, entry in data.get('chunks', {}).items():
+            try:
+                index = int(key)
+            except ValueError:
+                continue
+            if index >= len(self.chunk_hashes) or entry.get('hash') != self.chunk_hashes[index]:
+                continue
+            part_path = self.part_path(index)
+            if os.path.exists(part_path) and os.path.getsize(part_path) == entry.get('size'):
+                self.completed[index] = entry
+    
+    def part_path(self, index: int) -> str:
+        """分段音频文件路径"""
+        return os.path.join(self.work_dir, f"part_{index+1}.wav")
+    
+    def is_completed(self, index: int) -> bool:
+        return index in self.completed
+    
+    @property
+    def completed_count(self) -> int:
+        return len(self.completed)
+    
+    def mark_completed(self, index: int):
+        """记录分段已完成并原子地写回清单"""
+        self.completed[index] = {
+            'hash': self.chunk_hashes[index],
+            'size': os.path.getsize(self.part_path(index))
+        }
+        self._save()
+    
+    def _save(self):
+        data = {
+            'settings': self.settings,
+            'total_chunks': len(self.chunk_hashes),
+            'chunks': {str(index): entry for index, entry in sorted(self.completed.items())}
+        }
+        temp_path = f"{self.manifest_path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, self.manifest_path)
+    
+    def discard(self):
+        """章节合并完成后删除工作目录（.partial 为空时一并删除）"""
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        _remove_if_empty(os.path.dirname(self.work_dir))
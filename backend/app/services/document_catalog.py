@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+文档目录
+以SQLite保存所有文档的摘要信息（名称、大小、上传时间、章节数、音频数与音频总大小），
+在上传、生成、删除时更新；文档历史与音频文件列表直接分页查询，无需扫描上传与音频目录
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+from app.services.chapter_store import ChapterStore, get_chapter_store, is_source_filename, read_original_filename
+from app.services.audio_index import AudioIndex
+
+# 允许排序的字段（接口参数 -> 数据库列）
+SORT_FIELDS = {
+    'upload_time': 'upload_time',
+    'created_at': 'upload_time',
+    'original_name': 'original_name',
+    'file_size': 'file_size',
+    'chapter_count': 'chapter_count',
+    'audio_count': 'audio_count',
+    'total_size': 'audio_bytes'
+}
+
+class DocumentCatalog:
+    """文档目录（线程安全）"""
+    
+    def __init__(self, db_path: str, upload_folder: str, audio_folder: str,
+                 chapter_store: Optional[ChapterStore] = None):
+        self.upload_folder = upload_folder
+        self.audio_folder = audio_folder
+        self.chapter_store = chapter_store or ChapterStore(upload_folder)
+        self._lock = threading.Lock()
+        
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS documents ('
+            ' file_id TEXT PRIMARY KEY,'
+            ' original_name TEXT NOT NULL,'
+            ' file_extension TEXT,'
+            ' file_size INTEGER NOT NULL DEFAULT 0,'
+            ' upload_time REAL NOT NULL DEFAULT 0,'
+            ' chapter_count INTEGER NOT NULL DEFAULT 0,'
+            ' audio_count INTEGER NOT NULL DEFAULT 0,'
+            ' audio_bytes INTEGER NOT NULL DEFAULT 0,'
+            ' updated_at REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_documents_upload_time ON documents(upload_time)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_documents_audio_count ON documents(audio_count)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS catalog_meta (key TEXT PRIMARY KEY, value TEXT)')
+        self._conn.commit()
+    
+    def ensure_built(self):
+        """首次使用时扫描现有文档建立目录"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM catalog_meta WHERE key = 'built_at'").fetchone()
+        if row is None:
+            self.rebuild()
+    
+    def upsert_document(self, file_id: str, original_name: str, file_extension: Optional[str],
+                        file_size: int, upload_time: float, chapter_count: int):
+        """新增或更新文档信息（音频统计保持不变）"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT INTO documents (file_id, original_name, file_extension, file_size, upload_time, chapter_count, updated_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)'
+                ' ON CONFLICT(file_id) DO UPDATE SET original_name = excluded.original_name,'
+                ' file_extension = excluded.file_extension, file_size = excluded.file_size,'
+                ' upload_time = excluded.upload_time, chapter_count = excluded.chapter_count,'
+                ' updated_at = excluded.updated_at',
+                (file_id, original_name, file_extension, file_size, upload_time, chapter_count, time.time())
+            )
+    
+    def update_audio_stats(self, file_id: str, audio_count: int, audio_bytes: int):
+        """更新文档的音频数量与总大小"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE documents SET audio_count = ?, audio_bytes = ?, updated_at = ? WHERE file_id = ?',
+                (audio_count, audio_bytes, time.time(), file_id)
+            )
+    
+    def remove_document(self, file_id: str):
+        """删除文档记录"""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM documents WHERE file_id = ?', (file_id,))
+    
+    def query(self, offset: int = 0, limit: Optional[int] = None, sort: str = 'upload_time',
+              order: str = 'desc', search: Optional[str] = None,
+              has_audio: Optional[bool] = None) -> Tuple[List[Dict], int]:
+        """分页查询文档，返回（当前页文档列表, 符合条件的总数）"""
+        if sort not in SORT_FIELDS:
+            raise Exception(f'不支持的排序字段: {sort}')
+        if order not in ('asc', 'desc'):
+            raise Exception(f'不支持的排序方向: {order}')
+        
+        conditions = []
+        params: list = []
+        if search:
+            conditions.append('instr(lower(original_name), lower(?)) > 0')
+            params.append(search)
+        if has_audio is not None:
+            conditions.append('audio_count > 0' if has_audio else 'audio_count = 0')
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        
+        sql = f"SELECT * FROM documents{where} ORDER BY {SORT_FIELDS[sort]} {order.upper()}, file_id"
+        page_params = list(params)
+        if limit is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            page_params += [max(0, int(limit)), max(0, int(offset))]
+        elif offset:
+            sql += ' LIMIT -1 OFFSET ?'
+            page_params.append(max(0, int(offset)))
+        
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM documents{where}", params).fetchone()[0]
+            rows = self._conn.execute(sql, page_params).fetchall()
+        return [dict(row) for row in rows], total
+    
+    def rebuild(self) -> int:
+        """扫描上传与音频目录重建目录，返回文档数"""
+        documents = self._scan_documents()
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM documents')
+            now = time.time()
+            self._conn.executemany(
+                'INSERT INTO documents (file_id, original_name, file_extension, file_size, upload_time,'
+                ' chapter_count, audio_count, audio_bytes, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (doc['file_id'], doc['original_name'], doc['file_extension'], doc['file_size'],
+                     doc['upload_time'], doc['chapter_count'], doc['audio_count'], doc['audio_bytes'], now)
+                    for doc in documents
+                ]
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO catalog_meta (key, value) VALUES ('built_at', ?)", (str(now),)
+            )
+        return len(documents)
+    
+    def _scan_documents(self) -> List[Dict]:
+        """扫描所有文档（兼容 uploads/{file_id}/ 新结构与 uploads 根目录的旧结构）"""
+        documents = []
+        if not os.path.exists(self.upload_folder):
+            return documents
+        
+        for name in os.listdir(self.upload_folder):
+            folder_path = os.path.join(self.upload_folder, name)
+            if os.path.isdir(folder_path):
+                if os.path.exists(os.path.join(folder_path, f"{name}.meta")):
+                    documents.append(self._scan_document(name, folder_path))
+            elif name.endswith('.meta'):
+                file_id = name[:-len('.meta')]
+                if not os.path.isdir(os.path.join(self.upload_folder, file_id)):
+                    documents.append(self._scan_document(file_id, self.upload_folder))
+        return documents
+    
+    def _scan_document(self, file_id: str, folder_path: str) -> Dict:
+        """读取单个文档的元数据、原始文件、章节数与音频统计"""
+        original_name = read_original_filename(folder_path, file_id) or "未知文件"
+        
+        file_size = 0
+        upload_time = 0
+        file_extension = None
+        for filename in os.listdir(folder_path):
+            if is_source_filename(file_id, filename):
+                file_path = os.path.join(folder_path, filename)
+                if os.path.isfile(file_path):
+                    file_size = os.path.getsize(file_path)
+                    upload_time = os.path.getmtime(file_path)
+                    file_extension = filename.rsplit('.', 1)[1].lower()
+                    break
+        
+        # 章节数只需读取章节索引
+        chapter_info = self.chapter_store.get_info(file_id)
+        chapter_count = chapter_info['total_chapters'] if chapter_info else 0
+        
+        # 音频统计与生成、删除时一致，均取自文档的音频索引
+        audio_count = 0
+        audio_bytes = 0
+        audio_subdir = os.path.join(self.audio_folder, file_id)
+        if os.path.isdir(audio_subdir):
+            audio_count, audio_bytes = AudioIndex(audio_subdir, file_id).get_audio_stats()
+        
+        return {
+            'file_id': file_id,
+            'original_name': original_name,
+            'file_extension': file_extension,
+            'file_size': file_size,
+            'upload_time': upload_time,
+            'chapter_count': chapter_count,
+            'audio_count': audio_count,
+            'audio_bytes': audio_bytes
+        }
+
+# 单页最多返回的文档数
+MAX_PAGE_SIZE = 500
+
+def parse_query_args(args, default_sort: str = 'upload_time') -> Dict:
+    """解析列表接口的分页、排序与筛选参数，未指定 page/page_size 时返回全部文档
+    
+    支持 page（从1开始）、page_size、sort、order（asc/desc）、q（名称关键字）、has_audio（true/false）
+    """
+    query = {
+        'sort': args.get('sort', default_sort),
+        'order': args.get('order', 'desc').lower(),
+        'search': (args.get('q') or '').strip() or None,
+        'has_audio': None,
+        'page': None,
+        'page_size': None
+    }
+    if query['sort'] not in SORT_FIELDS:
+        raise ValueError(f"不支持的排序字段: {query['sort']}")
+    if query['order'] not in ('asc', 'desc'):
+        raise ValueError(f"不支持的排序方向: {query['order']}")
+    
+    has_audio = args.get('has_audio')
+    if has_audio is not None:
+        query['has_audio'] = has_audio.lower() in ('1', 'true', 'yes')
+    
+    if 'page' in args or 'page_size' in args:
+        try:
+            query['page'] = max(1, int(args.get('page', 1)))
+            query['page_size'] = min(MAX_PAGE_SIZE, max(1, int(args.get('page_size', 50))))
+        except ValueError:
+            raise ValueError('page 与 page_size 必须为整数')
+    return query
+
+def query_documents(catalog: 'DocumentCatalog', query: Dict) -> Tuple[List[Dict], int]:
+    """按 parse_query_args 的结果查询文档目录"""
+    offset, limit = 0, None
+    if query['page'] is not None:
+        offset, limit = (query['page'] - 1) * query['page_size'], query['page_size']
+    return catalog.query(
+        offset=offset, limit=limit, sort=query['sort'], order=query['order'],
+        search=query['search'], has_audio=query['has_audio']
+    )
+
+# 进程内共享的文档目录
+_document_catalog: Optional[DocumentCatalog] = None
+_document_catalog_lock = threading.Lock()
+
+def get_document_catalog(app) -> DocumentCatalog:
+    """获取进程内共享的文档目录，首次使用时自动扫描现有文档"""
+    global _document_catalog
+    if _document_catalog is None:
+        with _document_catalog_lock:
+            if _document_catalog is None:
+                catalog = DocumentCatalog(
+                    app.config['CATALOG_DB_PATH'],
+                    app.config['UPLOAD_FOLDER'],
+                    app.config['AUDIO_FOLDER'],
+                    get_chapter_store(app)
+                )
+                catalog.ensure_built()
+                _document_catalog = catalog
+    return _document_catalog
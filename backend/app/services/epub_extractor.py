@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+EPUB章节提取
+按书脊（spine）的阅读顺序读取正文文档，章节标题取自目录（EPUB3 nav，缺失时使用NCX），
+逐个文档用 html.parser 增量提取文本并在目录指向的锚点处切分，直接得到章节，无需再按正则查找章节标题
+"""
+
+import re
+import codecs
+import posixpath
+from html.parser import HTMLParser
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import unquote
+import ebooklib
+from ebooklib import epub
+
+# 不输出文本的元素
+SKIP_TAGS = {'head', 'script', 'style', 'noscript', 'svg', 'math'}
+
+# 块级元素（前后换行）
+BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'body', 'br', 'dd', 'div', 'dl', 'dt', 'figcaption',
+    'figure', 'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol',
+    'p', 'pre', 'section', 'table', 'td', 'th', 'tr', 'ul'
+}
+
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+XML_ENCODING_PATTERN = re.compile(rb'<\?xml[^>]*encoding=["\']([A-Za-z0-9._-]+)["\']')
+
+class EpubTextParser(HTMLParser):
+    """提取单个XHTML文档的文本，遇到指定锚点（元素 id 或 a 的 name）时开始新的文本段"""
+    
+    def __init__(self, anchors: Optional[Set[str]] = None):
+        super().__init__(convert_charrefs=True)
+        self.anchors = anchors or set()
+        # 文本段：[锚点（文档开头为 None）, 文本片段列表]
+        self.segments = [[None, []]]
+        self.title = ''
+        self.heading = ''
+        self._skip_depth = 0
+        self._pre_depth = 0
+        self._in_title = False
+        self._heading_depth = 0
+    
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        anchor = attrs.get('id') or (attrs.get('name') if tag == 'a' else None)
+        if anchor in self.anchors:
+            self.segments.append([anchor, []])
+        
+        if tag == 'title':
+            self._in_title = True
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self._append('\n')
+        if tag == 'pre':
+            self._pre_depth += 1
+        if tag in HEADING_TAGS and not self.heading:
+            self._heading_depth += 1
+    
+    def handle_endtag(self, tag):
+        if tag == 'title':
+            self._in_title = False
+        if tag in SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in BLOCK_TAGS:
+            self._append('\n')
+        if tag == 'pre':
+            self._pre_depth = max(0, self._pre_depth - 1)
+        if tag in HEADING_TAGS and self._heading_depth:
+            self._heading_depth -= 1
+            self.heading = self.heading.strip()
+    
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        if self._skip_depth:
+            return
+        if not self._pre_depth:
+            data = WHITESPACE_PATTERN.sub(' ', data)
+        if self._heading_depth:
+            self.heading += data
+        self._append(data)
+    
+    def _append(self, text: str):
+        self.segments[-1][1].append(text)
+    
+    def get_segments(self) -> List[Tuple[Optional[str], str]]:
+        """返回 [(锚点, 文本)]，文本去除每行首尾空白与空行"""
+        return [(anchor, join_lines(''.join(parts))) for anchor, parts in self.segments]
+
+def join_lines(text: str) -> str:
+    """去除每行首尾空白并删除空行"""
+    return '\n'.join(line.strip() for line in text.split('\n') if line.strip())
+
+def decode_document(content: bytes) -> str:
+    """按BOM或XML声明的编码（默认UTF-8）解码文档，无法解码的字节以替换字符代替"""
+    if content.startswith(codecs.BOM_UTF8):
+        return content[len(codecs.BOM_UTF8):].decode('utf-8', errors='replace')
+    match = XML_ENCODING_PATTERN.match(content.lstrip()[:200])
+    encoding = match.group(1).decode('ascii') if match else 'utf-8'
+    try:
+        return content.decode(encoding, errors='replace')
+    except LookupError:
+        return content.decode('utf-8', errors='replace')
+
+def read_toc_entries(book: epub.EpubBook) -> List[Tuple[str, Optional[str], str]]:
+    """按目录顺序展开目录，返回 [(文档名, 锚点, 标题)]（文档名与清单中的文件名一致）"""
+    names = {item.get_name() for item in book.get_items()}
+    # NCX 中的链接相对于NCX文件所在目录，nav 中的链接已转换为相对于OPF目录
+    base_dirs = ['']
+    ncx = next((item for item in book.get_items() if isinstance(item, epub.EpubNcx)), None)
+    if ncx is not None:
+        base_dirs.append(posixpath.dirname(ncx.get_name()))
+    
+    entries = []
+    
+    def add_entry(href: Optional[str], title: Optional[str]):
+        if not href:
+            return
+        path, _, fragment = unquote(href).partition('#')
+        for base_dir in base_dirs:
+            name = posixpath.normpath(posixpath.join(base_dir, path))
+            if name in names:
+                entries.append((name, fragment or None, (title or '').strip()))
+                return
+    
+    def walk(nodes):
+        for node in nodes:
+            if isinstance(node, tuple):
+                section, children = node
+                add_entry(getattr(section, 'href', None), section.title)
+                walk(children)
+            elif isinstance(node, epub.Link):
+                add_entry(node.href, node.title)
+    
+    walk(book.toc)
+    return entries
+
+def iter_epub_chapters(file_path: str) -> Iterator[Tuple[str, str]]:
+    """按阅读顺序逐个产出（标题, 正文）
+    
+    目录条目所在的位置开始新章节（指向文档开头或文档内的锚点），不在目录中的文档接在上一章之后；
+    第一个目录条目之前的内容作为“前言”。没有目录时每个文档为一章，标题取第一个标题元素或文档标题。
+    """
+    book = epub.read_epub(file_path, options={'ignore_ncx': True})
+    
+    toc_by_document: Dict[str, List[Tuple[Optional[str], str]]] = {}
+    for name, fragment, title in read_toc_entries(book):
+        toc_by_document.setdefault(name, []).append((fragment, title))
+    has_toc = bool(toc_by_document)
+    
+    chapter_count = 0
+    emitted = False
+    title = None
+    parts: List[str] = []
+    
+    for item_id, linear in book.spine:
+        item = book.get_item_with_id(item_id)
+        if item is None or item.get_type() != ebooklib.ITEM_DOCUMENT or isinstance(item, epub.EpubNav):
+            continue
+        if linear == 'no':
+            continue
+        
+        entries = toc_by_document.get(item.get_name(), [])
+        anchor_titles = {}
+        start_title = None
+        for fragment, entry_title in entries:
+            if fragment is None:
+                start_title = start_title or entry_title
+            else:
+                anchor_titles.setdefault(fragment, entry_title)
+        
+        parser = EpubTextParser(set(anchor_titles))
+        # 使用原始内容（get_content 会经 lxml 重新解析并序列化整个文档）
+        parser.feed(decode_document(item.content))
+        parser.close()
+        
+        for anchor, text in parser.get_segments():
+            if anchor is not None:
+                new_title = anchor_titles[anchor]
+            elif has_toc:
+                # 不在目录中的文档接在上一章之后
+                new_title = start_title if start_title is not None or title is not None else '前言'
+            else:
+                new_title = parser.heading or parser.title.strip() or ''
+            
+            if new_title is not None:
+                content = join_lines('\n'.join(parts))
+                if title is not None and content:
+                    emitted = True
+                    yield title, content
+                chapter_count += 1
+                title = new_title or f'第{chapter_count}章'
+                parts = []
+            parts.append(text)
+    
+    content = join_lines('\n'.join(parts))
+    if title is not None and content:
+        yield title, content
+    elif not emitted:
+        yield '全文', ''
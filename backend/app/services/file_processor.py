@@ -1,24 +1,96 @@
 import os
 import re
-from typing import List, Dict, Any
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Tuple, Iterator, Iterable, Optional, TextIO
 import PyPDF2
 import pdfplumber
-import ebooklib
-from ebooklib import epub
 from docx import Document
+from app.services.epub_extractor import iter_epub_chapters
+from app.services.text_encoding import detect_encoding, get_candidate_encodings
+
+# 章节标题样式及其行首模式（按优先级排列，行首匹配即视为标题）
+CHAPTER_HEADING_STYLES = [
+    ('chapter_cn', r'第[一二三四五六七八九十\d]+章'),
+    ('chapter_en', r'Chapter\s*\d+'),
+    ('section_cn', r'第[一二三四五六七八九十\d]+节'),
+    ('section_en', r'Section\s*\d+'),
+    ('numbered', r'\d+\.'),
+    ('enumerated_cn', r'[一二三四五六七八九十\d]+、')
+]
+
+# 所有标题样式合并为一个预编译的正则，每行只需匹配一次，命中的分组名即标题样式
+CHAPTER_HEADING_PATTERN = re.compile(
+    '|'.join(f'(?P<{style}>{pattern})' for style, pattern in CHAPTER_HEADING_STYLES)
+)
+
+def match_chapter_heading(line: str) -> Optional[str]:
+    """判断（去除首尾空白后的）一行是否为章节标题，返回标题样式，不是标题时返回 None"""
+    match = CHAPTER_HEADING_PATTERN.match(line)
+    return match.lastgroup if match else None
+
+# 流式分割TXT时，第一个章节标题之前的内容超过该大小后暂存到磁盘
+TXT_SPOOL_MAX_BYTES = 4 * 1024 * 1024
+
+# 行内连续的空格与制表符
+INLINE_SPACE_PATTERN = re.compile(r'[ \t]+')
+
+# 按页并行提取PDF时每个进程至少分到的页数（子进程启动需重新导入应用，页数少时开销大于收益）
+PDF_MIN_PAGES_PER_WORKER = 32
+
+# 每个进程分到的页段数（页段越小负载越均衡，但每个页段都要重新打开一次PDF）
+PDF_SHARDS_PER_WORKER = 4
+
+def extract_pdf_pages(file_path: str, start: int, end: int) -> List[str]:
+    """提取PDF第 start 到 end-1 页的文本（可在子进程中执行）
+    
+    优先使用pdfplumber，某页提取不到文本时只对该页改用PyPDF2。
+    """
+    page_texts = []
+    fallback_reader = None
+    with pdfplumber.open(file_path) as pdf:
+        for page_number in range(start, end):
+            page = pdf.pages[page_number]
+            try:
+                page_text = page.extract_text() or ''
+            except Exception:
+                page_text = ''
+            finally:
+                # 释放页面解析缓存，避免大文件内存持续增长
+                page.flush_cache()
+            
+            if not page_text.strip():
+                try:
+                    if fallback_reader is None:
+                        fallback_reader = PyPDF2.PdfReader(file_path)
+                    page_text = fallback_reader.pages[page_number].extract_text() or ''
+                except Exception:
+                    page_text = ''
+            page_texts.append(page_text)
+    return page_texts
+
+def split_page_ranges(page_count: int, shard_count: int) -> List[Tuple[int, int]]:
+    """将页码均分为 shard_count 个连续页段 [(start, end), ...]"""
+    shard_count = max(1, min(shard_count, page_count))
+    size, remainder = divmod(page_count, shard_count)
+    ranges = []
+    start = 0
+    for i in range(shard_count):
+        end = start + size + (1 if i < remainder else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
 
 class FileProcessor:
     """文件处理服务，负责解析不同格式的文档文件"""
     
-    def __init__(self):
-        self.chapter_patterns = [
-            r'^第[一二三四五六七八九十\d]+章\s*[^\n]*',
-            r'^Chapter\s*\d+\s*[^\n]*',
-            r'^第[一二三四五六七八九十\d]+节\s*[^\n]*',
-            r'^Section\s*\d+\s*[^\n]*',
-            r'^\d+\.\s*[^\n]*',
-            r'^[一二三四五六七八九十\d]+、\s*[^\n]*'
-        ]
+    def __init__(self, pdf_workers: int = 1):
+        """
+        Args:
+            pdf_workers: 按页并行提取PDF文本的进程数（1为串行）
+        """
+        self.pdf_workers = max(1, int(pdf_workers))
     
     def extract_text(self, file_path: str, file_extension: str) -> str:
         """根据文件扩展名提取文本内容"""
@@ -37,62 +109,59 @@ class FileProcessor:
             raise Exception(f"文件解析失败: {str(e)}")
     
     def _extract_txt(self, file_path: str) -> str:
-        """提取TXT文件内容"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                text = f.read()
-                return text
-        except UnicodeDecodeError:
-            # 尝试其他编码
-            encodings = ['gbk', 'gb2312', 'latin-1']
-            for encoding in encodings:
-                try:
-                    with open(file_path, 'r', encoding=encoding) as f:
-                        text = f.read()
-                        return text
-                except UnicodeDecodeError:
-                    continue
-            raise Exception("无法识别文件编码")
+        """提取TXT文件内容（先根据BOM与文件开头检测编码，通常只需解码一次）"""
+        for encoding in get_candidate_encodings(detect_encoding(file_path)['encoding']):
+            try:
+                with open(file_path, 'r', encoding=encoding) as f:
+                    return f.read()
+            except UnicodeDecodeError:
+                continue
+        raise Exception("无法识别文件编码")
     
     def _extract_pdf(self, file_path: str) -> str:
-        """提取PDF文件内容"""
-        text = ""
-        
+        """提取PDF文件内容（页数较多时按页段并行提取，结果按页码顺序拼接）"""
         try:
-            # 首先尝试使用pdfplumber（更好的文本提取）
             with pdfplumber.open(file_path) as pdf:
-                for i, page in enumerate(pdf.pages):
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
+                page_count = len(pdf.pages)
             
-            # 如果pdfplumber没有提取到内容，使用PyPDF2
-            if not text.strip():
-                with open(file_path, 'rb') as file:
-                    pdf_reader = PyPDF2.PdfReader(file)
-                    for i, page in enumerate(pdf_reader.pages):
-                        page_text = page.extract_text()
-                        if page_text:
-                            text += page_text + "\n"
+            workers = self._get_pdf_workers(page_count)
+            if workers <= 1:
+                page_texts = extract_pdf_pages(file_path, 0, page_count)
+            else:
+                page_ranges = split_page_ranges(page_count, workers * PDF_SHARDS_PER_WORKER)
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                ) as executor:
+                    futures = [
+                        executor.submit(extract_pdf_pages, file_path, start, end)
+                        for start, end in page_ranges
+                    ]
+                    page_texts = [text for future in futures for text in future.result()]
             
-            return text
+            return ''.join(f"{page_text}\n" for page_text in page_texts if page_text)
         except Exception as e:
             raise Exception(f"PDF解析失败: {str(e)}")
     
+    def _get_pdf_workers(self, page_count: int) -> int:
+        """确定PDF提取进程数：页数较少或当前进程不能创建子进程时串行提取"""
+        workers = min(self.pdf_workers, page_count // PDF_MIN_PAGES_PER_WORKER)
+        # 守护进程（如 multiprocessing.Pool 的工作进程）不允许再创建子进程
+        if workers <= 1 or multiprocessing.current_process().daemon:
+            return 1
+        return workers
+    
     def _extract_epub(self, file_path: str) -> str:
-        """提取EPUB文件内容"""
+        """提取EPUB文件内容（按阅读顺序）"""
         try:
-            book = epub.read_epub(file_path)
-            text = ""
-            
-            for item in book.get_items():
-                if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                    content = item.get_content().decode('utf-8')
-                    # 简单的HTML标签清理
-                    content = re.sub(r'<[^>]+>', '', content)
-                    text += content + "\n"
-            
-            return text
+            return ''.join(f"{content}\n" for _, content in iter_epub_chapters(file_path))
+        except Exception as e:
+            raise Exception(f"EPUB解析失败: {str(e)}")
+    
+    def iter_epub_chapters(self, file_path: str) -> Iterator[Tuple[str, str]]:
+        """按书脊顺序与目录逐个产出EPUB章节（标题, 正文），不再经过 split_chapters"""
+        try:
+            yield from iter_epub_chapters(file_path)
         except Exception as e:
             raise Exception(f"EPUB解析失败: {str(e)}")
     
@@ -123,11 +192,8 @@ class FileProcessor:
         
         for i, line in enumerate(lines):
             line = line.strip()
-            if line:
-                for pattern in self.chapter_patterns:
-                    if re.match(pattern, line):
-                        chapter_positions.append((i, line))
-                        break
+            if line and match_chapter_heading(line):
+                chapter_positions.append((i, line))
         
         # 如果没有找到章节标题，按段落分割
         if not chapter_positions:
@@ -156,6 +222,76 @@ class FileProcessor:
         
         return chapters if chapters else [{'title': '全文', 'content': text}]
     
+    def iter_txt_chapters(self, file_path: str, encoding: str = 'utf-8') -> Iterator[Tuple[str, str]]:
+        """流式分割TXT文件，逐个产出（标题, 正文），结果与 extract_text + split_chapters 一致
+        
+        文件按行增量解码，遇到下一个章节标题时输出上一章，内存占用只与单个章节的大小有关；
+        第一个章节标题之前的内容暂存在临时文件中，全文没有章节标题时再从中按段落分割。
+        编码不匹配时抛出 UnicodeDecodeError（此前可能已产出部分章节）。
+        """
+        with open(file_path, 'r', encoding=encoding) as f, tempfile.SpooledTemporaryFile(
+            max_size=TXT_SPOOL_MAX_BYTES, mode='w+', encoding='utf-8'
+        ) as intro:
+            title = None
+            chapter_lines = []
+            for line in self._iter_clean_lines(f):
+                heading = line.strip()
+                if heading and match_chapter_heading(heading):
+                    if title is None:
+                        intro.seek(0)
+                        intro_content = intro.read().strip()
+                        if intro_content:
+                            yield '前言', intro_content
+                    else:
+                        yield title, '\n'.join(chapter_lines).strip()
+                    title = heading
+                    chapter_lines = [line]
+                elif title is None:
+                    intro.write(line + '\n')
+                else:
+                    chapter_lines.append(line)
+            
+            if title is not None:
+                yield title, '\n'.join(chapter_lines).strip()
+                return
+            
+            # 没有找到章节标题，按段落分割
+            intro.seek(0)
+            empty = True
+            for chapter in self._iter_paragraph_chapters(self._iter_paragraphs(intro)):
+                empty = False
+                yield chapter['title'], chapter['content']
+            if empty:
+                yield '全文', ''
+    
+    def _iter_clean_lines(self, lines: Iterable[str]) -> Iterator[str]:
+        """逐行清理文本（与 _clean_text 等价）：连续空白行合并为一个空行，行内空格与制表符合并为一个空格"""
+        started = False
+        blank = False
+        for line in lines:
+            line = line.rstrip('\n')
+            if not line.strip():
+                blank = True
+                continue
+            if blank and started:
+                yield ''
+            started = True
+            blank = False
+            yield INLINE_SPACE_PATTERN.sub(' ', line)
+    
+    def _iter_paragraphs(self, lines: TextIO) -> Iterator[str]:
+        """从清理后的逐行文本中按空行切分段落"""
+        paragraph = []
+        for line in lines:
+            line = line.rstrip('\n')
+            if line:
+                paragraph.append(line)
+            elif paragraph:
+                yield '\n'.join(paragraph)
+                paragraph = []
+        if paragraph:
+            yield '\n'.join(paragraph)
+    
     def _clean_text(self, text: str) -> str:
         """清理文本内容"""
         # 移除多余的空白字符
@@ -169,8 +305,10 @@ class FileProcessor:
     
     def _split_by_paragraphs(self, text: str, max_length: int = 2000) -> List[Dict[str, Any]]:
         """按段落分割文本"""
-        paragraphs = text.split('\n\n')
-        chapters = []
+        return list(self._iter_paragraph_chapters(text.split('\n\n'), max_length))
+    
+    def _iter_paragraph_chapters(self, paragraphs: Iterable[str], max_length: int = 2000) -> Iterator[Dict[str, Any]]:
+        """将段落依次合并为不超过 max_length 字符的章节"""
         current_chapter = ""
         chapter_count = 1
         
@@ -180,19 +318,17 @@ class FileProcessor:
                 continue
             
             if len(current_chapter) + len(paragraph) > max_length and current_chapter:
-                chapters.append({
+                yield {
                     'title': f'第{chapter_count}章',
                     'content': current_chapter.strip()
-                })
+                }
                 current_chapter = paragraph
                 chapter_count += 1
             else:
                 current_chapter += '\n\n' + paragraph if current_chapter else paragraph
         
         if current_chapter:
-            chapters.append({
+            yield {
                 'title': f'第{chapter_count}章',
                 'content': current_chapter.strip()
-            })
-        
-        return chapters
+            }
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+共享HTTP客户端
+进程内复用连接池，用于下载TTS生成的音频文件
+"""
+
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Optional, Tuple
+
+# 流式写入时每次读取的块大小
+DOWNLOAD_BLOCK_SIZE = 64 * 1024
+
+_http_session: Optional[requests.Session] = None
+_http_session_lock = threading.Lock()
+
+def get_http_session() -> requests.Session:
+    """获取进程内共享的HTTP会话（连接池大小读取 TTS_HTTP_POOL_SIZE 环境变量）"""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                pool_size = int(os.getenv('TTS_HTTP_POOL_SIZE', '16'))
+                # 仅对连接错误和网关类错误做少量重试，避免重复下载大文件
+                retry = Retry(
+                    total=2,
+                    connect=2,
+                    read=1,
+                    status_forcelist=(502, 503, 504),
+                    allowed_methods=frozenset(['GET']),
+                    backoff_factor=0.5
+                )
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _http_session = session
+    return _http_session
+
+def get_download_timeout() -> Tuple[float, float]:
+    """获取下载超时（连接超时, 读取超时），单位秒"""
+    return (
+        float(os.getenv('TTS_DOWNLOAD_CONNECT_TIMEOUT', '10')),
+        float(os.getenv('TTS_DOWNLOAD_READ_TIMEOUT', '60'))
+    )
+
+def download_to_file(url: str, filepath: str, block_size: int = DOWNLOAD_BLOCK_SIZE) -> int:
+    """流式下载到文件，返回写入的字节数
+    
+    先写入临时文件，完成后原子替换，避免留下不完整的音频文件。
+    """
+    temp_path = f"{filepath}.download"
+    written = 0
+    try:
+        with get_http_session().get(url, stream=True, timeout=get_download_timeout()) as response:
+            response.raise_for_status()
+            with open(temp_path, 'wb') as f:
+                for block in response.iter_content(chunk_size=block_size):
+                    if block:
+                        f.write(block)
+                        written += len(block)
+        os.replace(temp_path, filepath)
+        return written
+    except Exception:
+        if os.path.exists(temp_path):
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+        raise
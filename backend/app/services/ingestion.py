@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+文档解析流水线
+上传接口只保存文件，文本提取与章节分割提交到进程池执行，结果直接写入章节存储；
+解析进度通过进度跟踪器查询（/api/upload-status/<file_id>、/api/progress-stream/<task_id>）；
+解析完成前读取章节或生成音频的请求返回 409，避免在请求中重复同步解析
+"""
+
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Set
+from app.services.chapter_store import ChapterStore, get_chapter_store
+from app.services.document_catalog import get_document_catalog
+from app.services.job_runner import JobQueueFullError
+from app.services.progress_tracker import get_progress_tracker
+
+class DocumentIngestingError(Exception):
+    """文档仍在解析中，章节数据尚不可用"""
+    pass
+
+def ingest_document(upload_folder: str, file_id: str, file_path: str,
+                    original_filename: str, file_extension: str, pdf_workers: int = 1) -> Dict:
+    """提取文本、分割章节并写入章节存储（在解析进程中执行），返回章节数与文本长度（TXT文件另有编码及其置信度）"""
+    store = ChapterStore(upload_folder, pdf_workers)
+    index = store.extract(file_id, file_path, original_filename, file_extension, os.path.dirname(file_path))
+    result = {'total_chapters': len(index['chapters']), 'total_text_length': index['total_text_length']}
+    if 'encoding' in index:
+        result['encoding'] = index['encoding']
+        result['encoding_confidence'] = index['encoding_confidence']
+    return result
+
+class IngestionPipeline:
+    """文档解析流水线（有界进程池）"""
+    
+    def __init__(self, app, max_workers: int = 2, max_pending: int = 32):
+        """
+        Args:
+            max_workers: 解析进程数
+            max_pending: 最多允许的未完成解析任务数（执行中 + 排队中）
+        """
+        self.app = app
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(self.max_workers, int(max_pending))
+        self.progress_tracker = get_progress_tracker(app)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        # 文档ID -> 最近一次解析任务ID（进度记录过期后移除）
+        self._tasks: Dict[str, str] = {}
+        # 正在解析（执行中或排队中）的文档ID
+        self._ingesting: Set[str] = set()
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """获取进程池（需持有锁），解析进程异常退出后重新创建"""
+        if self._executor is None:
+            # 使用 spawn 启动解析进程，避免在多线程的服务进程中 fork
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+    
+    def submit(self, file_id: str, file_path: str, original_filename: str, file_extension: str) -> str:
+        """提交解析任务并返回任务ID，队列已满时抛出 JobQueueFullError"""
+        self._prune_tasks()
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFullError(f'解析队列已满（{self._pending}/{self.max_pending}），请稍后重试')
+            self._pending += 1
+        
+        task_id = self.progress_tracker.create_task(file_id)
+        self.progress_tracker.update_task_info(task_id, {'file_id': file_id, 'stage': 'ingest'})
+        self.progress_tracker.set_running(task_id, '正在解析文档...')
+        args = (
+            self.app.config['UPLOAD_FOLDER'], file_id, file_path, original_filename, file_extension,
+            self.app.config.get('PDF_WORKERS', 1)
+        )
+        try:
+            with self._lock:
+                try:
+                    future = self._get_executor().submit(ingest_document, *args)
+                except BrokenProcessPool:
+                    self._executor = None
+                    future = self._get_executor().submit(ingest_document, *args)
+                self._tasks[file_id] = task_id
+                self._ingesting.add(file_id)
+        except Exception as e:
+            with self._lock:
+                self._pending -= 1
+            self.progress_tracker.set_error(task_id, f'提交解析任务失败: {str(e)}')
+            raise
+        
+        future.add_done_callback(
+            lambda done: self._on_done(done, task_id, file_id, file_path, original_filename, file_extension)
+        )
+        return task_id
+    
+    def _on_done(self, future: Future, task_id: str, file_id: str, file_path: str,
+                 original_filename: str, file_extension: str):
+        """解析结束：登记文档目录并更新任务状态"""
+        with self._lock:
+            self._pending -= 1
+            # 章节数据已写入（或解析失败），此后的请求按章节数据是否存在处理
+            self._ingesting.discard(file_id)
+        
+        try:
+            result = future.result()
+        except BrokenProcessPool:
+            with self._lock:
+                self._executor = None
+            self.progress_tracker.set_error(task_id, '文档解析进程异常退出')
+            return
+        except Exception as e:
+            self.progress_tracker.set_error(task_id, f'文档解析失败: {str(e)}')
+            return
+        
+        try:
+            get_document_catalog(self.app).upsert_document(
+                file_id, original_filename, file_extension,
+                os.path.getsize(file_path), os.path.getmtime(file_path), result['total_chapters']
+            )
+        except Exception as e:
+            print(f"更新文档目录失败: {str(e)}")
+        
+        message = f"文档解析完成！成功提取 {result['total_text_length']} 字符文本，分为 {result['total_chapters']} 个章节。"
+        if result.get('encoding'):
+            message += f"（文本编码: {result['encoding']}，置信度 {result['encoding_confidence']:.0%}）"
+        self.progress_tracker.update_task_info(task_id, result)
+        self.progress_tracker.set_completed(task_id, [], message)
+    
+    def _prune_tasks(self):
+        """移除进度记录已过期的任务ID"""
+        with self._lock:
+            tasks = list(self._tasks.items())
+        expired = [(file_id, task_id) for file_id, task_id in tasks if self.progress_tracker.get_progress(task_id) is None]
+        with self._lock:
+            for file_id, task_id in expired:
+                if self._tasks.get(file_id) == task_id:
+                    del self._tasks[file_id]
+    
+    def is_ingesting(self, file_id: str) -> bool:
+        """文档是否仍在解析中"""
+        with self._lock:
+            return file_id in self._ingesting
+    
+    def ensure_ingested(self, file_id: str):
+        """文档仍在解析中时抛出 DocumentIngestingError"""
+        if self.is_ingesting(file_id):
+            raise DocumentIngestingError('文档正在解析中，请稍后重试')
+    
+    def get_status(self, file_id: str) -> Optional[Dict]:
+        """查询文档的解析状态，未知文档返回 None"""
+        with self._lock:
+            task_id = self._tasks.get(file_id)
+        progress = self.progress_tracker.get_progress(task_id) if task_id else None
+        if progress is not None:
+            return dict(progress, task_id=task_id, file_id=file_id)
+        
+        # 任务记录已过期或服务已重启：以章节数据是否存在为准
+        info = get_chapter_store(self.app).get_info(file_id)
+        if info is None:
+            return None
+        return {
+            'file_id': file_id,
+            'task_id': None,
+            'status': 'completed',
+            'progress': 100,
+            'message': '文档已解析',
+            'total_chapters': info['total_chapters'],
+            'total_text_length': info['total_text_length'],
+            'encoding': info['encoding'],
+            'encoding_confidence': info['encoding_confidence']
+        }
+    
+    def get_stats(self) -> Dict:
+        """获取流水线状态"""
+        with self._lock:
+            pending = self._pending
+        return {
+            'max_workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'pending': pending
+        }
+
+# 进程内共享的解析流水线
+_ingestion_pipeline: Optional[IngestionPipeline] = None
+_ingestion_pipeline_lock = threading.Lock()
+
+def get_ingestion_pipeline(app) -> IngestionPipeline:
+    """获取进程内共享的解析流水线"""
+    global _ingestion_pipeline
+    if _ingestion_pipeline is None:
+        with _ingestion_pipeline_lock:
+            if _ingestion_pipeline is None:
+                _ingestion_pipeline = IngestionPipeline(
+                    app,
+                    max_workers=app.config.get('INGEST_WORKERS', 2),
+                    max_pending=app.config.get('INGEST_MAX_PENDING', 32)
+                )
+    return _ingestion_pipeline
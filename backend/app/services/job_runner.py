@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+后台任务执行器
+在请求线程之外运行耗时任务（如整本书的音频生成）
+"""
+
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Dict, Optional
+
+class JobQueueFullError(Exception):
+    """任务队列已满，无法接收新任务"""
+    pass
+
+class JobRunner:
+    """后台任务执行器（有界线程池）"""
+    
+    def __init__(self, max_workers: int = 2, max_pending: int = 16):
+        """
+        Args:
+            max_workers: 同时执行的任务数
+            max_pending: 最多允许的未完成任务数（执行中 + 排队中）
+        """
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(self.max_workers, int(max_pending))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix='audio-job'
+        )
+        self._lock = threading.Lock()
+        self._pending = 0
+    
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """提交任务，队列已满时抛出 JobQueueFullError"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFullError(f'任务队列已满（{self._pending}/{self.max_pending}），请稍后重试')
+            self._pending += 1
+        
+        try:
+            future = self._executor.submit(self._run, func, *args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        
+        future.add_done_callback(self._on_done)
+        return future
+    
+    def _run(self, func: Callable, *args, **kwargs):
+        """执行任务，未捕获的异常只记录日志，不影响工作线程"""
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            print(f"后台任务执行失败: {str(e)}")
+            traceback.print_exc()
+            raise
+    
+    def _on_done(self, future: Future):
+        with self._lock:
+            self._pending -= 1
+    
+    def get_stats(self) -> Dict:
+        """获取执行器状态"""
+        with self._lock:
+            pending = self._pending
+        return {
+            'max_workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'pending': pending
+        }
+    
+    def shutdown(self, wait: bool = True):
+        """关闭执行器"""
+        self._executor.shutdown(wait=wait)
+
+# 进程内共享的任务执行器
+_job_runner: Optional[JobRunner] = None
+_job_runner_lock = threading.Lock()
+
+def get_job_runner(app) -> JobRunner:
+    """获取进程内共享的任务执行器实例"""
+    global _job_runner
+    if _job_runner is None:
+        with _job_runner_lock:
+            if _job_runner is None:
+                _job_runner = JobRunner(
+                    max_workers=app.config.get('AUDIO_JOB_WORKERS', 2),
+                    max_pending=app.config.get('AUDIO_JOB_MAX_PENDING', 16)
+                )
+    return _job_runner
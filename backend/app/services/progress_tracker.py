@@ -2,55 +2,324 @@
 """
 进度跟踪器
 处理任务进度跟踪
+任务的完整状态保存在存储中；状态事件只记录变化的字段，完整状态由 SSE 的 snapshot 事件在连接或续传时发送
 """
 
+import os
+import json
 import time
-from typing import Dict, Optional
+import uuid
+import sqlite3
+import threading
+from collections import deque
+from typing import Dict, List, Optional
 
-class ProgressTracker:
-    """进度跟踪器"""
+# 已结束任务的状态
+FINISHED_STATUSES = ('completed', 'error')
+
+# 每个任务保留的最近事件数（用于 SSE 断线续传）
+MAX_EVENTS_PER_TASK = 500
+
+class MemoryProgressStore:
+    """进程内存储（默认）"""
     
     def __init__(self):
-        self.progress_data = {}  # 存储进度信息
+        self._data: Dict[str, Dict] = {}
+        self._events: Dict[str, deque] = {}
+    
+    def get(self, task_id: str) -> Optional[Dict]:
+        data = self._data.get(task_id)
+        return json.loads(json.dumps(data)) if data is not None else None
+    
+    def put(self, task_id: str, data: Dict):
+        self._data[task_id] = json.loads(json.dumps(data))
+    
+    def evict(self, finished_before: float, stale_before: float) -> int:
+        expired = [
+            task_id for task_id, data in self._data.items()
+            if (data['status'] in FINISHED_STATUSES and data['updated_at'] < finished_before)
+            or data['updated_at'] < stale_before
+        ]
+        for task_id in expired:
+            del self._data[task_id]
+            self._events.pop(task_id, None)
+        return len(expired)
+    
+    def list_unfinished(self) -> List[Dict]:
+        return [
+            dict(json.loads(json.dumps(data)), task_id=task_id)
+            for task_id, data in self._data.items() if data['status'] not in FINISHED_STATUSES
+        ]
+    
+    def append_event(self, task_id: str, event: Dict):
+        events = self._events.setdefault(task_id, deque(maxlen=MAX_EVENTS_PER_TASK))
+        events.append(json.loads(json.dumps(event)))
+    
+    def get_events(self, task_id: str, after_id: int) -> List[Dict]:
+        return [dict(event) for event in self._events.get(task_id, ()) if event['id'] > after_id]
+
+class SqliteProgressStore:
+    """SQLite存储：任务状态在重启后保留，并可被多个工作进程读取"""
+    
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS progress_tasks ('
+            ' task_id TEXT PRIMARY KEY,'
+            ' status TEXT NOT NULL,'
+            ' updated_at REAL NOT NULL,'
+            ' data TEXT NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_progress_tasks_updated ON progress_tasks(updated_at)')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS progress_events ('
+            ' task_id TEXT NOT NULL,'
+            ' event_id INTEGER NOT NULL,'
+            ' event_type TEXT NOT NULL,'
+            ' data TEXT NOT NULL,'
+            ' PRIMARY KEY (task_id, event_id))'
+        )
+        self._conn.commit()
+    
+    def get(self, task_id: str) -> Optional[Dict]:
+        row = self._conn.execute('SELECT data FROM progress_tasks WHERE task_id = ?', (task_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def put(self, task_id: str, data: Dict):
+        with self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO progress_tasks (task_id, status, updated_at, data) VALUES (?, ?, ?, ?)',
+                (task_id, data['status'], data['updated_at'], json.dumps(data, ensure_ascii=False))
+            )
+    
+    def evict(self, finished_before: float, stale_before: float) -> int:
+        with self._conn:
+            cursor = self._conn.execute(
+                'DELETE FROM progress_tasks WHERE (status IN (?, ?) AND updated_at < ?) OR updated_at < ?',
+                FINISHED_STATUSES + (finished_before, stale_before)
+            )
+            self._conn.execute(
+                'DELETE FROM progress_events WHERE task_id NOT IN (SELECT task_id FROM progress_tasks)'
+            )
+        return cursor.rowcount
+    
+    def list_unfinished(self) -> List[Dict]:
+        rows = self._conn.execute(
+            'SELECT task_id, data FROM progress_tasks WHERE status NOT IN (?, ?)', FINISHED_STATUSES
+        ).fetchall()
+        return [dict(json.loads(row[1]), task_id=row[0]) for row in rows]
+    
+    def append_event(self, task_id: str, event: Dict):
+        with self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO progress_events (task_id, event_id, event_type, data) VALUES (?, ?, ?, ?)',
+                (task_id, event['id'], event['type'], json.dumps(event['data'], ensure_ascii=False))
+            )
+            self._conn.execute(
+                'DELETE FROM progress_events WHERE task_id = ? AND event_id <= ?',
+                (task_id, event['id'] - MAX_EVENTS_PER_TASK)
+            )
+    
+    def get_events(self, task_id: str, after_id: int) -> List[Dict]:
+        rows = self._conn.execute(
+            'SELECT event_id, event_type, data FROM progress_events WHERE task_id = ? AND event_id > ? ORDER BY event_id',
+            (task_id, after_id)
+        ).fetchall()
+        return [{'id': row[0], 'type': row[1], 'data': json.loads(row[2])} for row in rows]
+
+class ProgressTracker:
+    """进度跟踪器（线程安全）"""
+    
+    def __init__(self, store=None, ttl_seconds: int = 3600, stale_seconds: int = 86400):
+        """
+        Args:
+            store: 任务状态存储，默认为进程内存储
+            ttl_seconds: 已结束任务的保留时间
+            stale_seconds: 长时间无更新的未结束任务（如进程崩溃遗留）的保留时间
+        """
+        self.store = store or MemoryProgressStore()
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._lock = threading.Lock()
+        self._events_changed = threading.Condition(self._lock)
+        self._last_eviction = 0.0
+        self.fail_interrupted_tasks()
+    
+    def fail_interrupted_tasks(self) -> int:
+        """将上次运行遗留的未结束任务标记为出错（任务随进程退出而中断），返回标记的数量
+        
+        只处理创建任务的进程已不存在的任务（与当前进程同号的视为上次运行遗留），
+        共用 SQLite 存储的其他工作进程中仍在执行的任务不受影响。
+        """
+        interrupted = 0
+        for data in self.store.list_unfinished():
+            worker_pid = data.get('worker_pid')
+            if worker_pid and worker_pid != os.getpid() and _is_process_alive(worker_pid):
+                continue
+            self.set_error(data['task_id'], '服务重启，任务已中断')
+            interrupted += 1
+        return interrupted
     
     def create_task(self, file_id: str) -> str:
         """创建新任务"""
-        task_id = f"{file_id}_{int(time.time())}"
+        task_id = f"{file_id}_{uuid.uuid4().hex[:12]}"
+        now = time.time()
         
-        self.progress_data[task_id] = {
-            'progress': 0,
-            'message': '正在初始化...',
-            'status': 'running',
-            'audio_files': []
-        }
+        with self._lock:
+            self.store.put(task_id, {
+                'progress': 0,
+                'message': '任务已排队，等待执行...',
+                'status': 'queued',
+                'audio_files': [],
+                'created_at': now,
+                'updated_at': now,
+                'last_event_id': 0,
+                'worker_pid': os.getpid()
+            })
         
+        self._maybe_evict()
         return task_id
     
+    def _update(self, task_id: str, changes: Dict, event_type: str = 'progress'):
+        """在锁内读取、修改并写回任务状态，同时记录一条只含变化字段的状态事件"""
+        with self._lock:
+            data = self.store.get(task_id)
+            if data is None:
+                return
+            data.update(changes)
+            data['updated_at'] = time.time()
+            self._append_event_locked(task_id, data, event_type, self._state_delta(data, changes))
+    
+    def _state_delta(self, data: Dict, changes: Dict) -> Dict:
+        """状态事件内容：变化的字段，附带当前状态、进度与消息"""
+        delta = dict(changes)
+        for key in ('status', 'progress', 'message'):
+            delta[key] = data.get(key)
+        return delta
+    
+    def _append_event_locked(self, task_id: str, data: Dict, event_type: str, payload: Dict):
+        """写回任务状态并追加事件（需持有锁）"""
+        event_id = data.get('last_event_id', 0) + 1
+        data['last_event_id'] = event_id
+        self.store.put(task_id, data)
+        self.store.append_event(task_id, {
+            'id': event_id,
+            'type': event_type,
+            'data': payload
+        })
+        self._events_changed.notify_all()
+    
+    def add_event(self, task_id: str, event_type: str, payload: Dict):
+        """记录一条自定义事件（如分段完成、章节完成）"""
+        with self._lock:
+            data = self.store.get(task_id)
+            if data is None:
+                return
+            data['updated_at'] = time.time()
+            self._append_event_locked(task_id, data, event_type, payload)
+    
+    def get_events(self, task_id: str, after_id: int) -> List[Dict]:
+        """获取指定事件ID之后的事件"""
+        with self._lock:
+            return self.store.get_events(task_id, after_id)
+    
+    def wait_for_events(self, task_id: str, after_id: int, timeout: float) -> List[Dict]:
+        """等待指定事件ID之后的新事件，超时返回空列表
+        
+        同一进程内的更新会立即唤醒等待者；其他进程写入 SQLite 的更新通过定期检查发现。
+        """
+        deadline = time.time() + timeout
+        with self._lock:
+            while True:
+                events = self.store.get_events(task_id, after_id)
+                remaining = deadline - time.time()
+                if events or remaining <= 0:
+                    return events
+                self._events_changed.wait(min(remaining, 1.0))
+    
+    def set_running(self, task_id: str, message: str = '正在初始化...'):
+        """设置为执行中状态"""
+        self._update(task_id, {'status': 'running', 'message': message})
+    
     def update_progress(self, task_id: str, progress: int, message: str):
         """更新进度"""
-        if task_id in self.progress_data:
-            self.progress_data[task_id]['progress'] = progress
-            self.progress_data[task_id]['message'] = message
+        self._update(task_id, {'progress': progress, 'message': message})
+    
+    def update_task_info(self, task_id: str, info: Dict):
+        """附加任务信息（如跳过的章节数）"""
+        self._update(task_id, dict(info))
     
     def set_error(self, task_id: str, error_message: str):
         """设置错误状态"""
-        if task_id in self.progress_data:
-            self.progress_data[task_id]['status'] = 'error'
-            self.progress_data[task_id]['message'] = error_message
+        self._update(task_id, {'status': 'error', 'message': error_message}, 'failed')
     
-    def set_completed(self, task_id: str, audio_files: list):
+    def set_completed(self, task_id: str, audio_files: list, message: str = '音频生成完成！'):
         """设置完成状态"""
-        if task_id in self.progress_data:
-            self.progress_data[task_id]['status'] = 'completed'
-            self.progress_data[task_id]['progress'] = 100
-            self.progress_data[task_id]['message'] = '音频生成完成！'
-            self.progress_data[task_id]['audio_files'] = audio_files
+        self._update(task_id, {
+            'status': 'completed',
+            'progress': 100,
+            'message': message,
+            'audio_files': audio_files
+        }, 'completed')
     
     def get_progress(self, task_id: str) -> Optional[Dict]:
         """获取进度信息"""
-        return self.progress_data.get(task_id)
+        self._maybe_evict()
+        with self._lock:
+            return self.store.get(task_id)
     
     def add_audio_file(self, task_id: str, audio_file: Dict):
         """添加音频文件到任务"""
-        if task_id in self.progress_data:
-            self.progress_data[task_id]['audio_files'].append(audio_file)
+        with self._lock:
+            data = self.store.get(task_id)
+            if data is None:
+                return
+            data['audio_files'].append(audio_file)
+            data['updated_at'] = time.time()
+            self._append_event_locked(task_id, data, 'progress', self._state_delta(data, {'audio_file': audio_file}))
+    
+    def _maybe_evict(self):
+        """按TTL清理过期任务（最多每分钟执行一次）"""
+        now = time.time()
+        if now - self._last_eviction < 60:
+            return
+        with self._lock:
+            self._last_eviction = now
+            try:
+                self.store.evict(now - self.ttl_seconds, now - self.stale_seconds)
+            except Exception as e:
+                print(f"清理过期任务失败: {str(e)}")
+
+def _is_process_alive(pid: int) -> bool:
+    """进程是否仍在运行（Windows 上 os.kill 会终止进程，无法探测，视为仍在运行）"""
+    if os.name == 'nt':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # 进程存在但无权发送信号（或平台不支持），视为仍在运行
+        return True
+    return True
+
+# 进程内共享的进度跟踪器
+_progress_tracker: Optional[ProgressTracker] = None
+_progress_tracker_lock = threading.Lock()
+
+def get_progress_tracker(app) -> ProgressTracker:
+    """获取进程内共享的进度跟踪器实例，所有路由共用同一份任务状态"""
+    global _progress_tracker
+    if _progress_tracker is None:
+        with _progress_tracker_lock:
+            if _progress_tracker is None:
+                store = None
+                if app.config.get('PROGRESS_STORE', 'memory') == 'sqlite':
+                    store = SqliteProgressStore(app.config['PROGRESS_DB_PATH'])
+                _progress_tracker = ProgressTracker(
+                    store=store,
+                    ttl_seconds=app.config.get('PROGRESS_TTL_SECONDS', 3600)
+                )
+    return _progress_tracker
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+TTS调用限流器
+进程内所有TTS调用（章节级与分段级）共享同一限流器：
+- 令牌桶限制请求速率
+- 根据限流情况以AIMD方式自适应调整并发上限
+- 对429/5xx/限流错误码及网络异常进行带抖动的指数退避重试，其余错误直接返回或抛出
+"""
+
+import os
+import time
+import random
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+import requests
+
+# 需要重试的HTTP状态码
+THROTTLE_STATUS_CODES = (429,)
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# 需要重试的异常（网络传输错误），其他异常直接抛出
+RETRYABLE_EXCEPTIONS = (requests.RequestException, ConnectionError, TimeoutError)
+
+class ConcurrencyLimiter:
+    """并发限制器（可在运行时调整上限）"""
+    
+    def __init__(self, limit: int):
+        self._limit = max(1, int(limit))
+        self._in_flight = 0
+        self._cond = threading.Condition()
+    
+    @property
+    def limit(self) -> int:
+        return self._limit
+    
+    def set_limit(self, limit: int):
+        """调整并发上限，已占用的名额不受影响"""
+        with self._cond:
+            self._limit = max(1, int(limit))
+            self._cond.notify_all()
+    
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= self._limit:
+                self._cond.wait()
+            self._in_flight += 1
+    
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+    
+    @contextmanager
+    def slot(self):
+        """占用一个并发名额"""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+    
+    def get_stats(self) -> Dict:
+        with self._cond:
+            return {
+                'limit': self._limit,
+                'in_flight': self._in_flight
+            }
+
+class TokenBucket:
+    """令牌桶：平均速率 rate 次/秒，允许 burst 次突发"""
+    
+    def __init__(self, rate: float, burst: int):
+        self.rate = max(0.01, float(rate))
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """取出一个令牌，不足时阻塞等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+class TTSRateLimiter:
+    """TTS调用限流器：令牌桶 + AIMD并发控制 + 指数退避重试"""
+    
+    def __init__(self, rate: float = 5.0, burst: int = 10, max_concurrency: int = 6,
+                 min_concurrency: int = 1, max_retries: int = 5,
+                 backoff_base: float = 0.5, backoff_max: float = 30.0):
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = ConcurrencyLimiter(max_concurrency)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.min_concurrency = max(1, min(int(min_concurrency), self.max_concurrency))
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        
+        self._lock = threading.Lock()
+        self._success_streak = 0
+        self._last_decrease_at = 0.0
+        self.total_calls = 0
+        self.throttled_calls = 0
+        self.retried_calls = 0
+    
+    def call(self, func: Callable[[], Any]) -> Any:
+        """按限流策略执行一次API调用
+        
+        func 返回带 status_code 的响应对象。遇到429/5xx、限流错误码或网络异常时
+        退避后重试，重试耗尽时返回最后一次响应（或抛出最后一次异常）；其他异常直接抛出。
+        其他4xx响应直接返回，不计入并发上限的调整。
+        """
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            response = None
+            error = None
+            try:
+                with self.concurrency.slot():
+                    try:
+                        response = func()
+                    except RETRYABLE_EXCEPTIONS as e:
+                        error = e
+            finally:
+                with self._lock:
+                    self.total_calls += 1
+            
+            status_code = getattr(response, 'status_code', None) if error is None else None
+            throttled = status_code in THROTTLE_STATUS_CODES or self._is_throttle_response(response)
+            if error is None and not throttled and status_code not in RETRYABLE_STATUS_CODES:
+                if not self._is_client_error(status_code):
+                    self._on_success()
+                return response
+            
+            if throttled:
+                self._on_throttle()
+            
+            if attempt >= self.max_retries:
+                if error is not None:
+                    raise error
+                return response
+            
+            time.sleep(self._backoff_delay(attempt))
+            attempt += 1
+            with self._lock:
+                self.retried_calls += 1
+    
+    def _is_client_error(self, status_code) -> bool:
+        """4xx（参数错误、鉴权失败等）重试无意义，也不代表服务端有余量"""
+        return isinstance(status_code, int) and 400 <= status_code < 500
+    
+    def _is_throttle_response(self, response) -> bool:
+        """DashScope 在限流时返回的错误码以 Throttling 开头"""
+        code = getattr(response, 'code', None)
+        return isinstance(code, str) and code.startswith('Throttling')
+    
+    def _backoff_delay(self, attempt: int) -> float:
+        """全抖动指数退避"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+    
+    def _on_success(self):
+        """加性增：连续成功达到当前并发数后上限 +1"""
+        with self._lock:
+            self._success_streak += 1
+            limit = self.concurrency.limit
+            if limit < self.max_concurrency and self._success_streak >= limit:
+                self._success_streak = 0
+                self.concurrency.set_limit(limit + 1)
+    
+    def _on_throttle(self):
+        """乘性减：被限流时并发上限减半（同一退避窗口内只减一次）"""
+        with self._lock:
+            self.throttled_calls += 1
+            self._success_streak = 0
+            now = time.monotonic()
+            if now - self._last_decrease_at < self.backoff_base:
+                return
+            self._last_decrease_at = now
+            limit = self.concurrency.limit
+            self.concurrency.set_limit(max(self.min_concurrency, limit // 2))
+    
+    def get_stats(self) -> Dict:
+        """获取限流器状态"""
+        with self._lock:
+            stats = {
+                'rate_per_second': self.bucket.rate,
+                'burst': self.bucket.burst,
+                'max_concurrency': self.max_concurrency,
+                'min_concurrency': self.min_concurrency,
+                'total_calls': self.total_calls,
+                'throttled_calls': self.throttled_calls,
+                'retried_calls': self.retried_calls
+            }
+        concurrency = self.concurrency.get_stats()
+        stats['concurrency_limit'] = concurrency['limit']
+        stats['in_flight'] = concurrency['in_flight']
+        return stats
+
+# 进程内共享的TTS限流器
+_tts_limiter: Optional[TTSRateLimiter] = None
+_tts_limiter_lock = threading.Lock()
+
+def get_tts_limiter() -> TTSRateLimiter:
+    """获取进程内共享的TTS限流器（参数读取 TTS_* 环境变量）"""
+    global _tts_limiter
+    if _tts_limiter is None:
+        with _tts_limiter_lock:
+            if _tts_limiter is None:
+                _tts_limiter = TTSRateLimiter(
+                    rate=float(os.getenv('TTS_RATE_PER_SECOND', '5')),
+                    burst=int(os.getenv('TTS_RATE_BURST', '10')),
+                    max_concurrency=int(os.getenv('TTS_MAX_CONCURRENCY', '6')),
+                    min_concurrency=int(os.getenv('TTS_MIN_CONCURRENCY', '1')),
+                    max_retries=int(os.getenv('TTS_MAX_RETRIES', '5')),
+                    backoff_base=float(os.getenv('TTS_BACKOFF_BASE', '0.5')),
+                    backoff_max=float(os.getenv('TTS_BACKOFF_MAX', '30'))
+                )
+    return _tts_limiter
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+文本编码检测
+先检查BOM，再只对文件开头的样本尝试候选编码，选定编码后整个文件只需解码一次
+"""
+
+import codecs
+from typing import Dict, List, Optional
+
+# 检测编码时读取的文件开头字节数
+ENCODING_SAMPLE_BYTES = 64 * 1024
+
+# 解码失败时依次尝试的编码（gb18030 兼容 gbk 与 gb2312；latin-1 可解码任意字节，作为最后的兜底）
+TXT_ENCODINGS = ['utf-8', 'gb18030', 'latin-1']
+
+# BOM 与对应的编码（UTF-32 的BOM以UTF-16的BOM开头，需先检查）
+BOM_ENCODINGS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16')
+]
+
+# 样本按 gb18030 解码后，常用字符（GB2312字符集）占非ASCII字符的比例不低于该值才视为中文编码
+GB_MIN_COMMON_RATIO = 0.5
+
+# 兜底编码 latin-1 的置信度
+FALLBACK_CONFIDENCE = 0.3
+
+def detect_encoding(file_path: str, sample_bytes: int = ENCODING_SAMPLE_BYTES) -> Dict:
+    """检测文本文件编码，返回 {'encoding', 'confidence', 'bom'}
+    
+    confidence 为0到1之间的估计值：有BOM时为1；样本含有合法的UTF-8多字节字符时为0.99；
+    样本只有ASCII时为0.5（后续内容仍可能是其他编码）；gb18030 为样本中常用汉字与中文标点的比例
+    （西文单字节编码的文本也常能按 gb18030 解码，但解码出的多为生僻字）。
+    """
+    with open(file_path, 'rb') as f:
+        sample = f.read(sample_bytes)
+    
+    for bom, encoding in BOM_ENCODINGS:
+        if sample.startswith(bom):
+            return {'encoding': encoding, 'confidence': 1.0, 'bom': True}
+    
+    if sample.isascii():
+        return {'encoding': 'utf-8', 'confidence': 0.5, 'bom': False}
+    
+    if _decode_sample(sample, 'utf-8') is not None:
+        return {'encoding': 'utf-8', 'confidence': 0.99, 'bom': False}
+    
+    text = _decode_sample(sample, 'gb18030')
+    if text is not None:
+        ratio = _common_gb_ratio(text)
+        if ratio >= GB_MIN_COMMON_RATIO:
+            return {'encoding': 'gb18030', 'confidence': round(ratio, 2), 'bom': False}
+    
+    return {'encoding': 'latin-1', 'confidence': FALLBACK_CONFIDENCE, 'bom': False}
+
+def get_candidate_encodings(detected: str) -> List[str]:
+    """解码失败时依次尝试的编码：检测结果优先，其余按默认顺序"""
+    return [detected] + [encoding for encoding in TXT_ENCODINGS if encoding != detected]
+
+def _decode_sample(sample: bytes, encoding: str) -> Optional[str]:
+    """解码样本（末尾被截断的多字节字符不视为错误），无法解码时返回 None"""
+    try:
+        return codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return None
+
+def _common_gb_ratio(text: str) -> float:
+    """非ASCII字符中属于GB2312字符集（常用汉字与中文标点）的比例"""
+    non_ascii = [char for char in text if ord(char) > 0x7f]
+    common = 0
+    for char in non_ascii:
+        try:
+            char.encode('gb2312')
+            common += 1
+        except UnicodeEncodeError:
+            pass
+    return common / len(non_ascii) if non_ascii else 0.0
@@ -6,16 +6,27 @@
 """
 
 import os
-import requests
+import uuid
 import dashscope
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, Any, List, Callable, Optional
 from dotenv import load_dotenv
+from app.services.rate_limiter import get_tts_limiter
+from app.services.tts_cache import TTSCache, make_cache_key
+from app.services.http_client import download_to_file
+from app.services.chunk_manifest import ChunkManifest
+from app.utils.wav_utils import concatenate_wav_files
 
 class SimpleTextToSpeechService:
     """简化的文本转语音服务类（不依赖pydub）"""
     
-    def __init__(self):
-        """初始化服务"""
+    def __init__(self, chunk_concurrency: Optional[int] = None, cache: Optional[TTSCache] = None):
+        """初始化服务
+        
+        Args:
+            chunk_concurrency: 长文本分段时同时进行的API调用数，默认读取 TTS_CHUNK_CONCURRENCY 环境变量
+            cache: TTS结果缓存，为 None 时不使用缓存
+        """
         # 尝试从环境变量加载，如果失败则使用默认值
         try:
             load_dotenv()
@@ -28,6 +39,11 @@ class SimpleTextToSpeechService:
         
         # 设置DashScope API密钥
         dashscope.api_key = self.api_key
+        
+        if chunk_concurrency is None:
+            chunk_concurrency = int(os.getenv('TTS_CHUNK_CONCURRENCY', '4'))
+        self.chunk_concurrency = max(1, int(chunk_concurrency))
+        self.cache = cache
     
     def get_default_settings(self) -> Dict[str, Any]:
         """获取默认语音设置"""
@@ -59,16 +75,19 @@ class SimpleTextToSpeechService:
             settings = self.get_default_settings()
         
         try:
-            # 使用官方文档的最新调用方式
-            response = dashscope.audio.qwen_tts.SpeechSynthesizer.call(
-                model=settings.get('model', 'qwen-tts-latest'),
-                api_key=self.api_key,
-                text=text,
-                voice=settings['voice'],
-                format=settings.get('format', 'wav'),
-                sample_rate=settings.get('sample_rate', 16000),
-                speed=settings.get('speed', 1.0),  # 添加语速参数
-                volume=settings.get('volume', 0)    # 添加音量参数
+            # 通过进程内共享的限流器调用：限速、自适应并发，并对429/5xx退避重试
+            response = get_tts_limiter().call(
+                # 使用官方文档的最新调用方式
+                lambda: dashscope.audio.qwen_tts.SpeechSynthesizer.call(
+                    model=settings.get('model', 'qwen-tts-latest'),
+                    api_key=self.api_key,
+                    text=text,
+                    voice=settings['voice'],
+                    format=settings.get('format', 'wav'),
+                    sample_rate=settings.get('sample_rate', 16000),
+                    speed=settings.get('speed', 1.0),  # 添加语速参数
+                    volume=settings.get('volume', 0)    # 添加音量参数
+                )
             )
             
             if response.status_code == 200:
@@ -77,27 +96,79 @@ class SimpleTextToSpeechService:
                 return audio_url
             else:
                 raise Exception(f"API调用失败: {response.status_code} - {response.message}")
-                
+        
         except Exception as e:
             raise Exception(f"API调用异常: {str(e)}")
     
     def download_audio(self, audio_url: str, filepath: str) -> str:
         """下载音频文件"""
         try:
-            audio_response = requests.get(audio_url)
-            audio_response.raise_for_status()
-            
-            # 保存音频文件
-            with open(filepath, 'wb') as f:
-                f.write(audio_response.content)
-            
+            # 复用共享连接池，按块流式写入磁盘
+            download_to_file(audio_url, filepath)
             return filepath
         except Exception as e:
             raise Exception(f"下载音频文件失败: {str(e)}")
     
+    def synthesize_to_file(self, text: str, filepath: str, settings: Dict[str, Any] = None,
+                           progress_callback: Optional[Callable[[int, str], None]] = None) -> str:
+        """合成单段文本并保存到文件，优先使用缓存"""
+        cache_key = None
+        if self.cache is not None:
+            cache_key = make_cache_key(text, settings)
+            if self.cache.fetch(cache_key, filepath):
+                return filepath
+        
+        audio_url = self.generate_audio_url(text, settings)
+        
+        if progress_callback:
+            progress_callback(50, "正在下载音频文件...")
+        
+        result = self.download_audio(audio_url, filepath)
+        
+        if cache_key is not None:
+            self.cache.store(cache_key, result)
+        
+        return result
+    
+    def warm_cache(self, text: str, settings: Dict[str, Any] = None, max_length: int = 500) -> Dict[str, int]:
+        """预热缓存：按生成时相同的分段方式合成尚未缓存的片段"""
+        if self.cache is None:
+            raise Exception('TTS缓存未启用')
+        
+        text_chunks = self._split_text(text, max_length)
+        missing_chunks = [
+            chunk for chunk in text_chunks
+            if not self.cache.contains(make_cache_key(chunk, settings))
+        ]
+        
+        def warm_chunk(chunk: str):
+            temp_path = os.path.join(self.cache.cache_folder, f"warm_{uuid.uuid4().hex}.wav")
+            try:
+                self.synthesize_to_file(chunk, temp_path, settings)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        
+        if missing_chunks:
+            max_workers = min(self.chunk_concurrency, len(missing_chunks))
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tts-warm') as executor:
+                for future in [executor.submit(warm_chunk, chunk) for chunk in missing_chunks]:
+                    future.result()
+        
+        return {
+            'total_chunks': len(text_chunks),
+            'already_cached': len(text_chunks) - len(missing_chunks),
+            'synthesized': len(missing_chunks)
+        }
+    
     def generate_and_save_audio(self, text: str, filepath: str, settings: Dict[str, Any] = None, 
-                               progress_callback: Optional[Callable[[int, str], None]] = None) -> str:
-        """生成并保存音频文件（带进度回调）"""
+                               progress_callback: Optional[Callable[[int, str], None]] = None,
+                               chunk_callback: Optional[Callable[[int, int, str, str], None]] = None) -> str:
+        """生成并保存音频文件（带进度回调）
+        
+        chunk_callback 在每段音频生成完成后调用，参数为（分段索引, 总段数, 分段音频文件, 分段缓存键），
+        分段音频文件为相对 filepath 所在目录的路径
+        """
         # 检查文本长度，如果超过限制则分割
         max_text_length = 500  # QWEN-TTS建议的文本长度限制
         
@@ -106,12 +177,9 @@ class SimpleTextToSpeechService:
             if progress_callback:
                 progress_callback(10, "正在生成音频...")
             
-            audio_url = self.generate_audio_url(text, settings)
-            
-            if progress_callback:
-                progress_callback(50, "正在下载音频文件...")
-            
-            result = self.download_audio(audio_url, filepath)
+            result = self.synthesize_to_file(text, filepath, settings, progress_callback)
+            if chunk_callback:
+                chunk_callback(0, 1, os.path.basename(filepath), make_cache_key(text, settings))
             
             if progress_callback:
                 progress_callback(100, "音频生成完成！")
@@ -119,10 +187,11 @@ class SimpleTextToSpeechService:
             return result
         else:
             # 文本过长，需要分割处理
-            return self._generate_long_text_audio(text, filepath, settings, max_text_length, progress_callback)
+            return self._generate_long_text_audio(text, filepath, settings, max_text_length, progress_callback, chunk_callback)
     
     def _generate_long_text_audio(self, text: str, filepath: str, settings: Dict[str, Any] = None, 
-                                 max_length: int = 500, progress_callback: Optional[Callable[[int, str], None]] = None) -> str:
+                                 max_length: int = 500, progress_callback: Optional[Callable[[int, str], None]] = None,
+                                 chunk_callback: Optional[Callable[[int, int, str, str], None]] = None) -> str:
         """处理长文本的音频生成（带进度回调）"""
         try:
             if progress_callback:
@@ -136,56 +205,76 @@ class SimpleTextToSpeechService:
                 if progress_callback:
                     progress_callback(10, "正在生成音频...")
                 
-                audio_url = self.generate_audio_url(text_chunks[0], settings)
-                
-                if progress_callback:
-                    progress_callback(50, "正在下载音频文件...")
-                
-                result = self.download_audio(audio_url, filepath)
+                result = self.synthesize_to_file(text_chunks[0], filepath, settings, progress_callback)
+                if chunk_callback:
+                    chunk_callback(0, 1, os.path.basename(filepath), make_cache_key(text_chunks[0], settings))
                 
                 if progress_callback:
                     progress_callback(100, "音频生成完成！")
                 
                 return result
             
-            # 多段文本，分别生成后合并
-            audio_files = []
+            # 多段文本，并发生成后按原顺序合并
+            # 已完成的分段记录在清单中，重试时只合成缺失的分段
             total_chunks = len(text_chunks)
-            
-            for i, chunk in enumerate(text_chunks):
-                # 计算当前进度
-                chunk_progress = 10 + (i / total_chunks) * 70  # 10%-80%
+            with ChunkManifest.open(os.path.dirname(filepath), text, text_chunks, settings) as manifest:
+                audio_files = [manifest.part_path(i) for i in range(total_chunks)]
+                pending_indices = [i for i in range(total_chunks) if not manifest.is_completed(i)]
+                reused = total_chunks - len(pending_indices)
+                max_workers = max(1, min(self.chunk_concurrency, len(pending_indices)))
                 
                 if progress_callback:
-                    progress_callback(int(chunk_progress), f"正在生成第 {i+1}/{total_chunks} 段音频...")
+                    if reused:
+                        progress_callback(10, f"已复用 {reused} 段已完成的音频，正在生成剩余 {len(pending_indices)} 段（并发 {max_workers}）...")
+                    else:
+                        progress_callback(10, f"正在生成 {total_chunks} 段音频（并发 {max_workers}）...")
                 
-                # 为每段生成临时音频文件
-                temp_filename = f"{filepath}_part_{i+1}.wav"
-                audio_url = self.generate_audio_url(chunk, settings)
-                temp_file = self.download_audio(audio_url, temp_filename)
-                audio_files.append(temp_file)
-            
-            if progress_callback:
-                progress_callback(85, "正在合并音频文件...")
-            
-            # 合并音频文件
-            merged_file = self._merge_audio_files(audio_files, filepath)
-            
-            if progress_callback:
-                progress_callback(95, "正在清理临时文件...")
-            
-            # 清理临时文件
-            for temp_file in audio_files:
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
+                def synthesize_chunk(i: int) -> str:
+                    return self.synthesize_to_file(text_chunks[i], manifest.part_path(i), settings)
+                
+                with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tts-chunk') as executor:
+                    futures = {
+                        executor.submit(synthesize_chunk, i): i
+                        for i in pending_indices
+                    }
+                    completed = reused
+                    try:
+                        for future in as_completed(futures):
+                            future.result()
+                            index = futures[future]
+                            manifest.mark_completed(index)
+                            completed += 1
+                            if chunk_callback:
+                                # 分段文件在合并前保留在章节的工作目录中
+                                chunk_file = os.path.relpath(manifest.part_path(index), os.path.dirname(filepath))
+                                chunk_callback(index, total_chunks, chunk_file, make_cache_key(text_chunks[index], settings))
+                            
+                            if progress_callback:
+                                chunk_progress = 10 + (completed / total_chunks) * 70  # 10%-80%
+                                progress_callback(int(chunk_progress), f"已完成第 {completed}/{total_chunks} 段音频...")
+                    except Exception as e:
+                        # 任一段失败则取消尚未开始的分段，已完成的分段保留在清单中供重试复用
+                        for pending in futures:
+                            pending.cancel()
+                        raise Exception(f"{str(e)}（已保存 {manifest.completed_count}/{total_chunks} 段，重试时将继续生成）")
+                
+                if progress_callback:
+                    progress_callback(85, "正在合并音频文件...")
+                
+                # 合并音频文件
+                merged_file = self._merge_audio_files(audio_files, filepath)
+                
+                if progress_callback:
+                    progress_callback(95, "正在清理临时文件...")
+                
+                # 清理分段工作目录
+                manifest.discard()
             
             if progress_callback:
                 progress_callback(100, "音频生成完成！")
             
             return merged_file
-            
+        
         except Exception as e:
             raise Exception(f"长文本音频生成失败: {str(e)}")
     
@@ -220,18 +309,13 @@ class SimpleTextToSpeechService:
         return [s.strip() + '。' for s in sentences if s.strip()]
     
     def _merge_audio_files(self, audio_files: List[str], output_filepath: str) -> str:
-        """合并多个音频文件"""
+        """合并多个音频文件
+        
+        解析各分段的RIFF块（跳过 LIST 等附加块）定位PCM数据，按块复制后
+        写入一次描述全部数据的正确文件头，合并后的时长与可拖动范围均准确。
+        """
         try:
-            # 使用简单的文件合并方式（适用于WAV格式）
-            with open(output_filepath, 'wb') as outfile:
-                for audio_file in audio_files:
-                    with open(audio_file, 'rb') as infile:
-                        # 跳过WAV文件头（除了第一个文件）
-                        if audio_file != audio_files[0]:
-                            # 跳过44字节的WAV文件头
-                            infile.seek(44)
-                        outfile.write(infile.read())
-            
+            concatenate_wav_files(audio_files, output_filepath)
             return output_filepath
         except Exception as e:
             raise Exception(f"音频文件合并失败: {str(e)}")
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+TTS结果缓存
+以（文本, 音色, 语速, 音量, 模型, 采样率, 格式）的哈希为键，将合成结果持久化到磁盘
+"""
+
+import os
+import re
+import json
+import uuid
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+# 默认语音参数，需与 SimpleTextToSpeechService.generate_audio_url 中的默认值保持一致
+_SETTING_DEFAULTS = {
+    'voice': 'Ethan',
+    'speed': 1.0,
+    'volume': 0,
+    'model': 'qwen-tts-latest',
+    'sample_rate': 16000,
+    'format': 'wav'
+}
+
+def normalize_text(text: str) -> str:
+    """规范化文本：合并连续空白并去除首尾空白"""
+    return re.sub(r'\s+', ' ', text or '').strip()
+
+def normalize_settings(settings: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """规范化语音设置，只保留影响合成结果的字段"""
+    settings = settings or {}
+    normalized = {}
+    for name, default in _SETTING_DEFAULTS.items():
+        value = settings.get(name, default)
+        if value is None:
+            value = default
+        if name in ('speed', 'volume'):
+            value = float(value)
+        elif name == 'sample_rate':
+            value = int(value)
+        else:
+            value = str(value).strip()
+        normalized[name] = value
+    return normalized
+
+def make_cache_key(text: str, settings: Optional[Dict[str, Any]]) -> str:
+    """计算缓存键"""
+    payload = json.dumps({
+        'text': normalize_text(text),
+        'settings': normalize_settings(settings)
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class TTSCache:
+    """磁盘TTS缓存（按总大小进行LRU淘汰）"""
+    
+    def __init__(self, cache_folder: str, max_bytes: int):
+        self.cache_folder = cache_folder
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, int]' = OrderedDict()  # key -> 文件大小，按最近使用排序
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        os.makedirs(self.cache_folder, exist_ok=True)
+        self._load_entries()
+    
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_folder, key[:2], f"{key}.wav")
+    
+    def _load_entries(self):
+        """启动时扫描缓存目录，按修改时间恢复LRU顺序"""
+        found = []
+        for subdir in os.listdir(self.cache_folder):
+            subdir_path = os.path.join(self.cache_folder, subdir)
+            if not os.path.isdir(subdir_path):
+                continue
+            for filename in os.listdir(subdir_path):
+                if not filename.endswith('.wav'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(subdir_path, filename))
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, filename[:-4], stat.st_size))
+        
+        found.sort()
+        for _, key, size in found:
+            self._entries[key] = size
+            self._total_bytes += size
+    
+    def fetch(self, key: str, dest_path: str) -> bool:
+        """命中时将缓存内容复制到 dest_path 并返回 True"""
+        entry_path = self._entry_path(key)
+        with self._lock:
+            known = key in self._entries
+        
+        if known:
+            try:
+                shutil.copyfile(entry_path, dest_path)
+                os.utime(entry_path, None)
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                    self.hits += 1
+                return True
+            except OSError:
+                # 文件已被其他进程淘汰
+                with self._lock:
+                    size = self._entries.pop(key, None)
+                    if size is not None:
+                        self._total_bytes -= size
+        
+        with self._lock:
+            self.misses += 1
+        return False
+    
+    def contains(self, key: str) -> bool:
+        """判断缓存中是否存在指定键"""
+        with self._lock:
+            return key in self._entries
+    
+    def store(self, key: str, src_path: str):
+        """将 src_path 的内容存入缓存"""
+        if self.max_bytes <= 0:
+            return
+        
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        temp_path = f"{entry_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            shutil.copyfile(src_path, temp_path)
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, entry_path)
+        except OSError as e:
+            print(f"写入TTS缓存失败: {str(e)}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+        
+        with self._lock:
+            old_size = self._entries.pop(key, None)
+            if old_size is not None:
+                self._total_bytes -= old_size
+            self._entries[key] = size
+            self._total_bytes += size
+            self._evict_locked()
+    
+    def _evict_locked(self):
+        """淘汰最久未使用的条目直到总大小不超过上限（需持有锁）"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._entry_path(key))
+            except OSError:
+                pass
+    
+    def purge(self) -> Dict:
+        """清空缓存"""
+        with self._lock:
+            removed_count = len(self._entries)
+            removed_bytes = self._total_bytes
+            for key in list(self._entries.keys()):
+                try:
+                    os.remove(self._entry_path(key))
+                except OSError:
+                    pass
+            self._entries.clear()
+            self._total_bytes = 0
+        
+        return {
+            'removed_entries': removed_count,
+            'removed_bytes': removed_bytes
+        }
+    
+    def get_stats(self) -> Dict:
+        """获取缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'total_bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+# 进程内共享的缓存实例
+_tts_cache: Optional[TTSCache] = None
+_tts_cache_lock = threading.Lock()
+
+def get_tts_cache(app) -> Optional[TTSCache]:
+    """获取进程内共享的TTS缓存实例，未启用时返回 None"""
+    global _tts_cache
+    if not app.config.get('TTS_CACHE_ENABLED', True):
+        return None
+    if _tts_cache is None:
+        with _tts_cache_lock:
+            if _tts_cache is None:
+                _tts_cache = TTSCache(
+                    app.config['TTS_CACHE_FOLDER'],
+                    app.config.get('TTS_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024)
+                )
+    return _tts_cache
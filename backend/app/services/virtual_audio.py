@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+虚拟合并音频
+合并时只记录各章节音频的数据偏移与长度，下载时即时生成WAV文件头并按字节范围映射到章节文件
+"""
+
+import os
+import json
+import uuid
+from typing import Dict, Iterator, List, Optional, Tuple
+from flask import Response
+from app.utils.wav_utils import WAV_HEADER_SIZE, build_wav_header, read_wav_info
+
+# 虚拟合并清单的文件后缀（清单名为合并音频文件名加此后缀）
+VIRTUAL_MERGE_SUFFIX = '.vmerge'
+
+# 读取章节文件时每次读取的块大小
+STREAM_BLOCK_SIZE = 256 * 1024
+
+class VirtualMergeStaleError(Exception):
+    """虚拟合并所引用的章节音频已被删除或修改"""
+    pass
+
+def write_virtual_merge(input_paths: List[str], manifest_path: str) -> Dict:
+    """写入虚拟合并清单（只读取各文件头），返回合并信息"""
+    if not input_paths:
+        raise Exception('没有音频文件可合并')
+    
+    infos = [read_wav_info(path) for path in input_paths]
+    first = infos[0]
+    for info in infos[1:]:
+        if not info.same_format(first):
+            raise Exception(
+                f"音频参数不一致: {info.path} ({info.describe()}) "
+                f"vs 预期 ({first.describe()}). 请先转码为相同格式后再合并。"
+            )
+    
+    data_size = sum(info.data_size for info in infos)
+    # 提前校验总长度是否超出WAV格式上限
+    build_wav_header(first.channels, first.sample_width, first.frame_rate, data_size)
+    
+    manifest = {
+        'channels': first.channels,
+        'sample_width': first.sample_width,
+        'frame_rate': first.frame_rate,
+        'data_size': data_size,
+        'duration': round(sum(info.duration for info in infos), 3),
+        'segments': [
+            {
+                'filename': os.path.basename(info.path),
+                'file_size': os.path.getsize(info.path),
+                'data_offset': info.data_offset,
+                'data_size': info.data_size
+            }
+            for info in infos
+        ]
+    }
+    
+    temp_path = f"{manifest_path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(temp_path, manifest_path)
+    return manifest
+
+class VirtualWav:
+    """由虚拟合并清单描述的WAV文件"""
+    
+    def __init__(self, manifest_path: str):
+        self.folder = os.path.dirname(manifest_path)
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        
+        self.header = build_wav_header(
+            self.manifest['channels'],
+            self.manifest['sample_width'],
+            self.manifest['frame_rate'],
+            self.manifest['data_size']
+        )
+        self.segments = self.manifest['segments']
+        self.size = WAV_HEADER_SIZE + self.manifest['data_size']
+    
+    def validate(self):
+        """确认引用的章节音频仍存在且未被修改，否则抛出 VirtualMergeStaleError"""
+        for segment in self.segments:
+            path = os.path.join(self.folder, segment['filename'])
+            if not os.path.exists(path):
+                raise VirtualMergeStaleError(f"合并所引用的章节音频已被删除: {segment['filename']}")
+            if os.path.getsize(path) != segment['file_size']:
+                raise VirtualMergeStaleError(f"合并所引用的章节音频已被修改: {segment['filename']}")
+    
+    def iter_range(self, start: int, end: int) -> Iterator[bytes]:
+        """按块产出 [start, end) 范围内的字节"""
+        if start < WAV_HEADER_SIZE:
+            yield self.header[start:min(end, WAV_HEADER_SIZE)]
+        
+        # 当前章节数据在虚拟文件中的起始位置
+        position = WAV_HEADER_SIZE
+        for segment in self.segments:
+            segment_start = position
+            segment_end = position + segment['data_size']
+            position = segment_end
+            if segment_end <= start:
+                continue
+            if segment_start >= end:
+                break
+            
+            offset = max(start, segment_start) - segment_start
+            remaining = min(end, segment_end) - max(start, segment_start)
+            with open(os.path.join(self.folder, segment['filename']), 'rb') as f:
+                f.seek(segment['data_offset'] + offset)
+                while remaining > 0:
+                    block = f.read(min(STREAM_BLOCK_SIZE, remaining))
+                    if not block:
+                        raise Exception(f"章节音频数据不完整: {segment['filename']}")
+                    remaining -= len(block)
+                    yield block
+
+def open_virtual_merge(audio_folder: str, filename: str) -> Optional[VirtualWav]:
+    """按合并音频文件名打开虚拟合并，不存在时返回 None"""
+    manifest_name = f"{filename}{VIRTUAL_MERGE_SUFFIX}"
+    if os.path.basename(manifest_name) != manifest_name:
+        return None
+    manifest_path = os.path.join(audio_folder, manifest_name)
+    if not os.path.isfile(manifest_path):
+        return None
+    return VirtualWav(manifest_path)
+
+def send_virtual_audio(virtual_wav: VirtualWav, range_header, filename: str,
+                       as_attachment: bool = False) -> Response:
+    """响应虚拟合并音频的下载请求，支持单段 Range 请求以便播放器拖动进度"""
+    virtual_wav.validate()
+    
+    start, end, status = 0, virtual_wav.size, 200
+    # 多段 Range 请求按完整文件返回
+    if range_header is not None and len(range_header.ranges) == 1:
+        byte_range = range_header.range_for_length(virtual_wav.size)
+        if byte_range is None:
+            return Response(status=416, headers={'Content-Range': f"bytes */{virtual_wav.size}"})
+        start, end = byte_range
+        status = 206
+    
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Content-Length': str(end - start)
+    }
+    if status == 206:
+        headers['Content-Range'] = f"bytes {start}-{end - 1}/{virtual_wav.size}"
+    if as_attachment:
+        headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    
+    return Response(
+        virtual_wav.iter_range(start, end),
+        status=status,
+        mimetype='audio/wav',
+        headers=headers,
+        direct_passthrough=True
+    )
+
+def parse_virtual_name(entry: str) -> Tuple[str, bool]:
+    """将目录项解析为（合并音频文件名, 是否为虚拟合并）"""
+    if entry.endswith(VIRTUAL_MERGE_SUFFIX):
+        return entry[:-len(VIRTUAL_MERGE_SUFFIX)], True
+    return entry, False
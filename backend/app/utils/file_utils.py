@@ -99,7 +99,10 @@ def delete_file_and_related_audio(file_id: str, upload_folder: str, audio_folder
             # 删除子文件夹中的所有文件
             for filename in os.listdir(file_audio_folder):
                 audio_path = os.path.join(file_audio_folder, filename)
-                if os.path.exists(audio_path):
+                if os.path.isdir(audio_path):
+                    # 分段生成的工作目录等
+                    shutil.rmtree(audio_path, ignore_errors=True)
+                elif os.path.exists(audio_path):
                     os.remove(audio_path)
                     deleted_files.append(f"音频文件: {file_id}/{filename}")
             
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+WAV文件工具
+只解析RIFF文件头，PCM数据按块复制（优先使用内核态复制），内存占用与文件大小无关
+"""
+
+import os
+import struct
+import uuid
+from typing import Dict, List
+
+# 用户态复制时每次读取的块大小
+COPY_BLOCK_SIZE = 1024 * 1024
+
+# 标准PCM文件头长度（RIFF + fmt + data）
+WAV_HEADER_SIZE = 44
+
+# RIFF 大小字段为32位，数据部分不能超过该上限
+MAX_WAV_DATA_SIZE = 0xFFFFFFFF - (WAV_HEADER_SIZE - 8)
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+class WavInfo:
+    """WAV文件头信息"""
+    
+    def __init__(self, path: str, audio_format: int, channels: int, sample_width: int,
+                 frame_rate: int, data_offset: int, data_size: int):
+        self.path = path
+        self.audio_format = audio_format
+        self.channels = channels
+        self.sample_width = sample_width
+        self.frame_rate = frame_rate
+        self.data_offset = data_offset
+        self.data_size = data_size
+    
+    @property
+    def block_align(self) -> int:
+        return self.channels * self.sample_width
+    
+    @property
+    def frame_count(self) -> int:
+        return self.data_size // self.block_align if self.block_align else 0
+    
+    @property
+    def duration(self) -> float:
+        return self.frame_count / self.frame_rate if self.frame_rate else 0.0
+    
+    def same_format(self, other: 'WavInfo') -> bool:
+        return (self.channels, self.sample_width, self.frame_rate) == \
+            (other.channels, other.sample_width, other.frame_rate)
+    
+    def describe(self) -> str:
+        return f"channels={self.channels}, sampwidth={self.sample_width}, framerate={self.frame_rate}"
+
+def read_wav_info(path: str) -> WavInfo:
+    """解析WAV文件头，定位 fmt 与 data 块（跳过 LIST 等其他块）
+    
+    流式生成的WAV常把 data 块大小写成 0 或 0xFFFFFFFF，此时按文件实际长度计算。
+    """
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+            raise Exception(f"不是有效的WAV文件: {path}")
+        
+        fmt = None
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                raise Exception(f"WAV文件缺少 data 块: {path}")
+            chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+            
+            if chunk_id == b'fmt ':
+                fmt_data = f.read(chunk_size)
+                if len(fmt_data) < 16:
+                    raise Exception(f"WAV文件 fmt 块不完整: {path}")
+                fmt = struct.unpack('<HHIIHH', fmt_data[:16])
+                f.seek(chunk_size & 1, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise Exception(f"WAV文件 data 块位于 fmt 块之前: {path}")
+                data_offset = f.tell()
+                available = file_size - data_offset
+                if chunk_size == 0 or chunk_size > available:
+                    chunk_size = available
+                break
+            else:
+                # 块大小为奇数时有一个填充字节
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+    
+    audio_format, channels, frame_rate, _, _, bits_per_sample = fmt
+    if audio_format not in (WAVE_FORMAT_PCM, WAVE_FORMAT_EXTENSIBLE):
+        raise Exception(f"仅支持未压缩 PCM WAV，检测到格式代码 {audio_format}: {path}")
+    
+    info = WavInfo(path, audio_format, channels, (bits_per_sample + 7) // 8, frame_rate, data_offset, chunk_size)
+    # 截掉不足一帧的尾部数据
+    if info.block_align:
+        info.data_size -= info.data_size % info.block_align
+    return info
+
+def build_wav_header(channels: int, sample_width: int, frame_rate: int, data_size: int) -> bytes:
+    """生成标准PCM文件头"""
+    if data_size > MAX_WAV_DATA_SIZE:
+        raise Exception('音频数据超过WAV格式4GB上限')
+    block_align = channels * sample_width
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', WAV_HEADER_SIZE - 8 + data_size, b'WAVE',
+        b'fmt ', 16, WAVE_FORMAT_PCM, channels, frame_rate,
+        frame_rate * block_align, block_align, sample_width * 8,
+        b'data', data_size
+    )
+
+def copy_range(src_fd: int, dst_fd: int, src_offset: int, dst_offset: int, length: int):
+    """将源文件的一段字节复制到目标文件的指定位置
+    
+    依次尝试 copy_file_range、sendfile（数据不经过用户态），均不可用时按块读写。
+    """
+    copied = 0
+    
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while copied < length:
+                n = os.copy_file_range(src_fd, dst_fd, length - copied, src_offset + copied, dst_offset + copied)
+                if n == 0:
+                    break
+                copied += n
+        except OSError:
+            # 跨文件系统或内核不支持时退回其他方式
+            pass
+    
+    if copied < length and hasattr(os, 'sendfile'):
+        try:
+            os.lseek(dst_fd, dst_offset + copied, os.SEEK_SET)
+            while copied < length:
+                n = os.sendfile(dst_fd, src_fd, src_offset + copied, length - copied)
+                if n == 0:
+                    break
+                copied += n
+        except OSError:
+            pass
+    
+    if copied < length:
+        os.lseek(src_fd, src_offset + copied, os.SEEK_SET)
+        os.lseek(dst_fd, dst_offset + copied, os.SEEK_SET)
+        while copied < length:
+            block = os.read(src_fd, min(COPY_BLOCK_SIZE, length - copied))
+            if not block:
+                break
+            os.write(dst_fd, block)
+            copied += len(block)
+    
+    if copied < length:
+        raise Exception('源文件数据不完整，复制中断')
+
+def concatenate_wav_files(input_paths: List[str], output_path: str) -> Dict:
+    """按顺序拼接多个PCM WAV文件
+    
+    先只读取各文件头校验参数并计算总长度，写入一次正确的文件头后逐个复制数据块。
+    输出先写入临时文件，完成后原子替换。
+    """
+    if not input_paths:
+        raise Exception('没有音频文件可合并')
+    
+    infos = [read_wav_info(path) for path in input_paths]
+    first = infos[0]
+    for info in infos[1:]:
+        if not info.same_format(first):
+            raise Exception(
+                f"音频参数不一致: {info.path} ({info.describe()}) "
+                f"vs 预期 ({first.describe()}). 请先转码为相同格式后再合并。"
+            )
+    
+    total_size = sum(info.data_size for info in infos)
+    header = build_wav_header(first.channels, first.sample_width, first.frame_rate, total_size)
+    
+    temp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temp_path, 'wb') as output:
+            output.write(header)
+            output.flush()
+            dst_offset = len(header)
+            for info in infos:
+                with open(info.path, 'rb') as source:
+                    copy_range(source.fileno(), output.fileno(), info.data_offset, dst_offset, info.data_size)
+                dst_offset += info.data_size
+        os.replace(temp_path, output_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+        raise
+    
+    return {
+        'channels': first.channels,
+        'sample_width': first.sample_width,
+        'frame_rate': first.frame_rate,
+        'data_size': total_size,
+        'duration': round(sum(info.duration for info in infos), 3)
+    }
@@ -201,7 +201,7 @@ class AudioFilesManager {
             
             // 加载文档信息
             console.log('正在加载文档信息...');
-            const response = await fetch(`${CONFIG.API_BASE_URL}/load-document/${fileId}`);
+            const response = await fetch(`${CONFIG.API_BASE_URL}/load-document/${fileId}?view=summary`);
             console.log('文档加载响应状态:', response.status);
             
             if (response.ok) {
@@ -53,9 +53,9 @@ class AudioGenerator {
 
             const result = await response.json();
             
-            // 开始轮询进度
+            // 开始跟踪进度
             if (result.task_id) {
-                await AudioProgressTracker.pollProgress(result.task_id);
+                await AudioProgressTracker.trackProgress(result.task_id);
             }
 
             // 更新章节状态
@@ -1,5 +1,72 @@
 // 音频进度跟踪模块
 class AudioProgressTracker {
+    // 跟踪进度：优先使用 SSE 推送，不支持或连接失败时退回轮询
+    static async trackProgress(taskId) {
+        if (typeof EventSource === 'undefined') {
+            return this.pollProgress(taskId);
+        }
+        
+        try {
+            await this.streamProgress(taskId);
+        } catch (error) {
+            if (error.fallbackToPolling) {
+                console.warn('🔍 进度推送不可用，改为轮询:', error.message);
+                return this.pollProgress(taskId);
+            }
+            throw error;
+        }
+    }
+    
+    // 通过 Server-Sent Events 接收进度（断线后浏览器会携带 Last-Event-ID 自动重连）
+    static streamProgress(taskId) {
+        return new Promise((resolve, reject) => {
+            const source = new EventSource(`${CONFIG.API_BASE_URL}/progress-stream/${taskId}`);
+            
+            console.log('🔍 开始接收进度推送，任务ID:', taskId);
+            
+            const handleState = (event) => {
+                const progressData = JSON.parse(event.data);
+                AudioProgressUI.updateProgress(progressData.progress, progressData.message);
+            };
+            
+            source.addEventListener('snapshot', handleState);
+            source.addEventListener('progress', handleState);
+            
+            source.addEventListener('chunk', (event) => {
+                const chunk = JSON.parse(event.data);
+                console.log(`🔍 第 ${chunk.chapter_index + 1} 章节已完成 ${chunk.chunk_index + 1}/${chunk.total_chunks} 段: ${chunk.chunk_file}`);
+            });
+            
+            source.addEventListener('chapter', (event) => {
+                const chapter = JSON.parse(event.data);
+                console.log('🔍 章节音频生成完成:', chapter.audio_file);
+            });
+            
+            source.addEventListener('completed', () => {
+                source.close();
+                console.log('🔍 音频生成完成！');
+                AudioProgressUI.updateProgress(100, '音频生成完成！');
+                resolve();
+            });
+            
+            source.addEventListener('failed', (event) => {
+                source.close();
+                const progressData = JSON.parse(event.data);
+                console.error('🔍 音频生成出错:', progressData.message);
+                reject(new Error(progressData.message));
+            });
+            
+            source.onerror = () => {
+                // 连接中断时浏览器会自动重连；只有连接被彻底关闭时才退回轮询
+                if (source.readyState === EventSource.CLOSED) {
+                    const error = new Error('进度推送连接已关闭');
+                    error.fallbackToPolling = true;
+                    reject(error);
+                }
+            };
+        });
+    }
+    
     // 轮询进度
     static async pollProgress(taskId) {
         const maxAttempts = 300; // 最多轮询5分钟
@@ -106,7 +106,7 @@ class DocumentHistory {
         try {
             Utils.showStatus('正在加载文档...', 'info');
             
-            const response = await fetch(`${CONFIG.API_BASE_URL}/load-document/${fileId}`);
+            const response = await fetch(`${CONFIG.API_BASE_URL}/load-document/${fileId}?view=summary`);
             
             if (!response.ok) {
                 throw new Error(`加载文档失败: ${response.status}`);
@@ -160,7 +160,7 @@ class DocumentHistory {
         try {
             Utils.showStatus('正在加载文档...', 'info');
             
-            const response = await fetch(`${CONFIG.API_BASE_URL}/load-document/${fileId}`);
+            const response = await fetch(`${CONFIG.API_BASE_URL}/load-document/${fileId}?view=summary`);
             
             if (!response.ok) {
                 throw new Error(`加载文档失败: ${response.status}`);
@@ -207,7 +207,7 @@ class DocumentHistory {
         try {
             Utils.showStatus('正在加载文档...', 'info');
             
-            const response = await fetch(`${CONFIG.API_BASE_URL}/load-document/${fileId}`);
+            const response = await fetch(`${CONFIG.API_BASE_URL}/load-document/${fileId}?view=summary`);
             
             if (!response.ok) {
                 throw new Error(`加载文档失败: ${response.status}`);
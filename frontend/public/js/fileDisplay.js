@@ -49,7 +49,7 @@ class FileDisplay {
                                 </td>
                                 <td class="chapter-index">${index + 1}</td>
                                 <td class="chapter-title" title="${chapter.title}">${truncatedTitle}</td>
-                                <td class="chapter-length">${chapter.content.length} 字符</td>
+                                <td class="chapter-length">${Utils.getChapterLength(chapter)} 字符</td>
                                 <td>
                                     <span class="status-badge status-text-extracted">已提取</span>
                                 </td>
@@ -90,13 +90,19 @@ class FileDisplay {
     }
 
     // 查看章节内容
-    static viewChapterContent(chapterIndex) {
+    static async viewChapterContent(chapterIndex) {
         if (!currentChapters || chapterIndex >= currentChapters.length) {
             Utils.showStatus('章节数据不存在', 'error');
             return;
         }
 
         const chapter = currentChapters[chapterIndex];
+        try {
+            await Utils.loadChapterContent(chapterIndex);
+        } catch (error) {
+            Utils.showStatus(error.message, 'error');
+            return;
+        }
         
         // 创建模态对话框
         const modalHTML = `
@@ -151,7 +151,21 @@ class FileUpload {
                 throw new Error(`上传失败: ${response.status} - ${errorText}`);
             }
             
-            const result = await response.json();
+            const uploadResult = await response.json();
+            
+            if (uploadResult.error) {
+                throw new Error(uploadResult.error);
+            }
+            
+            // 文档在后台解析，等待解析完成后再读取章节
+            Utils.showStatus(uploadResult.message, 'info');
+            const status = await FileUpload.waitForIngestion(uploadResult.file_id);
+            
+            const documentResponse = await fetch(`${CONFIG.API_BASE_URL}/load-document/${uploadResult.file_id}?view=summary`);
+            if (!documentResponse.ok) {
+                throw new Error(`读取文档失败: ${documentResponse.status}`);
+            }
+            const result = await documentResponse.json();
             
             if (result.error) {
                 throw new Error(result.error);
@@ -166,11 +180,7 @@ class FileUpload {
             FileDisplay.displayChapters(result.chapters);
             
             // 显示文本转换状态
-            if (result.text_extraction_success) {
-                Utils.showStatus(result.message, 'success');
-            } else {
-                Utils.showStatus('文件上传成功，但文本转换可能有问题', 'warning');
-            }
+            Utils.showStatus(status.message, 'success');
             
             // 显示后续选项 - 这些会在切换到音频管理板块时自动显示
             // 不需要手动设置display属性
@@ -226,6 +236,32 @@ class FileUpload {
         }
     }
 
+    // 轮询文档解析状态，解析完成时返回状态，解析失败时抛出错误
+    static async waitForIngestion(fileId) {
+        const maxAttempts = 600; // 最多等待10分钟
+        
+        for (let attempts = 0; attempts < maxAttempts; attempts++) {
+            const response = await fetch(`${CONFIG.API_BASE_URL}/upload-status/${fileId}`);
+            
+            if (response.ok) {
+                const status = await response.json();
+                
+                if (status.status === 'completed') {
+                    return status;
+                } else if (status.status === 'error') {
+                    throw new Error(status.message);
+                }
+            } else {
+                console.error('查询解析状态失败:', response.status, response.statusText);
+            }
+            
+            // 等待1秒后继续轮询
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+        
+        throw new Error('文档解析超时');
+    }
+
     // 删除当前文件
     static async deleteCurrentFile() {
         if (!currentFileId) {
@@ -71,7 +71,7 @@ class ChaptersAudioModule {
                     <div class="chapter-audio-content">
                         <div class="chapter-audio-info">
                             <span class="info-label">文本长度:</span>
-                            <span class="info-value">${chapter.content.length} 字符</span>
+                            <span class="info-value">${Utils.getChapterLength(chapter)} 字符</span>
                         </div>
                         <div class="chapter-audio-actions">
                             ${hasAudio ? `
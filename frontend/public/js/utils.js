@@ -95,4 +95,26 @@ class Utils {
             fileInput.value = '';
         }
     }
+
+    // 章节字符数（章节摘要只有 char_count，不含正文）
+    static getChapterLength(chapter) {
+        return chapter.char_count !== undefined ? chapter.char_count : chapter.content.length;
+    }
+
+    // 读取章节正文（首次查看时从服务器获取并缓存到章节对象上）
+    static async loadChapterContent(chapterIndex) {
+        const chapter = currentChapters[chapterIndex];
+        if (chapter.content !== undefined) {
+            return chapter.content;
+        }
+        
+        const response = await fetch(`${CONFIG.API_BASE_URL}/document-chapters/${currentFileId}/${chapterIndex}`);
+        const result = await response.json();
+        if (!response.ok || result.error) {
+            throw new Error(result.error || `读取章节内容失败: ${response.status}`);
+        }
+        
+        chapter.content = result.content;
+        return chapter.content;
+    }
 }